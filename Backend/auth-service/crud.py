@@ -3,7 +3,9 @@ import random
 
 import models
 import schemas
+from export_stream import EXPORT_BATCH_SIZE
 from passlib.context import CryptContext
+from sqlalchemy import Integer, column, func, update, values
 from sqlalchemy.orm import Session
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -25,14 +27,70 @@ def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100, include_deleted: bool = False):
-    """Get all users with pagination (excluding deleted by default)"""
+def get_users(db: Session, skip: int = 0, limit: int = 100, include_deleted: bool = False,
+              role: str = None, after_id: int = None):
+    """
+    Get all users with pagination (excluding deleted by default), optionally
+    only one role. With after_id, pages by id (keyset) instead of offset.
+    """
     query = db.query(models.User)
     if not include_deleted:
         query = query.filter(models.User.deleted_at == None)
+    if role:
+        query = query.filter(func.upper(models.User.role) == role.upper())
+    if after_id is not None:
+        return query.filter(models.User.id > after_id).order_by(models.User.id).limit(limit).all()
     return query.offset(skip).limit(limit).all()
 
 
+def _filter_delivery_users(query, roles: list = None, status: str = None,
+                           is_verified: bool = None, city: str = None, language: str = None,
+                           after_id: int = 0):
+    """Non-deleted users matching the delivery filters, after `after_id`"""
+    query = query.filter(
+        models.User.deleted_at == None,
+        models.User.id > after_id
+    )
+    if roles:
+        query = query.filter(func.upper(models.User.role).in_([r.upper() for r in roles]))
+    if status:
+        query = query.filter(models.User.status == status.upper())
+    if is_verified is not None:
+        query = query.filter(models.User.is_verified == is_verified)
+    if city:
+        query = query.filter(models.User.city == city)
+    if language:
+        query = query.filter(models.User.language == language)
+    return query
+
+
+def iter_user_delivery_rows(db: Session, roles: list = None, status: str = None,
+                            is_verified: bool = None, city: str = None, language: str = None,
+                            after_id: int = 0, limit: int = 10000):
+    """
+    Stream (id, language, role, city) of non-deleted users matching the
+    filters, ordered by id after `after_id` (keyset page of `limit` rows)
+    """
+    query = _filter_delivery_users(
+        db.query(models.User.id, models.User.language, models.User.role, models.User.city),
+        roles=roles, status=status, is_verified=is_verified, city=city, language=language,
+        after_id=after_id
+    )
+    return query.order_by(models.User.id).limit(limit).yield_per(EXPORT_BATCH_SIZE)
+
+
+def count_user_delivery_rows(db: Session, roles: list = None, status: str = None,
+                             is_verified: bool = None, city: str = None, language: str = None,
+                             after_id: int = 0) -> int:
+    """Number of users iter_user_delivery_rows would stream after `after_id`"""
+    query = _filter_delivery_users(
+        db.query(func.count(models.User.id)),
+        roles=roles, status=status, is_verified=is_verified, city=city, language=language,
+        after_id=after_id
+    )
+    return query.scalar()
+
+
 def get_deleted_users(db: Session, skip: int = 0, limit: int = 100):
     """Get only deleted users (trash)"""
     return db.query(models.User).filter(
@@ -176,6 +234,23 @@ def update_user_total_points(db: Session, user_id: int, points_to_add: int):
     return None
 
 
+def bulk_update_user_total_points(db: Session, deltas: dict) -> int:
+    """Add points to many users' total_points in one UPDATE (never below 0)"""
+    if not deltas:
+        return 0
+    batch = values(
+        column("user_id", Integer), column("delta", Integer), name="deltas"
+    ).data(sorted(deltas.items()))
+    result = db.execute(
+        update(models.User)
+        .where(models.User.id == batch.c.user_id)
+        .values(total_points=func.greatest(0, func.coalesce(models.User.total_points, 0) + batch.c.delta))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
 def update_user_language(db: Session, user_id: int, language: str):
     """Update user's language preference"""
     user = get_user(db, user_id)
@@ -383,13 +458,30 @@ def create_audit_log(db: Session, action: str, user_id: int, user_email: str = N
     return log
 
 
-def get_audit_logs(db: Session, skip: int = 0, limit: int = 100,
-                   action: str = None, user_id: int = None):
-    """Get audit logs with optional filters"""
-    query = db.query(models.AuditLog)
+def _filter_audit_logs(query, action: str = None, user_id: int = None):
     if action:
         query = query.filter(models.AuditLog.action.ilike(f"%{action}%"))
     if user_id:
         query = query.filter(models.AuditLog.user_id == user_id)
+    return query
+
+
+def get_audit_logs(db: Session, skip: int = 0, limit: int = 100,
+                   action: str = None, user_id: int = None):
+    """Get audit logs with optional filters"""
+    query = _filter_audit_logs(db.query(models.AuditLog), action, user_id)
     return query.order_by(models.AuditLog.created_at.desc()).offset(skip).limit(limit).all()
 
+
+def iter_audit_logs(db: Session, action: str = None, user_id: int = None,
+                    since: datetime = None, until: datetime = None):
+    """Stream audit logs, newest first, through a server-side cursor"""
+    query = _filter_audit_logs(db.query(models.AuditLog), action, user_id)
+    if since:
+        query = query.filter(models.AuditLog.created_at >= since)
+    if until:
+        query = query.filter(models.AuditLog.created_at < until)
+    return query.order_by(
+        models.AuditLog.created_at.desc(), models.AuditLog.id.desc()
+    ).yield_per(EXPORT_BATCH_SIZE)
+
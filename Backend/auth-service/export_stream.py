@@ -0,0 +1,92 @@
+# export_stream.py - Incremental CSV / NDJSON / JSON encoders for Kashif streaming exports
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Rows buffered before a chunk is handed to the response
+EXPORT_CHUNK_ROWS = 500
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(item: dict) -> str:
+    return json.dumps(item, default=_json_default, ensure_ascii=False)
+
+
+def csv_chunks(header: List[str], rows: Iterable[list]) -> Iterator[str]:
+    """Header plus rows as CSV, EXPORT_CHUNK_ROWS rows per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(items: Iterable[dict]) -> Iterator[str]:
+    """One JSON object per line"""
+    lines = []
+    for item in items:
+        lines.append(_dumps(item) + "\n")
+        if len(lines) >= EXPORT_CHUNK_ROWS:
+            yield "".join(lines)
+            lines = []
+    yield "".join(lines)
+
+
+def json_array_chunks(items: Iterable[dict]) -> Iterator[str]:
+    """A single JSON array, written element by element"""
+    parts = ["["]
+    for i, item in enumerate(items):
+        parts.append(("," if i else "") + _dumps(item))
+        if len(parts) >= EXPORT_CHUNK_ROWS:
+            yield "".join(parts)
+            parts = []
+    parts.append("]")
+    yield "".join(parts)
+
+
+def stream_export(
+    session_factory: Callable,
+    fetch: Callable,
+    fmt: str,
+    header: List[str],
+    to_row: Callable,
+    to_item: Optional[Callable] = None
+) -> Iterator[str]:
+    """
+    Encode fetch(db) in `fmt` on a session owned by the generator, so the
+    server-side cursor stays open while the response streams (request-scoped
+    sessions are closed before the body is sent).
+    """
+    db = session_factory()
+    try:
+        records = fetch(db)
+        if fmt == "csv":
+            yield from csv_chunks(header, (to_row(r) for r in records))
+        else:
+            items = (to_item(r) if to_item else dict(zip(header, to_row(r))) for r in records)
+            yield from (ndjson_chunks(items) if fmt == "ndjson" else json_array_chunks(items))
+    finally:
+        db.close()
@@ -2,22 +2,25 @@ import logging
 import os
 import threading
 import uuid
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, Optional
 
 import auth
 import crud
 import httpx
 import models
 import schemas
-from database import engine, get_db
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, status
+from consumer_metrics import get_queue_stats, metrics
+from database import SessionLocal, engine, get_db
+from export_stream import EXPORT_MEDIA_TYPES, stream_export
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Query, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from json_logger import setup_logging
 from logging_middleware import RequestLoggingMiddleware
-from rabbitmq_consumer import start_consumer
+from rabbitmq_consumer import QUEUE_NAME, start_consumer
 from rabbitmq_publisher import publish_event
 from sqlalchemy import text
 from sqlalchemy.orm import Session
@@ -201,6 +204,41 @@ def get_audit_logs(
     return crud.get_audit_logs(db, skip=skip, limit=limit, action=action, user_id=user_id)
 
 
+AUDIT_LOG_EXPORT_COLUMNS = [
+    "id", "action", "user_id", "user_email", "target_type",
+    "target_id", "details", "ip_address", "created_at"
+]
+
+
+@app.get("/audit-logs/export")
+def export_audit_logs(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    action: str = None,
+    user_id: int = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """Export audit logs as CSV or NDJSON, streamed row by row - Admin only"""
+    current_user = auth.get_current_user(token, db)
+    require_admin(current_user)
+    body = stream_export(
+        SessionLocal,
+        lambda export_db: crud.iter_audit_logs(
+            export_db, action=action, user_id=user_id, since=since, until=until
+        ),
+        format,
+        AUDIT_LOG_EXPORT_COLUMNS,
+        lambda entry: [getattr(entry, column) for column in AUDIT_LOG_EXPORT_COLUMNS],
+    )
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=audit_logs_export.{format}"}
+    )
+
+
 # Terms of Service Endpoints
 
 @app.get("/tos/current", response_model=schemas.TermsOfService)
@@ -999,13 +1037,16 @@ def get_all_users(
     skip: int = 0,
     limit: int = 100,
     include_deleted: bool = False,
+    role: str = None,
+    after_id: int = None,
     db: Session = Depends(get_db)
 ):
-    """Get all users - Admin, Moderator, Viewer"""
+    """Get all users - Admin, Moderator, Viewer. Pass after_id (last id seen) to page by id."""
     current_user = auth.get_current_user(token, db)
     require_viewer(current_user)
     
-    users = crud.get_users(db, skip=skip, limit=limit, include_deleted=include_deleted)
+    users = crud.get_users(db, skip=skip, limit=limit, include_deleted=include_deleted,
+                           role=role, after_id=after_id)
     return users
 
 
@@ -1692,6 +1733,63 @@ async def upload_file(
     }
 
 
+def verify_internal_key(x_internal_key: str = Header(None)):
+    """Verify internal API key for service-to-service calls"""
+    if x_internal_key != INTERNAL_API_KEY:
+        raise HTTPException(status_code=403, detail="Invalid internal API key")
+
+
+USER_DELIVERY_COLUMNS = ["id", "language", "role", "city"]
+
+
+@app.get("/internal/user-ids")
+def stream_user_ids(
+    role: Optional[list[str]] = Query(None),
+    user_status: Optional[str] = Query("ACTIVE", alias="status"),
+    is_verified: Optional[bool] = None,
+    city: Optional[str] = None,
+    language: Optional[str] = None,
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(10000, ge=1, le=100000),
+    _: None = Depends(verify_internal_key)
+):
+    """
+    Ids plus delivery fields of users matching the filters, as one NDJSON line
+    per user ordered by id. Pages are keyset based: pass the last id seen as
+    after_id; a page shorter than `limit` is the last one.
+    """
+    body = stream_export(
+        SessionLocal,
+        lambda export_db: crud.iter_user_delivery_rows(
+            export_db, roles=role, status=user_status, is_verified=is_verified,
+            city=city, language=language, after_id=after_id, limit=limit
+        ),
+        "ndjson",
+        USER_DELIVERY_COLUMNS,
+        list,
+    )
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES["ndjson"])
+
+
+@app.get("/internal/user-ids/count")
+def count_user_ids(
+    role: Optional[list[str]] = Query(None),
+    user_status: Optional[str] = Query("ACTIVE", alias="status"),
+    is_verified: Optional[bool] = None,
+    city: Optional[str] = None,
+    language: Optional[str] = None,
+    after_id: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_internal_key)
+):
+    """Number of users /internal/user-ids would stream for the same filters"""
+    count = crud.count_user_delivery_rows(
+        db, roles=role, status=user_status, is_verified=is_verified,
+        city=city, language=language, after_id=after_id
+    )
+    return {"count": count}
+
+
 # These endpoints are for internal microservice communication only
 # They should be protected by network isolation in production
 
@@ -1715,6 +1813,60 @@ def get_user_internal(
     return user
 
 
+@app.get("/internal/metrics")
+def get_consumer_metrics(_: None = Depends(verify_internal_key)):
+    """RabbitMQ consumer metrics of this worker plus the broker-side queue depth"""
+    return {
+        "service": "auth",
+        "queue": get_queue_stats(QUEUE_NAME),
+        "consumer": metrics.snapshot(),
+    }
+
+
+def _call_service_metrics(service_url: str) -> dict:
+    """Call a service's internal consumer metrics endpoint"""
+    try:
+        with httpx.Client(timeout=10.0) as client:
+            response = client.get(
+                f"{service_url}/internal/metrics",
+                headers={"X-Internal-Key": INTERNAL_API_KEY}
+            )
+            if response.status_code == 200:
+                return response.json()
+            logger.error(f"Service {service_url} returned {response.status_code} for metrics")
+            return {"service": service_url, "error": f"HTTP {response.status_code}"}
+    except Exception as e:
+        logger.error(f"Failed to call {service_url} for metrics: {e}")
+        return {"service": service_url, "error": str(e)}
+
+
+@app.get("/internal/broker-stats")
+def get_broker_stats(_: None = Depends(verify_internal_key)):
+    """
+    Aggregated broker view: queue depth, consumer counts and per-event
+    consumed/acked/nacked, latency and lag for every service queue.
+    Each service reports the worker that answered the request.
+    """
+    services = {"auth": get_consumer_metrics()}
+    for name, url in (
+        ("reporting", REPORTING_SERVICE_URL),
+        ("gamification", GAMIFICATION_SERVICE_URL),
+        ("coupons", COUPONS_SERVICE_URL),
+        ("notification", NOTIFICATION_SERVICE_URL),
+    ):
+        services[name] = _call_service_metrics(url)
+
+    totals = {"messages_ready": 0, "consumed": 0, "acked": 0, "nacked": 0, "in_flight": 0}
+    for data in services.values():
+        totals["messages_ready"] += (data.get("queue") or {}).get("messages_ready", 0)
+        consumer = data.get("consumer") or {}
+        totals["in_flight"] += consumer.get("in_flight", 0)
+        for key in ("consumed", "acked", "nacked"):
+            totals[key] += (consumer.get("totals") or {}).get(key, 0)
+
+    return {"totals": totals, "services": services}
+
+
 # DSGVO / GDPR — User Self-Service Endpoints
 
 def _call_service_delete(service_url: str, user_id: int) -> dict:
@@ -0,0 +1,6 @@
+-- Migration: Index for role-filtered user id paging (/internal/user-ids)
+-- Date: 2026-10-19
+
+CREATE INDEX IF NOT EXISTS ix_users_role_status_id
+ON users (upper(role), status, id)
+WHERE deleted_at IS NULL;
@@ -92,6 +92,39 @@ class TestAuthService:
         response = client.post("/token", data=login_data)
         assert response.status_code == 401
 
+    def test_broker_stats_requires_internal_key(self):
+        """Test aggregated broker stats are not publicly accessible"""
+        response = client.get("/internal/broker-stats")
+        assert response.status_code == 403
+
+    def test_user_ids_stream(self):
+        """Test the internal user id stream requires the internal key and returns NDJSON"""
+        response = client.get("/internal/user-ids")
+        assert response.status_code == 403
+
+        headers = {"X-Internal-Key": "test-internal-key"}
+        response = client.get("/internal/user-ids", params={"role": "USER", "limit": 10}, headers=headers)
+        assert response.status_code in [200, 403]
+        if response.status_code == 200:
+            for line in response.text.splitlines():
+                assert set(json.loads(line)) == {"id", "language", "role", "city"}
+
+        response = client.get("/internal/user-ids/count")
+        assert response.status_code == 403
+        response = client.get("/internal/user-ids/count", params={"role": "USER"}, headers=headers)
+        assert response.status_code in [200, 403]
+        if response.status_code == 200:
+            assert response.json()["count"] >= 0
+
+    def test_audit_log_export_requires_admin(self):
+        """Test audit log export rejects anonymous and invalid tokens"""
+        response = client.get("/audit-logs/export")
+        assert response.status_code == 401
+
+        headers = {"Authorization": "Bearer mock_token"}
+        response = client.get("/audit-logs/export", params={"format": "ndjson"}, headers=headers)
+        assert response.status_code in [401, 403]
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -1,9 +1,18 @@
+import hashlib
+import os
 import secrets
 import string
-from typing import List, Optional
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
 import models
 import schemas
+from export_stream import EXPORT_BATCH_SIZE
+from pydantic import TypeAdapter
+from sqlalchemy import func, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 
@@ -18,6 +27,7 @@ def create_company(db: Session, company: schemas.CompanyCreate):
     db_company = models.Company(**company.dict())
     db.add(db_company)
     db.commit()
+    bump_catalog_version(db)
     db.refresh(db_company)
     return db_company
 
@@ -42,6 +52,7 @@ def update_company(db: Session, company_id: int, company_update: schemas.Company
         setattr(company, field, value)
     
     db.commit()
+    bump_catalog_version(db)
     db.refresh(company)
     return company
 
@@ -53,6 +64,7 @@ def delete_company(db: Session, company_id: int):
     
     company.status = "DELETED"
     db.commit()
+    bump_catalog_version(db)
     db.refresh(company)
     return company
 
@@ -62,6 +74,7 @@ def create_category(db: Session, category: schemas.CouponCategoryCreate):
     db_category = models.CouponCategory(**category.dict())
     db.add(db_category)
     db.commit()
+    bump_catalog_version(db)
     db.refresh(db_category)
     return db_category
 
@@ -84,6 +97,7 @@ def update_category(db: Session, category_id: int, category_update: schemas.Coup
         setattr(category, field, value)
     
     db.commit()
+    bump_catalog_version(db)
     db.refresh(category)
     return category
 
@@ -95,6 +109,7 @@ def delete_category(db: Session, category_id: int):
     
     category.status = "DELETED"
     db.commit()
+    bump_catalog_version(db)
     db.refresh(category)
     return category
 
@@ -104,6 +119,7 @@ def create_coupon(db: Session, coupon: schemas.CouponCreate):
     db_coupon = models.Coupon(**coupon.dict())
     db.add(db_coupon)
     db.commit()
+    bump_catalog_version(db)
     db.refresh(db_coupon)
     return db_coupon
 
@@ -150,6 +166,7 @@ def update_coupon(db: Session, coupon_id: int, coupon_update: schemas.CouponUpda
         setattr(coupon, field, value)
     
     db.commit()
+    bump_catalog_version(db)
     db.refresh(coupon)
     return coupon
 
@@ -162,6 +179,7 @@ def delete_coupon(db: Session, coupon_id: int):
     
     coupon.status = "DELETED"
     db.commit()
+    bump_catalog_version(db)
     db.refresh(coupon)
     return coupon
 
@@ -182,6 +200,7 @@ def restore_coupon(db: Session, coupon_id: int):
     
     coupon.status = "ACTIVE"
     db.commit()
+    bump_catalog_version(db)
     db.refresh(coupon)
     return coupon
 
@@ -194,30 +213,241 @@ def permanent_delete_coupon(db: Session, coupon_id: int):
     
     db.delete(coupon)
     db.commit()
+    bump_catalog_version(db)
     return True
 
 
+# ── Coupon catalog cache ────────────────────────────────────────────
+# GET / is served from pre-serialized JSON per filter. Every coupon / category
+# / company change bumps catalog_versions (here and by trigger, migration
+# 002); workers compare that version at most every CATALOG_VERSION_CHECK_SECONDS
+# and drop their entries on mismatch. An entry also lapses when the next
+# expiration_date among its coupons passes, so expired coupons flip status.
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "10"))
+CATALOG_MAX_ENTRIES = int(os.getenv("CATALOG_MAX_ENTRIES", "512"))
+CATALOG_VERSION_ID = 1
+_catalog = {"version": None, "checked_at": 0.0, "entries": {}}
+_catalog_lock = threading.Lock()
+_coupon_list_adapter = TypeAdapter(List[schemas.Coupon])
+
+
+def get_catalog_version(db: Session) -> int:
+    version = db.query(models.CatalogVersion.version).filter(
+        models.CatalogVersion.id == CATALOG_VERSION_ID
+    ).scalar()
+    return version or 0
+
+
+def bump_catalog_version(db: Session) -> int:
+    """Signal a catalog change to every worker and drop this worker's entries now"""
+    table = models.CatalogVersion.__table__
+    stmt = pg_insert(table).values(id=CATALOG_VERSION_ID, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    ).returning(table.c.version)
+    version = db.execute(stmt).scalar()
+    db.commit()
+    with _catalog_lock:
+        _catalog.update(version=version, checked_at=time.monotonic(), entries={})
+    return version
+
+
+def _serialize_catalog(coupons: List[models.Coupon], now: datetime) -> Tuple[bytes, Optional[datetime]]:
+    """JSON body of a coupon list plus the next moment one of them expires"""
+    items = []
+    next_expiry = None
+    for coupon in coupons:
+        item = schemas.Coupon.model_validate(coupon)
+        if item.status == "ACTIVE" and item.expiration_date:
+            if item.expiration_date <= now:
+                item = item.model_copy(update={"status": "EXPIRED"})
+            elif next_expiry is None or item.expiration_date < next_expiry:
+                next_expiry = item.expiration_date
+        items.append(item)
+    return _coupon_list_adapter.dump_json(items), next_expiry
+
+
+def get_coupon_catalog(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    coupon_category_id: Optional[int] = None,
+    company_id: Optional[int] = None
+) -> Tuple[bytes, str]:
+    """
+    Serialized coupon listing and its ETag. Hits need no database access
+    except the periodic version check.
+    """
+    key = (skip, limit, coupon_category_id or None, company_id or None)
+    with _catalog_lock:
+        stale = time.monotonic() - _catalog["checked_at"] >= CATALOG_VERSION_CHECK_SECONDS
+    if stale:
+        version = get_catalog_version(db)
+        with _catalog_lock:
+            if version != _catalog["version"]:
+                _catalog.update(version=version, entries={})
+            _catalog["checked_at"] = time.monotonic()
+
+    now = datetime.utcnow()
+    with _catalog_lock:
+        entry = _catalog["entries"].get(key)
+        version = _catalog["version"]
+    if entry and (entry["expires_at"] is None or now < entry["expires_at"]):
+        return entry["body"], entry["etag"]
+
+    coupons = get_coupons(db, skip=skip, limit=limit, coupon_category_id=coupon_category_id, company_id=company_id)
+    body, next_expiry = _serialize_catalog(coupons, now)
+    entry = {
+        "body": body,
+        "etag": '"%s"' % hashlib.sha1(body).hexdigest(),
+        "expires_at": next_expiry,
+    }
+    with _catalog_lock:
+        # Don't cache a listing read under a version that has since moved on
+        if _catalog["version"] == version:
+            entries = _catalog["entries"]
+            entries.pop(key, None)
+            if len(entries) >= CATALOG_MAX_ENTRIES:
+                entries.pop(next(iter(entries)))
+            entries[key] = entry
+    return entry["body"], entry["etag"]
+
+
 # Redemption CRUD
-def create_redemption(db: Session, user_id: int, coupon_id: int, points_spent: int):
-    # Generate unique verification code
+def _new_verification_code(db: Session) -> str:
+    """Generate a verification code not used by any redemption yet"""
     verification_code = generate_redemption_code(16)
-    
-    # Make sure the code is unique
     while db.query(models.CouponRedemption).filter(
         models.CouponRedemption.verification_code == verification_code
     ).first():
         verification_code = generate_redemption_code(16)
-    
-    db_redemption = models.CouponRedemption(
+    return verification_code
+
+
+def reserve_redemption(
+    db: Session,
+    user_id: int,
+    coupon_id: int
+) -> Tuple[Optional[models.CouponRedemption], Optional[str]]:
+    """
+    Reserve one unit of the coupon and one of the user's uses in a single
+    short transaction, and insert the redemption as RESERVED. Both counters
+    are conditional UPDATEs, so concurrent redemptions can never oversell
+    `total_available` or exceed `max_usage_per_user` (default 1).
+    Returns (redemption, None) or (None, reason).
+    """
+    now = datetime.utcnow()
+    coupon = models.Coupon
+    reserved = db.execute(
+        update(coupon).where(
+            coupon.id == coupon_id,
+            coupon.status == "ACTIVE",
+            or_(coupon.expiration_date.is_(None), coupon.expiration_date > now),
+            or_(coupon.total_available.is_(None), coupon.redeemed_count < coupon.total_available),
+        ).values(
+            redeemed_count=coupon.redeemed_count + 1
+        ).returning(coupon.points_cost, coupon.max_usage_per_user)
+    ).first()
+    if reserved is None:
+        db.rollback()
+        existing = get_coupon(db, coupon_id)
+        if not existing:
+            return None, "not_found"
+        if existing.status != "ACTIVE":
+            return None, "inactive"
+        if existing.expiration_date and existing.expiration_date <= now:
+            return None, "expired"
+        return None, "sold_out"
+
+    points_cost, max_usage = reserved
+    usage = models.CouponUserUsage.__table__
+    stmt = pg_insert(usage).values(coupon_id=coupon_id, user_id=user_id, usage_count=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[usage.c.coupon_id, usage.c.user_id],
+        set_={"usage_count": usage.c.usage_count + 1},
+        where=usage.c.usage_count < (max_usage or 1),
+    ).returning(usage.c.usage_count)
+    if db.execute(stmt).first() is None:
+        db.rollback()
+        return None, "limit_reached"
+
+    redemption = models.CouponRedemption(
         user_id=user_id,
         coupon_id=coupon_id,
-        points_spent=points_spent,
-        verification_code=verification_code
+        points_spent=points_cost,
+        verification_code=_new_verification_code(db),
+        status="RESERVED"
     )
-    db.add(db_redemption)
+    db.add(redemption)
     db.commit()
-    db.refresh(db_redemption)
-    return db_redemption
+    db.refresh(redemption)
+    return redemption, None
+
+
+def confirm_redemption(db: Session, redemption_id: int) -> bool:
+    """
+    Turn a RESERVED redemption into a valid (PENDING) one once points are
+    deducted; it counts towards the redemption rollups from here on.
+    """
+    redemption = models.CouponRedemption
+    confirmed = db.execute(
+        update(redemption).where(
+            redemption.id == redemption_id,
+            redemption.status == "RESERVED",
+        ).values(
+            status="PENDING"
+        ).returning(redemption.coupon_id, redemption.points_spent, redemption.redeemed_at)
+    ).first()
+    if confirmed is None:
+        db.rollback()
+        return False
+    coupon_id, points_spent, redeemed_at = confirmed
+    company_id = db.query(models.Coupon.company_id).filter(models.Coupon.id == coupon_id).scalar()
+    if company_id is not None:
+        add_redemption_rollup(db, coupon_id, company_id, redeemed_at, redemptions=1, points_spent=points_spent)
+    db.commit()
+    return True
+
+
+def release_redemption(db: Session, redemption_id: int) -> bool:
+    """
+    Compensation: cancel a RESERVED redemption and give back its inventory
+    unit and user use, exactly once.
+    """
+    redemption = db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.id == redemption_id,
+        models.CouponRedemption.status == "RESERVED",
+    ).with_for_update().first()
+    if not redemption:
+        db.rollback()
+        return False
+
+    redemption.status = "CANCELED"
+    db.execute(
+        update(models.Coupon).where(
+            models.Coupon.id == redemption.coupon_id,
+            models.Coupon.redeemed_count > 0,
+        ).values(redeemed_count=models.Coupon.redeemed_count - 1)
+    )
+    db.execute(
+        update(models.CouponUserUsage).where(
+            models.CouponUserUsage.coupon_id == redemption.coupon_id,
+            models.CouponUserUsage.user_id == redemption.user_id,
+            models.CouponUserUsage.usage_count > 0,
+        ).values(usage_count=models.CouponUserUsage.usage_count - 1)
+    )
+    db.commit()
+    return True
+
+
+def get_stale_reservations(db: Session, older_than_seconds: int) -> List[models.CouponRedemption]:
+    """RESERVED redemptions whose points call never completed (crash or timeout)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    return db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.status == "RESERVED",
+        models.CouponRedemption.redeemed_at < cutoff,
+    ).order_by(models.CouponRedemption.id).limit(500).all()
 
 
 def get_redemption_by_code(db: Session, verification_code: str):
@@ -229,8 +459,6 @@ def get_redemption_by_code(db: Session, verification_code: str):
 
 def verify_redemption(db: Session, verification_code: str, verified_by: int, company_id: int):
     """Verify a redemption - mark it as VERIFIED"""
-    from datetime import datetime
-    
     redemption = get_redemption_by_code(db, verification_code)
     if not redemption:
         return None, "Redemption not found"
@@ -243,6 +471,10 @@ def verify_redemption(db: Session, verification_code: str, verified_by: int, com
     if redemption.status in ["EXPIRED", "CANCELED"]:
         return None, f"Coupon is {redemption.status.lower()}"
     
+    # Points deduction not completed yet
+    if redemption.status == "RESERVED":
+        return None, "Redemption is still being processed"
+    
     # Check if coupon belongs to the company
     coupon = get_coupon(db, redemption.coupon_id)
     if not coupon:
@@ -255,6 +487,7 @@ def verify_redemption(db: Session, verification_code: str, verified_by: int, com
     redemption.status = "VERIFIED"
     redemption.verified_at = datetime.utcnow()
     redemption.verified_by = verified_by
+    add_redemption_rollup(db, coupon.id, coupon.company_id, redemption.verified_at, verified=1)
     
     db.commit()
     db.refresh(redemption)
@@ -262,43 +495,105 @@ def verify_redemption(db: Session, verification_code: str, verified_by: int, com
     return redemption, None
 
 
-def get_user_redemption(db: Session, user_id: int, coupon_id: int):
-    return db.query(models.CouponRedemption).filter(
-        models.CouponRedemption.user_id == user_id,
-        models.CouponRedemption.coupon_id == coupon_id
-    ).first()
+# Redemptions whose points were deducted; RESERVED (in flight) and CANCELED
+# (released after a failed points call) attempts are hidden from listings
+CONFIRMED_REDEMPTION_STATUSES = ("PENDING", "VERIFIED", "EXPIRED")
 
 
 def get_user_redemptions(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.CouponRedemption).filter(
-        models.CouponRedemption.user_id == user_id
+        models.CouponRedemption.user_id == user_id,
+        models.CouponRedemption.status.in_(CONFIRMED_REDEMPTION_STATUSES)
     ).order_by(models.CouponRedemption.redeemed_at.desc()).offset(skip).limit(limit).all()
 
 
-def get_all_redemptions(db: Session, skip: int = 0, limit: int = 10000):
-    """Get all redemptions for analytics"""
-    return db.query(models.CouponRedemption).order_by(
-        models.CouponRedemption.redeemed_at.desc()
-    ).offset(skip).limit(limit).all()
+def iter_all_redemptions(db: Session, skip: int = 0, limit: Optional[int] = None):
+    """Stream all confirmed redemptions, newest first, through a server-side cursor"""
+    query = db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.status.in_(CONFIRMED_REDEMPTION_STATUSES)
+    ).order_by(
+        models.CouponRedemption.redeemed_at.desc(),
+        models.CouponRedemption.id.desc()
+    ).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.yield_per(EXPORT_BATCH_SIZE)
+
+
+# ── Redemption rollups ──────────────────────────────────────────────
+# coupon_redemption_daily / company_redemption_daily are updated in the same
+# transaction as each confirmed redemption and each verification (migration
+# 003 backfills them), so the dashboards below read rollup rows only.
+def add_redemption_rollup(
+    db: Session,
+    coupon_id: int,
+    company_id: int,
+    at: datetime,
+    redemptions: int = 0,
+    verified: int = 0,
+    points_spent: int = 0
+):
+    """Add a redemption (or verification) to both daily rollups; caller commits"""
+    day = at.date()
+    last_redeemed_at = at if redemptions else None
+
+    coupon_daily = models.CouponRedemptionDaily.__table__
+    stmt = pg_insert(coupon_daily).values(
+        coupon_id=coupon_id,
+        day=day,
+        company_id=company_id,
+        redemption_count=redemptions,
+        verified_count=verified,
+        points_spent=points_spent,
+        last_redeemed_at=last_redeemed_at,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[coupon_daily.c.coupon_id, coupon_daily.c.day],
+        set_={
+            "redemption_count": coupon_daily.c.redemption_count + stmt.excluded.redemption_count,
+            "verified_count": coupon_daily.c.verified_count + stmt.excluded.verified_count,
+            "points_spent": coupon_daily.c.points_spent + stmt.excluded.points_spent,
+            "last_redeemed_at": func.greatest(coupon_daily.c.last_redeemed_at, stmt.excluded.last_redeemed_at),
+        },
+    ))
+
+    company_daily = models.CompanyRedemptionDaily.__table__
+    stmt = pg_insert(company_daily).values(
+        company_id=company_id,
+        day=day,
+        redemption_count=redemptions,
+        verified_count=verified,
+        points_spent=points_spent,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[company_daily.c.company_id, company_daily.c.day],
+        set_={
+            "redemption_count": company_daily.c.redemption_count + stmt.excluded.redemption_count,
+            "verified_count": company_daily.c.verified_count + stmt.excluded.verified_count,
+            "points_spent": company_daily.c.points_spent + stmt.excluded.points_spent,
+        },
+    ))
 
 
 def get_redemptions_by_company(db: Session):
     """Get redemption counts grouped by company"""
-    from sqlalchemy import func
-    
+    daily = models.CompanyRedemptionDaily
+    totals = db.query(
+        daily.company_id.label("company_id"),
+        func.sum(daily.redemption_count).label("redemption_count")
+    ).group_by(daily.company_id).subquery()
+
     results = db.query(
         models.Company.id,
         models.Company.name,
         models.Company.logo_url,
-        func.count(models.CouponRedemption.id).label('redemption_count')
-    ).join(
-        models.Coupon, models.Company.id == models.Coupon.company_id
+        totals.c.redemption_count
     ).join(
-        models.CouponRedemption, models.Coupon.id == models.CouponRedemption.coupon_id
-    ).group_by(
-        models.Company.id, models.Company.name, models.Company.logo_url
+        totals, totals.c.company_id == models.Company.id
+    ).filter(
+        totals.c.redemption_count > 0
     ).order_by(
-        func.count(models.CouponRedemption.id).desc()
+        totals.c.redemption_count.desc()
     ).all()
     
     return [
@@ -306,7 +601,7 @@ def get_redemptions_by_company(db: Session):
             "company_id": r[0],
             "company_name": r[1],
             "logo_url": r[2],
-            "redemption_count": r[3]
+            "redemption_count": int(r[3])
         }
         for r in results
     ]
@@ -314,50 +609,45 @@ def get_redemptions_by_company(db: Session):
 
 def get_company_coupon_stats(db: Session, company_id: int, start_date=None, end_date=None):
     """Get coupon redemption statistics for a specific company"""
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
+    daily = models.CouponRedemptionDaily
+    totals = db.query(
+        daily.coupon_id.label("coupon_id"),
+        func.sum(daily.redemption_count).label("redemption_count"),
+        func.max(daily.last_redeemed_at).label("last_redeemed")
+    ).filter(daily.company_id == company_id)
+    
+    # Apply date filters if provided (whole days)
+    if start_date:
+        totals = totals.filter(daily.day >= start_date.date())
+    if end_date:
+        totals = totals.filter(daily.day <= end_date.date())
+    totals = totals.group_by(daily.coupon_id).subquery()
     
-    # Base query for coupon stats
-    query = db.query(
+    redemption_count = func.coalesce(totals.c.redemption_count, 0)
+    results = db.query(
         models.Coupon.id,
-        models.Coupon.title,
-        models.Coupon.title_ar,
+        models.Coupon.name,
         models.Coupon.points_cost,
-        func.count(models.CouponRedemption.id).label('redemption_count'),
-        func.max(models.CouponRedemption.redeemed_at).label('last_redeemed')
+        redemption_count,
+        totals.c.last_redeemed
     ).outerjoin(
-        models.CouponRedemption, models.Coupon.id == models.CouponRedemption.coupon_id
+        totals, totals.c.coupon_id == models.Coupon.id
     ).filter(
         models.Coupon.company_id == company_id,
         models.Coupon.status == "ACTIVE"
-    )
-    
-    # Apply date filters if provided
-    if start_date:
-        query = query.filter(
-            (models.CouponRedemption.redeemed_at >= start_date) | 
-            (models.CouponRedemption.redeemed_at.is_(None))
-        )
-    if end_date:
-        query = query.filter(
-            (models.CouponRedemption.redeemed_at <= end_date) | 
-            (models.CouponRedemption.redeemed_at.is_(None))
-        )
-    
-    results = query.group_by(
-        models.Coupon.id, models.Coupon.title, models.Coupon.title_ar, models.Coupon.points_cost
     ).order_by(
-        func.count(models.CouponRedemption.id).desc()
+        redemption_count.desc()
     ).all()
     
+    # Coupons have a single name; title_ar is kept for the dashboard's fallback
     return [
         {
             "coupon_id": r[0],
             "title": r[1],
-            "title_ar": r[2],
-            "points_cost": r[3],
-            "redemption_count": r[4],
-            "last_redeemed": r[5].isoformat() if r[5] else None
+            "title_ar": None,
+            "points_cost": r[2],
+            "redemption_count": int(r[3]),
+            "last_redeemed": r[4].isoformat() if r[4] else None
         }
         for r in results
     ]
@@ -365,28 +655,18 @@ def get_company_coupon_stats(db: Session, company_id: int, start_date=None, end_
 
 def get_company_redemptions_over_time(db: Session, company_id: int, days: int = 30):
     """Get daily redemption counts for a company over time"""
-    from sqlalchemy import func, cast, Date
-    from datetime import datetime, timedelta
+    start_day = (datetime.utcnow() - timedelta(days=days)).date()
+    daily = models.CompanyRedemptionDaily
     
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    results = db.query(
-        cast(models.CouponRedemption.redeemed_at, Date).label('date'),
-        func.count(models.CouponRedemption.id).label('count')
-    ).join(
-        models.Coupon, models.CouponRedemption.coupon_id == models.Coupon.id
-    ).filter(
-        models.Coupon.company_id == company_id,
-        models.CouponRedemption.redeemed_at >= start_date
-    ).group_by(
-        cast(models.CouponRedemption.redeemed_at, Date)
-    ).order_by(
-        cast(models.CouponRedemption.redeemed_at, Date)
-    ).all()
+    results = db.query(daily.day, daily.redemption_count).filter(
+        daily.company_id == company_id,
+        daily.day >= start_day,
+        daily.redemption_count > 0
+    ).order_by(daily.day).all()
     
     return [
         {
-            "date": r[0].isoformat() if r[0] else None,
+            "date": r[0].isoformat(),
             "count": r[1]
         }
         for r in results
@@ -395,30 +675,21 @@ def get_company_redemptions_over_time(db: Session, company_id: int, days: int =
 
 def get_company_stats_summary(db: Session, company_id: int):
     """Get summary statistics for a company"""
-    from sqlalchemy import func
-    
     # Total coupons
     total_coupons = db.query(func.count(models.Coupon.id)).filter(
         models.Coupon.company_id == company_id,
         models.Coupon.status == "ACTIVE"
     ).scalar() or 0
     
-    # Total redemptions
-    total_redemptions = db.query(func.count(models.CouponRedemption.id)).join(
-        models.Coupon, models.CouponRedemption.coupon_id == models.Coupon.id
-    ).filter(
-        models.Coupon.company_id == company_id
-    ).scalar() or 0
-    
-    # Total points spent on company coupons
-    total_points = db.query(func.sum(models.CouponRedemption.points_spent)).join(
-        models.Coupon, models.CouponRedemption.coupon_id == models.Coupon.id
-    ).filter(
-        models.Coupon.company_id == company_id
-    ).scalar() or 0
+    # Total redemptions and points spent on company coupons
+    daily = models.CompanyRedemptionDaily
+    total_redemptions, total_points = db.query(
+        func.coalesce(func.sum(daily.redemption_count), 0),
+        func.coalesce(func.sum(daily.points_spent), 0)
+    ).filter(daily.company_id == company_id).one()
     
     return {
         "total_coupons": total_coupons,
-        "total_redemptions": total_redemptions,
-        "total_points_spent": total_points
+        "total_redemptions": int(total_redemptions),
+        "total_points_spent": int(total_points)
     }
@@ -6,6 +6,7 @@ import httpx
 logger = logging.getLogger(__name__)
 
 GAMIFICATION_SERVICE_URL = os.getenv("GAMIFICATION_SERVICE_URL", "http://gamification-service:8000")
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "kashif-internal-secret-2026")
 
 
 async def get_user_points(token: str) -> int:
@@ -29,8 +30,8 @@ async def get_user_points(token: str) -> int:
         return 0
 
 
-async def redeem_points(token: str, points: int, coupon_id: int) -> bool:
-    """Redeem points for a coupon via gamification service"""
+async def redeem_points(token: str, points: int, coupon_id: int, reference: str = None) -> bool:
+    """Redeem points for a coupon via gamification service (idempotent per reference)"""
     try:
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -38,7 +39,8 @@ async def redeem_points(token: str, points: int, coupon_id: int) -> bool:
                 headers={"Authorization": f"Bearer {token}"},
                 json={
                     "points": points,
-                    "coupon_id": coupon_id
+                    "coupon_id": coupon_id,
+                    "reference": reference
                 }
             )
             
@@ -52,3 +54,27 @@ async def redeem_points(token: str, points: int, coupon_id: int) -> bool:
     except Exception as e:
         logger.error(f"Error redeeming points: {e}")
         return False
+
+
+async def refund_points(user_id: int, reference: str) -> bool:
+    """
+    Compensate a redemption made with `reference`. Safe to call whether or
+    not the points were deducted; returns False only if the call failed.
+    """
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{GAMIFICATION_SERVICE_URL}/internal/points/refund",
+                headers={"X-Internal-Key": INTERNAL_API_KEY},
+                json={"user_id": user_id, "reference": reference}
+            )
+            
+            if response.status_code == 200:
+                return True
+            else:
+                logger.error(f"Failed to refund points: {response.status_code} - {response.text}")
+                return False
+                
+    except Exception as e:
+        logger.error(f"Error refunding points: {e}")
+        return False
@@ -8,12 +8,15 @@ import crud
 import gamification_client
 import models
 import schemas
-from database import engine, get_db
-from fastapi import Depends, FastAPI, Header, HTTPException, status
+from consumer_metrics import get_queue_stats, metrics
+from database import SessionLocal, engine, get_db
+from export_stream import EXPORT_MEDIA_TYPES, stream_export
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from json_logger import setup_logging
 from logging_middleware import RequestLoggingMiddleware
-from rabbitmq_consumer import start_consumer
+from rabbitmq_consumer import QUEUE_NAME, start_consumer
 from rabbitmq_publisher import publish_event
 from sqlalchemy import text
 from sqlalchemy.orm import Session
@@ -43,6 +46,31 @@ logger = setup_logging("coupons")
 consumer_thread = threading.Thread(target=start_consumer, daemon=True)
 consumer_thread.start()
 
+# Reservations still RESERVED after this long are compensated by the sweeper
+RESERVATION_TIMEOUT_SECONDS = int(os.getenv("RESERVATION_TIMEOUT_SECONDS", "300"))
+
+
+def periodic_reservation_sweep():
+    """Compensate reservations whose points call never finished (crash, timeout)"""
+    import asyncio
+    import time
+    while True:
+        time.sleep(60)
+        try:
+            db = SessionLocal()
+            try:
+                for redemption in crud.get_stale_reservations(db, RESERVATION_TIMEOUT_SECONDS):
+                    if asyncio.run(compensate_redemption(db, redemption)):
+                        logger.warning(f"Released stale reservation {redemption.id} for coupon {redemption.coupon_id}")
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Reservation sweep error: {e}")
+
+
+reservation_thread = threading.Thread(target=periodic_reservation_sweep, daemon=True)
+reservation_thread.start()
+
 
 @app.get("/health")
 def health_check():
@@ -320,10 +348,12 @@ async def get_coupons(
     coupon_category_id: Optional[int] = None,
     company_id: Optional[int] = None,
     authorization: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
     db: Session = Depends(get_db)
 ):
     """Get all available coupons with filters.
-    If user is COMPANY role, only returns coupons for their company."""
+    If user is COMPANY role, only returns coupons for their company.
+    Served from the in-process catalog; answers 304 when If-None-Match matches."""
     
     # Check if there's an auth header and if user is COMPANY role
     filter_company_id = company_id
@@ -334,13 +364,17 @@ async def get_coupons(
             # Force filter to their company only
             filter_company_id = user.get("company_id")
     
-    return crud.get_coupons(
+    body, etag = crud.get_coupon_catalog(
         db=db,
         skip=skip,
         limit=limit,
         coupon_category_id=coupon_category_id,
         company_id=filter_company_id
     )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # IMPORTANT: This route must be defined BEFORE /{coupon_id} to avoid path conflicts
@@ -489,6 +523,33 @@ async def permanent_delete_coupon(
     return {"message": "Coupon permanently deleted"}
 
 
+REDEEM_ERRORS = {
+    "not_found": (status.HTTP_404_NOT_FOUND, "Coupon not found"),
+    "inactive": (status.HTTP_400_BAD_REQUEST, "Coupon is not active"),
+    "expired": (status.HTTP_400_BAD_REQUEST, "Coupon has expired"),
+    "sold_out": (status.HTTP_409_CONFLICT, "Coupon is sold out"),
+    "limit_reached": (status.HTTP_400_BAD_REQUEST, "You have already redeemed this coupon"),
+}
+
+
+def redemption_reference(redemption_id: int) -> str:
+    """Idempotency key of a redemption's points deduction in gamification-service"""
+    return f"coupon-redemption:{redemption_id}"
+
+
+async def compensate_redemption(db: Session, redemption: models.CouponRedemption) -> bool:
+    """
+    Undo a reservation: refund the points (no-op if none were deducted),
+    then release the inventory unit. If the refund call fails the
+    reservation stays RESERVED and the sweeper retries it.
+    """
+    refunded = await gamification_client.refund_points(redemption.user_id, redemption_reference(redemption.id))
+    if not refunded:
+        logger.error(f"Could not refund reservation {redemption.id}; leaving it for the sweeper")
+        return False
+    return crud.release_redemption(db, redemption.id)
+
+
 @app.post("/{coupon_id}/redeem", response_model=schemas.CouponRedemption)
 async def redeem_coupon(
     coupon_id: int,
@@ -496,48 +557,38 @@ async def redeem_coupon(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Redeem a coupon with points"""
-    # Get coupon
-    coupon = crud.get_coupon(db=db, coupon_id=coupon_id)
-    if not coupon:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Coupon not found"
-        )
-    
-    if not coupon.status == "ACTIVE":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Coupon is not active"
-        )
-    
-    # Check if user already redeemed this coupon
-    existing_redemption = crud.get_user_redemption(db=db, user_id=user_id, coupon_id=coupon_id)
-    if existing_redemption:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have already redeemed this coupon"
-        )
-    
-    # Get the points cost
-    points_cost = coupon.points_cost or coupon.points_required or 0
+    """
+    Redeem a coupon with points:
+    1. reserve inventory + user use (conditional UPDATEs, committed),
+    2. deduct points with one idempotent gamification call,
+    3. confirm the reservation - or compensate if step 2 failed.
+    """
+    redemption, error = crud.reserve_redemption(db=db, user_id=user_id, coupon_id=coupon_id)
+    if error:
+        status_code, detail = REDEEM_ERRORS[error]
+        raise HTTPException(status_code=status_code, detail=detail)
     
     # Call gamification service to redeem points
     token = authorization.replace("Bearer ", "")
-    redeemed = await gamification_client.redeem_points(token, points_cost, coupon_id)
+    redeemed = await gamification_client.redeem_points(
+        token, redemption.points_spent, coupon_id, redemption_reference(redemption.id)
+    )
     
     if not redeemed:
+        await compensate_redemption(db, redemption)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Failed to redeem points. You may not have enough points."
         )
     
-    redemption = crud.create_redemption(
-        db=db,
-        user_id=user_id,
-        coupon_id=coupon_id,
-        points_spent=points_cost
-    )
+    if not crud.confirm_redemption(db, redemption.id):
+        # The sweeper released the reservation meanwhile; give the points back
+        await compensate_redemption(db, redemption)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Redemption timed out, please try again"
+        )
+    db.refresh(redemption)
     
     # Publish CouponRedeemed event
     try:
@@ -545,7 +596,7 @@ async def redeem_coupon(
             "redemption_id": redemption.id,
             "user_id": user_id,
             "coupon_id": coupon_id,
-            "points_spent": points_cost
+            "points_spent": redemption.points_spent
         })
     except Exception as e:
         logger.error(f"Failed to publish CouponRedeemed event: {e}")
@@ -642,15 +693,36 @@ async def check_redemption_status(
     }
 
 
+REDEMPTION_EXPORT_COLUMNS = [
+    "id", "coupon_id", "user_id", "points_spent", "verification_code",
+    "status", "verified_at", "verified_by", "redeemed_at"
+]
+
+
 @app.get("/redemptions/all")
 async def get_all_redemptions(
     skip: int = 0,
-    limit: int = 10000,
-    user_id: int = Depends(get_current_user_id),
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1),
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
 ):
-    """Get all redemptions (admin only)"""
-    return crud.get_all_redemptions(db=db, skip=skip, limit=limit)
+    """Get all redemptions (admin only), streamed as a JSON array, NDJSON or CSV"""
+    if current_user.get("role", "").upper() != "ADMIN":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized. Admin role required."
+        )
+    body = stream_export(
+        SessionLocal,
+        lambda db: crud.iter_all_redemptions(db=db, skip=skip, limit=limit),
+        format,
+        REDEMPTION_EXPORT_COLUMNS,
+        lambda r: [getattr(r, column) for column in REDEMPTION_EXPORT_COLUMNS],
+    )
+    headers = {}
+    if format == "csv":
+        headers["Content-Disposition"] = "attachment; filename=redemptions_export.csv"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
 
 
 @app.get("/redemptions/stats/by-company")
@@ -748,6 +820,16 @@ def verify_internal_key(x_internal_key: str = Header(None)):
         raise HTTPException(status_code=403, detail="Invalid internal API key")
 
 
+@app.get("/internal/metrics")
+def get_consumer_metrics(_: None = Depends(verify_internal_key)):
+    """RabbitMQ consumer metrics of this worker plus the broker-side queue depth"""
+    return {
+        "service": "coupons",
+        "queue": get_queue_stats(QUEUE_NAME),
+        "consumer": metrics.snapshot(),
+    }
+
+
 @app.delete("/internal/user-data/{user_id}")
 def delete_user_data(
     user_id: int,
@@ -765,6 +847,10 @@ def delete_user_data(
         models.CouponRedemption.verified_by == user_id
     ).update({"verified_by": None})
 
+    db.query(models.CouponUserUsage).filter(
+        models.CouponUserUsage.user_id == user_id
+    ).delete()
+
     db.commit()
 
     logger.info(f"DSGVO: Anonymized {count} redemptions, {verified_count} verifications for user {user_id}")
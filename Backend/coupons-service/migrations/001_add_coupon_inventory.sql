@@ -0,0 +1,36 @@
+-- Migration: Inventory and per-user usage counters for atomic redemption
+-- Date: 2026-10-19
+-- Purpose: Enforce total_available and max_usage_per_user with conditional
+--          UPDATEs instead of read-then-insert checks
+
+ALTER TABLE coupons
+ADD COLUMN IF NOT EXISTS redeemed_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS coupon_user_usage (
+    coupon_id INTEGER NOT NULL REFERENCES coupons(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (coupon_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_coupon_user_usage_user_id ON coupon_user_usage (user_id);
+
+-- Backfill from existing redemptions (canceled ones do not count)
+UPDATE coupons c
+SET redeemed_count = r.cnt
+FROM (
+    SELECT coupon_id, COUNT(*) AS cnt
+    FROM coupon_redemptions
+    WHERE status <> 'CANCELED'
+    GROUP BY coupon_id
+) r
+WHERE r.coupon_id = c.id;
+
+INSERT INTO coupon_user_usage (coupon_id, user_id, usage_count)
+SELECT coupon_id, user_id, COUNT(*)
+FROM coupon_redemptions
+WHERE status <> 'CANCELED' AND user_id <> 0
+GROUP BY coupon_id, user_id
+ON CONFLICT (coupon_id, user_id) DO UPDATE SET usage_count = EXCLUDED.usage_count;
+
+COMMENT ON COLUMN coupons.redeemed_count IS 'Units reserved or redeemed; a redemption succeeds only while redeemed_count < total_available';
@@ -0,0 +1,43 @@
+-- Migration: Version counter for the coupon catalog cache
+-- Date: 2026-10-19
+-- Purpose: Let coupons workers serve GET / from memory and rebuild only after an edit
+
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_versions (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+-- Writes made outside the service (seed scripts, manual admin edits) bump the version too
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE catalog_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- redeemed_count is not part of the listing, so redemptions do not churn the cache
+DROP TRIGGER IF EXISTS trg_coupons_catalog_version ON coupons;
+CREATE TRIGGER trg_coupons_catalog_version
+AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF
+    company_id, coupon_category_id, name, description, points_cost, expiration_date,
+    image_url, address, max_usage_per_user, total_available, status, created_at
+ON coupons
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+DROP TRIGGER IF EXISTS trg_coupon_categories_catalog_version ON coupon_categories;
+CREATE TRIGGER trg_coupon_categories_catalog_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON coupon_categories
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+DROP TRIGGER IF EXISTS trg_companies_catalog_version ON companies;
+CREATE TRIGGER trg_companies_catalog_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON companies
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+COMMENT ON TABLE catalog_versions IS 'Bumped on every coupons / coupon_categories / companies change; coupons workers drop their catalog cache when it moves';
@@ -0,0 +1,71 @@
+-- Migration: Daily per-coupon and per-company redemption rollups
+-- Date: 2026-10-19
+-- Purpose: Serve company dashboards and the admin "by company" view from a
+--          few hundred rollup rows instead of scanning coupon_redemptions
+
+CREATE TABLE IF NOT EXISTS coupon_redemption_daily (
+    coupon_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    company_id INTEGER NOT NULL,
+    redemption_count INTEGER NOT NULL DEFAULT 0,
+    verified_count INTEGER NOT NULL DEFAULT 0,
+    points_spent INTEGER NOT NULL DEFAULT 0,
+    last_redeemed_at TIMESTAMP,
+    PRIMARY KEY (coupon_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS ix_coupon_redemption_daily_company_id ON coupon_redemption_daily (company_id);
+
+CREATE TABLE IF NOT EXISTS company_redemption_daily (
+    company_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    redemption_count INTEGER NOT NULL DEFAULT 0,
+    verified_count INTEGER NOT NULL DEFAULT 0,
+    points_spent INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (company_id, day)
+);
+
+-- Backfill (existing rows are recomputed). Redemptions count on the day they
+-- were made, verifications on the day they were verified; reservations still
+-- in flight or released never count.
+WITH valid AS (
+    SELECT r.coupon_id, c.company_id, r.points_spent, r.redeemed_at, r.verified_at, r.status
+    FROM coupon_redemptions r
+    JOIN coupons c ON c.id = r.coupon_id
+    WHERE r.status NOT IN ('RESERVED', 'CANCELED')
+),
+events AS (
+    SELECT coupon_id, company_id, redeemed_at::date AS day,
+           1 AS redemption_count, 0 AS verified_count, points_spent, redeemed_at
+    FROM valid
+    UNION ALL
+    SELECT coupon_id, company_id, verified_at::date,
+           0, 1, 0, NULL
+    FROM valid
+    WHERE status = 'VERIFIED' AND verified_at IS NOT NULL
+)
+INSERT INTO coupon_redemption_daily
+    (coupon_id, day, company_id, redemption_count, verified_count, points_spent, last_redeemed_at)
+SELECT coupon_id, day, MIN(company_id), SUM(redemption_count), SUM(verified_count),
+       SUM(points_spent), MAX(redeemed_at)
+FROM events
+GROUP BY coupon_id, day
+ON CONFLICT (coupon_id, day) DO UPDATE
+SET company_id = EXCLUDED.company_id,
+    redemption_count = EXCLUDED.redemption_count,
+    verified_count = EXCLUDED.verified_count,
+    points_spent = EXCLUDED.points_spent,
+    last_redeemed_at = EXCLUDED.last_redeemed_at;
+
+INSERT INTO company_redemption_daily
+    (company_id, day, redemption_count, verified_count, points_spent)
+SELECT company_id, day, SUM(redemption_count), SUM(verified_count), SUM(points_spent)
+FROM coupon_redemption_daily
+GROUP BY company_id, day
+ON CONFLICT (company_id, day) DO UPDATE
+SET redemption_count = EXCLUDED.redemption_count,
+    verified_count = EXCLUDED.verified_count,
+    points_spent = EXCLUDED.points_spent;
+
+COMMENT ON TABLE coupon_redemption_daily IS 'Per-coupon daily redemption counts, updated in the same transaction as each redemption confirm / verify';
+COMMENT ON TABLE company_redemption_daily IS 'Per-company daily redemption counts, updated in the same transaction as each redemption confirm / verify';
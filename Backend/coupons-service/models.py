@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from database import Base
-from sqlalchemy import (Boolean, Column, DateTime, Float, ForeignKey, Integer,
-                        String, Text)
+from sqlalchemy import (Boolean, Column, Date, DateTime, Float, ForeignKey,
+                        Integer, String, Text)
 from sqlalchemy.orm import relationship
 
 
@@ -52,6 +52,7 @@ class Coupon(Base):
     address = Column(String(500), nullable=True)  # Location/address for the coupon
     max_usage_per_user = Column(Integer, nullable=True)
     total_available = Column(Integer, nullable=True)
+    redeemed_count = Column(Integer, default=0, nullable=False)  # Reserved + redeemed units, checked against total_available
     status = Column(String(50), default="ACTIVE", nullable=False)  # ACTIVE, EXPIRED, DISABLED
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -68,9 +69,51 @@ class CouponRedemption(Base):
     user_id = Column(Integer, nullable=False, index=True)
     points_spent = Column(Integer, nullable=False)
     verification_code = Column(String(32), unique=True, nullable=False, index=True)  # Unique code for QR verification
-    status = Column(String(50), default="PENDING", nullable=False)  # PENDING, VERIFIED, EXPIRED, CANCELED
+    status = Column(String(50), default="PENDING", nullable=False)  # RESERVED, PENDING, VERIFIED, EXPIRED, CANCELED
     verified_at = Column(DateTime, nullable=True)  # When the coupon was verified by company
     verified_by = Column(Integer, nullable=True)  # User ID of company employee who verified
     redeemed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     coupon = relationship("Coupon", back_populates="redemptions")
+
+
+class CouponUserUsage(Base):
+    """Per-user redemption counter, checked against max_usage_per_user"""
+    __tablename__ = "coupon_user_usage"
+
+    coupon_id = Column(Integer, ForeignKey("coupons.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, primary_key=True, index=True)
+    usage_count = Column(Integer, default=0, nullable=False)
+
+
+class CouponRedemptionDaily(Base):
+    """Per-coupon, per-day redemption rollup, updated with each redemption and verification"""
+    __tablename__ = "coupon_redemption_daily"
+
+    coupon_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    company_id = Column(Integer, nullable=False, index=True)
+    redemption_count = Column(Integer, default=0, nullable=False)
+    verified_count = Column(Integer, default=0, nullable=False)
+    points_spent = Column(Integer, default=0, nullable=False)
+    last_redeemed_at = Column(DateTime, nullable=True)
+
+
+class CompanyRedemptionDaily(Base):
+    """Per-company, per-day redemption rollup backing the company dashboards"""
+    __tablename__ = "company_redemption_daily"
+
+    company_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    redemption_count = Column(Integer, default=0, nullable=False)
+    verified_count = Column(Integer, default=0, nullable=False)
+    points_spent = Column(Integer, default=0, nullable=False)
+
+
+class CatalogVersion(Base):
+    """Single-row counter bumped whenever coupons, categories or companies change"""
+    __tablename__ = "catalog_versions"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -21,6 +21,15 @@ class TestCouponsService:
         response = client.get("/", headers=headers)
         assert response.status_code in [200, 401]
     
+    def test_list_coupons_etag(self):
+        """Test catalog listing carries an ETag and honours If-None-Match"""
+        response = client.get("/", params={"limit": 20})
+        assert response.status_code == 200
+        etag = response.headers.get("etag")
+        assert etag
+        response = client.get("/", params={"limit": 20}, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+    
     def test_get_coupon_by_id(self):
         """Test getting specific coupon"""
         headers = {"Authorization": "Bearer mock_token"}
@@ -57,6 +66,15 @@ class TestCouponsService:
         response = client.get("/redemptions/all", headers=headers)
         assert response.status_code in [200, 401, 403]
 
+    
+    def test_company_redemption_stats(self):
+        """Test company dashboard statistics"""
+        headers = {"Authorization": "Bearer mock_token"}
+        for path in ["/redemptions/stats/company/1", "/redemptions/stats/company/1/over-time",
+                     "/redemptions/stats/company/1/summary", "/redemptions/stats/by-company"]:
+            response = client.get(path, headers=headers)
+            assert response.status_code in [200, 401, 403]
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Rebuild the ledger-derived tables (user_daily_points rollups and the
+user_stats / user_category_reports achievement counters) from
+point_transactions.
+
+Run once after deploying the rollup tables (and whenever they need repair):
+
+  docker exec kashif-gamification python backfill_rollups.py
+  docker exec kashif-gamification python backfill_rollups.py --since 2026-01-01
+"""
+
+import argparse
+from datetime import date
+
+import crud
+import models
+from database import SessionLocal, engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill points rollups and counters from the ledger")
+    parser.add_argument("--since", type=date.fromisoformat, default=None,
+                        help="Only rebuild rollup days on or after this date (YYYY-MM-DD); "
+                             "counters are always rebuilt in full")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rows = crud.backfill_daily_rollups(db, since=args.since)
+        scope = f"since {args.since}" if args.since else "for all history"
+        print(f"✓ Rebuilt {rows} daily rollup rows {scope}")
+
+        users = crud.backfill_user_stats(db)
+        print(f"✓ Rebuilt achievement counters for {users} users")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Create upcoming point_transactions partitions and compact old months into
+ledger_opening_balances (the service also does this daily).
+
+Compacted months are detached, not dropped. Archive and drop them with:
+
+  docker exec kashif-gamification python compact_ledger.py --before 2026-01-01
+  docker exec kashif-gamification-db pg_dump -U kashif_gamif -t point_transactions_y2025m12 kashif_gamification > point_transactions_y2025m12.sql
+  docker exec kashif-gamification-db psql -U kashif_gamif -c "DROP TABLE point_transactions_y2025m12" kashif_gamification
+"""
+
+import argparse
+from datetime import date, datetime
+
+import crud
+import models
+from database import SessionLocal, engine
+
+
+def main():
+    default_before = crud.add_months(datetime.utcnow().date().replace(day=1), -crud.LEDGER_RETENTION_MONTHS)
+    parser = argparse.ArgumentParser(description="Maintain and compact point_transactions partitions")
+    parser.add_argument("--before", type=date.fromisoformat, default=default_before,
+                        help="Compact months ending on or before this date (YYYY-MM-DD); "
+                             f"default {default_before} (LEDGER_RETENTION_MONTHS)")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not crud.is_ledger_partitioned(db):
+            print("✗ point_transactions is not partitioned; apply migrations/006 first")
+            return
+
+        created = crud.ensure_transaction_partitions(db)
+        print(f"✓ Created {len(created)} partitions {created}")
+
+        compacted = crud.compact_ledger(db, args.before)
+        for c in compacted:
+            print(f"✓ Compacted {c['partition']}: {c['rows']} transactions, {c['users']} users")
+        print(f"✓ Ledger compacted until {crud.get_ledger_compacted_until(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,940 @@
+import os
+import re
+import threading
+import time
 from typing import List, Optional
 
 import models
 import schemas
-from datetime import datetime
-from sqlalchemy import func, and_, or_
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, case, cast, column, extract, func, and_, insert, literal, or_, select, table, text, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 
-def create_transaction(
+def _ledger_total(user_id: int):
+    """Scalar SQL expression: live ledger sum plus the compacted opening balance"""
+    live = select(func.sum(models.PointTransaction.points)).where(
+        models.PointTransaction.user_id == user_id
+    ).scalar_subquery()
+    opening = select(models.LedgerOpeningBalance.balance).where(
+        models.LedgerOpeningBalance.user_id == user_id
+    ).scalar_subquery()
+    return func.coalesce(live, 0) + func.coalesce(opening, 0)
+
+
+def _ledger_totals(user_ids: Optional[List[int]] = None):
+    """SELECT user_id, total over the live ledger and the opening balances"""
+    live = select(
+        models.PointTransaction.user_id.label("user_id"),
+        models.PointTransaction.points.label("points"),
+    )
+    opening = select(models.LedgerOpeningBalance.user_id, models.LedgerOpeningBalance.balance)
+    if user_ids is not None:
+        live = live.where(models.PointTransaction.user_id.in_(user_ids))
+        opening = opening.where(models.LedgerOpeningBalance.user_id.in_(user_ids))
+    entries = union_all(live, opening).subquery()
+    return select(
+        entries.c.user_id,
+        func.sum(entries.c.points).label("total"),
+    ).group_by(entries.c.user_id)
+
+
+def _seed_balance_from_ledger(user_id: int):
+    """INSERT ... SELECT of the user's ledger total into user_point_balances"""
+    ledger_total = select(
+        literal(user_id),
+        _ledger_total(user_id),
+        literal(datetime.utcnow()),
+    )
+
+    return pg_insert(models.UserPointBalance).from_select(
+        ["user_id", "balance", "updated_at"], ledger_total
+    )
+
+
+def _apply_balance_delta(db: Session, user_id: int, points: int):
+    """
+    Add points to the user's materialized balance inside the current
+    transaction. Only a missing row is seeded from the ledger (which already
+    contains the flushed transaction), so the first write is self-healing
+    and every later write is a single-row UPDATE.
+    """
+    result = db.query(models.UserPointBalance).filter(
+        models.UserPointBalance.user_id == user_id
+    ).update(
+        {
+            models.UserPointBalance.balance: models.UserPointBalance.balance + points,
+            models.UserPointBalance.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    if result:
+        return
+    # A concurrent writer may seed the row first; its seed cannot see our
+    # uncommitted transaction, so add the delta on conflict
+    stmt = _seed_balance_from_ledger(user_id).on_conflict_do_update(
+        index_elements=[models.UserPointBalance.user_id],
+        set_={
+            "balance": models.UserPointBalance.balance + points,
+            "updated_at": datetime.utcnow(),
+        },
+    )
+    db.execute(stmt)
+
+
+def _ensure_balance_row(db: Session, user_id: int):
+    """Create the balance row from the ledger if it does not exist yet"""
+    exists = db.query(models.UserPointBalance.user_id).filter(
+        models.UserPointBalance.user_id == user_id
+    ).first()
+    if exists:
+        return
+    stmt = _seed_balance_from_ledger(user_id).on_conflict_do_nothing(
+        index_elements=[models.UserPointBalance.user_id]
+    )
+    db.execute(stmt)
+
+
+# Transaction types counted as reports / confirmations by rollups and achievements
+REPORT_TRANSACTION_TYPES = ("REPORT_CREATED", "report_created")
+CONFIRM_TRANSACTION_TYPES = ("REPORT_CONFIRMED",)
+
+# Reporting-service category ids counted for pothole_count achievements
+POTHOLE_CATEGORY_IDS = [int(c) for c in os.getenv("POTHOLE_CATEGORY_IDS", "1").split(",") if c.strip()]
+
+
+def _apply_daily_rollup(db: Session, transaction: models.PointTransaction):
+    """Add a flushed transaction to its (day, user, city) rollup row"""
+    table = models.UserDailyPoints.__table__
+    created_at = transaction.created_at or datetime.utcnow()
+    stmt = pg_insert(table).values(
+        day=created_at.date(),
+        user_id=transaction.user_id,
+        city=transaction.city or "",
+        points_earned=max(transaction.points, 0),
+        points_spent=max(-transaction.points, 0),
+        report_count=1 if transaction.type in REPORT_TRANSACTION_TYPES else 0,
+        confirm_count=1 if transaction.type in CONFIRM_TRANSACTION_TYPES else 0,
+    )
+    counters = ("points_earned", "points_spent", "report_count", "confirm_count")
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.user_id, table.c.city],
+        set_={c: table.c[c] + stmt.excluded[c] for c in counters},
+    )
+    db.execute(stmt)
+
+
+# Reports created between these hours (UTC, [start, end)) count as night reports
+NIGHT_START_HOUR = 22
+NIGHT_END_HOUR = 6
+
+
+def is_night_report(reported_at: datetime) -> bool:
+    return reported_at.hour >= NIGHT_START_HOUR or reported_at.hour < NIGHT_END_HOUR
+
+
+def _apply_user_stats(
+    db: Session,
+    transaction: models.PointTransaction,
+    reported_at: Optional[datetime] = None
+):
+    """Increment the user's activity counters for a flushed transaction"""
+    is_report = transaction.type in REPORT_TRANSACTION_TYPES
+    is_confirm = transaction.type in CONFIRM_TRANSACTION_TYPES
+    if not (is_report or is_confirm):
+        return
+
+    reported_at = reported_at or transaction.created_at or datetime.utcnow()
+    table = models.UserStats.__table__
+    stmt = pg_insert(table).values(
+        user_id=transaction.user_id,
+        report_count=1 if is_report else 0,
+        confirm_count=1 if is_confirm else 0,
+        night_report_count=1 if is_report and is_night_report(reported_at) else 0,
+        updated_at=datetime.utcnow(),
+    )
+    counters = ("report_count", "confirm_count", "night_report_count")
+    set_ = {c: table.c[c] + stmt.excluded[c] for c in counters}
+    set_["updated_at"] = stmt.excluded.updated_at
+    db.execute(stmt.on_conflict_do_update(index_elements=[table.c.user_id], set_=set_))
+
+    if is_report and transaction.category_id is not None:
+        table = models.UserCategoryReports.__table__
+        stmt = pg_insert(table).values(
+            user_id=transaction.user_id,
+            category_id=transaction.category_id,
+            report_count=1,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.category_id],
+            set_={"report_count": table.c.report_count + 1},
+        ))
+
+
+def add_transaction(
     db: Session,
     user_id: int,
     points: int,
     transaction_type: str,
     report_id: Optional[int],
-    description: Optional[str]
-):
-    """Create a new point transaction"""
+    description: Optional[str],
+    city: Optional[str] = None,
+    category_id: Optional[int] = None,
+    reported_at: Optional[datetime] = None,
+    reference: Optional[str] = None
+) -> models.PointTransaction:
+    """Stage a point transaction with its balance, rollup and counter updates (caller commits)"""
     transaction = models.PointTransaction(
         user_id=user_id,
         points=points,
         type=transaction_type,
         report_id=report_id,
-        description=description
+        description=description,
+        city=city,
+        category_id=category_id,
+        reference=reference
     )
     db.add(transaction)
+    db.flush()
+    _apply_balance_delta(db, user_id, points)
+    _apply_daily_rollup(db, transaction)
+    _apply_user_stats(db, transaction, reported_at)
+    return transaction
+
+
+def create_transaction(
+    db: Session,
+    user_id: int,
+    points: int,
+    transaction_type: str,
+    report_id: Optional[int],
+    description: Optional[str],
+    city: Optional[str] = None,
+    category_id: Optional[int] = None,
+    reported_at: Optional[datetime] = None
+):
+    """Create a new point transaction and update balance, rollups and counters atomically"""
+    transaction = add_transaction(
+        db, user_id, points, transaction_type, report_id, description,
+        city=city, category_id=category_id, reported_at=reported_at
+    )
     db.commit()
     db.refresh(transaction)
     return transaction
 
 
+def _lock_reference(db: Session, reference: str):
+    """Serialize writes carrying the same idempotency reference (until commit)"""
+    db.execute(select(func.pg_advisory_xact_lock(func.hashtext(reference))))
+
+
+def get_transaction_by_reference(
+    db: Session,
+    user_id: int,
+    reference: str,
+    transaction_type: str
+) -> Optional[models.PointTransaction]:
+    return db.query(models.PointTransaction).filter(
+        models.PointTransaction.user_id == user_id,
+        models.PointTransaction.reference == reference,
+        models.PointTransaction.type == transaction_type,
+    ).first()
+
+
+# Zero-point ledger marker left by a refund that arrived before its
+# redemption; a redemption with that reference is then refused
+REDEMPTION_CANCELED = "redemption_canceled"
+
+
+def redeem_points(
+    db: Session,
+    user_id: int,
+    points: int,
+    description: Optional[str],
+    reference: Optional[str] = None
+) -> Optional[models.PointTransaction]:
+    """
+    Deduct points with a single conditional UPDATE (balance >= cost).
+    Concurrent redemptions serialize on the balance row, so the balance
+    can never go negative. Returns None if the balance is insufficient.
+    With a reference, a retried call returns the original transaction, and
+    a reference already refunded returns its REDEMPTION_CANCELED marker
+    without deducting anything.
+    """
+    if reference:
+        _lock_reference(db, reference)
+        existing = (
+            get_transaction_by_reference(db, user_id, reference, "redemption")
+            or get_transaction_by_reference(db, user_id, reference, REDEMPTION_CANCELED)
+        )
+        if existing:
+            db.commit()
+            return existing
+    _ensure_balance_row(db, user_id)
+    result = db.query(models.UserPointBalance).filter(
+        models.UserPointBalance.user_id == user_id,
+        models.UserPointBalance.balance >= points,
+    ).update(
+        {
+            models.UserPointBalance.balance: models.UserPointBalance.balance - points,
+            models.UserPointBalance.updated_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    if result == 0:
+        db.rollback()
+        return None
+
+    transaction = models.PointTransaction(
+        user_id=user_id,
+        points=-points,
+        type="redemption",
+        report_id=None,
+        description=description,
+        reference=reference
+    )
+    db.add(transaction)
+    db.flush()
+    _apply_daily_rollup(db, transaction)
+    db.commit()
+    db.refresh(transaction)
+    return transaction
+
+
+def refund_redemption(db: Session, user_id: int, reference: str) -> Optional[models.PointTransaction]:
+    """
+    Give back the points of the redemption made with `reference` (the
+    caller's compensation step). Idempotent: returns the existing refund
+    when called again, and None when no redemption was made. In that case a
+    REDEMPTION_CANCELED marker is written so that a redemption with the same
+    reference arriving late (after the caller timed out) is refused.
+    """
+    _lock_reference(db, reference)
+    refund = get_transaction_by_reference(db, user_id, reference, "redemption_refund")
+    if refund:
+        db.commit()
+        return refund
+    redemption = get_transaction_by_reference(db, user_id, reference, "redemption")
+    if not redemption:
+        if not get_transaction_by_reference(db, user_id, reference, REDEMPTION_CANCELED):
+            db.add(models.PointTransaction(
+                user_id=user_id,
+                points=0,
+                type=REDEMPTION_CANCELED,
+                report_id=None,
+                description="Redemption canceled before it was processed",
+                reference=reference
+            ))
+        db.commit()
+        return None
+    refund = add_transaction(
+        db=db,
+        user_id=user_id,
+        points=-redemption.points,
+        transaction_type="redemption_refund",
+        report_id=None,
+        description=f"Refund: {redemption.description}",
+        reference=reference
+    )
+    db.commit()
+    db.refresh(refund)
+    return refund
+
+
+def bulk_add_transactions(
+    db: Session,
+    entries: List[schemas.BulkAwardEntry],
+    transaction_type: str = "admin_award"
+) -> int:
+    """
+    Stage many point transactions set-wise (caller commits): one multi-row
+    INSERT into the ledger, one balance upsert and one rollup upsert,
+    whatever the number of entries. Returns the total points awarded.
+    """
+    if not entries:
+        return 0
+
+    now = datetime.utcnow()
+    deltas = {}
+    for entry in entries:
+        earned, spent = deltas.get(entry.user_id, (0, 0))
+        deltas[entry.user_id] = (earned + max(entry.points, 0), spent + max(-entry.points, 0))
+    # Sorted so concurrent batches lock balance rows in the same order
+    user_ids = sorted(deltas)
+
+    # Seed missing balance rows from the ledger before it gains the new rows
+    totals = _ledger_totals(user_ids).subquery()
+    ledger_totals = select(totals.c.user_id, totals.c.total, literal(now))
+    db.execute(
+        pg_insert(models.UserPointBalance).from_select(
+            ["user_id", "balance", "updated_at"], ledger_totals
+        ).on_conflict_do_nothing(index_elements=[models.UserPointBalance.user_id])
+    )
+
+    db.execute(insert(models.PointTransaction.__table__).values([
+        {
+            "user_id": entry.user_id,
+            "points": entry.points,
+            "type": transaction_type,
+            "report_id": None,
+            "description": entry.description,
+            "created_at": now,
+        }
+        for entry in entries
+    ]))
+
+    balances = models.UserPointBalance.__table__
+    stmt = pg_insert(balances).values([
+        {"user_id": uid, "balance": deltas[uid][0] - deltas[uid][1], "updated_at": now}
+        for uid in user_ids
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[balances.c.user_id],
+        set_={"balance": balances.c.balance + stmt.excluded.balance, "updated_at": stmt.excluded.updated_at},
+    ))
+
+    rollups = models.UserDailyPoints.__table__
+    stmt = pg_insert(rollups).values([
+        {
+            "day": now.date(),
+            "user_id": uid,
+            "city": "",
+            "points_earned": deltas[uid][0],
+            "points_spent": deltas[uid][1],
+            "report_count": 0,
+            "confirm_count": 0,
+        }
+        for uid in user_ids
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[rollups.c.day, rollups.c.user_id, rollups.c.city],
+        set_={c: rollups.c[c] + stmt.excluded[c] for c in ("points_earned", "points_spent")},
+    ))
+
+    return sum(entry.points for entry in entries)
+
+
+def resolve_bulk_award_filter(db: Session, award_filter: schemas.BulkAwardFilter) -> List[int]:
+    """User ids matching a bulk-award filter"""
+    if award_filter.user_ids is not None and award_filter.min_points is None \
+            and award_filter.active_since is None and award_filter.city is None:
+        return sorted(set(award_filter.user_ids))
+
+    query = db.query(models.UserPointBalance.user_id)
+    if award_filter.user_ids is not None:
+        query = query.filter(models.UserPointBalance.user_id.in_(award_filter.user_ids))
+    if award_filter.min_points is not None:
+        query = query.filter(models.UserPointBalance.balance >= award_filter.min_points)
+    if award_filter.active_since is not None or award_filter.city is not None:
+        activity = db.query(models.UserDailyPoints.user_id).filter(
+            models.UserDailyPoints.user_id == models.UserPointBalance.user_id
+        )
+        if award_filter.active_since is not None:
+            activity = activity.filter(models.UserDailyPoints.day >= award_filter.active_since.date())
+        if award_filter.city is not None:
+            activity = activity.filter(models.UserDailyPoints.city == award_filter.city)
+        query = query.filter(activity.exists())
+    return [row[0] for row in query.order_by(models.UserPointBalance.user_id).all()]
+
+
+def create_bulk_award_job(
+    db: Session,
+    job_id: str,
+    total: int,
+    description: Optional[str],
+    created_by: Optional[int]
+) -> models.BulkAwardJob:
+    job = models.BulkAwardJob(
+        id=job_id,
+        status="pending",
+        total=total,
+        processed=0,
+        total_points=0,
+        description=description,
+        created_by=created_by
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_bulk_award_job(db: Session, job_id: str) -> Optional[models.BulkAwardJob]:
+    return db.query(models.BulkAwardJob).filter(models.BulkAwardJob.id == job_id).first()
+
+
 def get_user_total_points(db: Session, user_id: int) -> int:
-    """Calculate total points for a user"""
-    result = db.query(func.sum(models.PointTransaction.points)).filter(
-        models.PointTransaction.user_id == user_id
+    """Get a user's points balance from the materialized balance table"""
+    result = db.query(models.UserPointBalance.balance).filter(
+        models.UserPointBalance.user_id == user_id
     ).scalar()
     return result if result else 0
 
 
+def reconcile_point_balances(db: Session) -> List[dict]:
+    """
+    Verify every materialized balance against SUM(points) of the ledger
+    (plus compacted opening balances) and repair mismatches (including missing balance rows). Each repair locks
+    the balance row and recomputes the sum, so concurrent inserts are safe.
+    """
+    ledger = _ledger_totals().subquery()
+
+    ledger_mismatches = db.query(ledger.c.user_id).outerjoin(
+        models.UserPointBalance,
+        models.UserPointBalance.user_id == ledger.c.user_id,
+    ).filter(
+        or_(
+            models.UserPointBalance.user_id.is_(None),
+            models.UserPointBalance.balance != ledger.c.total,
+        )
+    )
+    orphan_balances = db.query(models.UserPointBalance.user_id).outerjoin(
+        ledger, ledger.c.user_id == models.UserPointBalance.user_id
+    ).filter(
+        ledger.c.user_id.is_(None),
+        models.UserPointBalance.balance != 0,
+    )
+    user_ids = {r[0] for r in ledger_mismatches.all()} | {r[0] for r in orphan_balances.all()}
+    db.rollback()
+
+    repaired = []
+    for uid in sorted(user_ids):
+        row = db.query(models.UserPointBalance).filter(
+            models.UserPointBalance.user_id == uid
+        ).with_for_update().first()
+        balance = row.balance if row else None
+        if row is None:
+            # A concurrent first write may create the row meanwhile; the
+            # upsert seeds it from the ledger, so ours is a no-op then.
+            _ensure_balance_row(db, uid)
+            row = db.query(models.UserPointBalance).filter(
+                models.UserPointBalance.user_id == uid
+            ).with_for_update().first()
+        expected = db.execute(select(_ledger_total(uid))).scalar()
+        if balance != expected:
+            repaired.append({"user_id": uid, "balance": balance, "ledger": expected})
+        if row.balance != expected:
+            row.balance = expected
+            row.updated_at = datetime.utcnow()
+        db.commit()
+
+    return repaired
+
+
 def get_user_transactions(
     db: Session,
     user_id: int,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None
 ) -> List[models.PointTransaction]:
-    """Get user's transaction history"""
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id
-    ).order_by(models.PointTransaction.created_at.desc()).offset(skip).limit(limit).all()
-
-
-def get_leaderboard(db: Session, limit: int = 100) -> List[dict]:
-    """Get top users by points"""
-    results = db.query(
-        models.PointTransaction.user_id,
-        func.sum(models.PointTransaction.points).label('total_points')
-    ).group_by(
-        models.PointTransaction.user_id
-    ).order_by(
-        func.sum(models.PointTransaction.points).desc()
-    ).limit(limit).all()
-    
-    leaderboard = []
-    for rank, (user_id, total_points) in enumerate(results, start=1):
-        leaderboard.append({
+    """
+    Get user's transaction history, newest first. Pass the created_at / id
+    of the last row seen as `before` / `before_id` to page by keyset: the
+    (user_id, created_at, id) index of each partition is read from the
+    cursor on, and partitions older than the page are not touched.
+    """
+    pt = models.PointTransaction
+    query = db.query(pt).filter(pt.user_id == user_id)
+    if before is not None:
+        if before_id is not None:
+            query = query.filter(or_(pt.created_at < before, and_(pt.created_at == before, pt.id < before_id)))
+        else:
+            query = query.filter(pt.created_at < before)
+    return query.order_by(pt.created_at.desc(), pt.id.desc()).offset(skip).limit(limit).all()
+
+
+# ── Ledger partitions and compaction ────────────────────────────────
+# point_transactions is range-partitioned by month (migration 006). Old
+# months are folded into ledger_opening_balances and detached; every ledger
+# sum adds the opening balance, so balances stay exact.
+LEDGER_PARTITION_MONTHS_AHEAD = int(os.getenv("LEDGER_PARTITION_MONTHS_AHEAD", "2"))
+LEDGER_RETENTION_MONTHS = int(os.getenv("LEDGER_RETENTION_MONTHS", "12"))  # 0 disables compaction
+LEDGER_DEFAULT_PARTITION = "point_transactions_default"
+LEDGER_MAINTENANCE_LOCK_KEY = 728003
+_PARTITION_NAME = re.compile(r"^point_transactions_y(\d{4})m(\d{2})$")
+
+
+def add_months(month: date, n: int) -> date:
+    """First day of the month `n` months after `month`"""
+    years, m = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, m + 1, 1)
+
+
+def transaction_partition_name(month: date) -> str:
+    return f"point_transactions_y{month:%Y}m{month:%m}"
+
+
+def is_ledger_partitioned(db: Session) -> bool:
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('point_transactions'))"
+    )).scalar()
+
+
+def list_transaction_partitions(db: Session) -> List[dict]:
+    """Attached monthly partitions, oldest first: [{name, start, end}]"""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('point_transactions')"
+    )).scalars().all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append({"name": name, "start": start, "end": add_months(start, 1)})
+    return sorted(partitions, key=lambda p: p["start"])
+
+
+def ensure_transaction_partitions(db: Session, months_ahead: int = LEDGER_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the default partition and monthly partitions up to `months_ahead`"""
+    if not is_ledger_partitioned(db):
+        db.rollback()
+        return []
+    db.execute(select(func.pg_advisory_xact_lock(LEDGER_MAINTENANCE_LOCK_KEY)))
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {LEDGER_DEFAULT_PARTITION} PARTITION OF point_transactions DEFAULT"
+    ))
+    existing = {p["name"] for p in list_transaction_partitions(db)}
+    current = datetime.utcnow().date().replace(day=1)
+    created = []
+    for i in range(months_ahead + 1):
+        start = add_months(current, i)
+        name = transaction_partition_name(start)
+        if name in existing:
+            continue
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF point_transactions "
+            f"FOR VALUES FROM ('{start}') TO ('{add_months(start, 1)}')"
+        ))
+        created.append(name)
+    db.commit()
+    return created
+
+
+def get_ledger_compacted_until(db: Session) -> Optional[datetime]:
+    """End of the newest compacted month; older transactions live only in opening balances"""
+    return db.query(func.max(models.LedgerCompaction.range_end)).scalar()
+
+
+def delete_archived_transactions(db: Session, user_id: int) -> int:
+    """Delete a user's rows from detached (not yet dropped) ledger partitions; caller commits"""
+    deleted = 0
+    names = db.query(models.LedgerCompaction.partition_name).all()
+    for (name,) in names:
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            continue
+        deleted += db.execute(text(f"DELETE FROM {name} WHERE user_id = :user_id"), {"user_id": user_id}).rowcount
+    return deleted
+
+
+def compact_ledger(db: Session, before: date) -> List[dict]:
+    """
+    Fold every monthly partition ending on or before `before` into the
+    opening balances and detach it, oldest first, one transaction per
+    partition. Detached tables keep their name and can be dumped and dropped.
+    """
+    if not is_ledger_partitioned(db):
+        db.rollback()
+        return []
+
+    compacted = []
+    for partition in list_transaction_partitions(db):
+        if partition["end"] > before:
+            break
+        name = partition["name"]
+        db.execute(select(func.pg_advisory_xact_lock(LEDGER_MAINTENANCE_LOCK_KEY)))
+        # Rows of this month in the default partition would be left behind
+        stray = db.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {LEDGER_DEFAULT_PARTITION} WHERE created_at < :end)"
+        ), {"end": partition["end"]}).scalar()
+        if stray:
+            db.rollback()
+            raise RuntimeError(f"{LEDGER_DEFAULT_PARTITION} holds rows before {partition['end']}; move them first")
+        # Block late inserts into the month while it is folded
+        db.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+
+        now = datetime.utcnow()
+        part = table(name, column("user_id"), column("points"), column("type"),
+                     column("category_id"), column("created_at"))
+        is_report = part.c.type.in_(REPORT_TRANSACTION_TYPES)
+        hour = extract("hour", part.c.created_at)
+        totals = select(
+            part.c.user_id,
+            func.sum(part.c.points),
+            func.sum(case((is_report, 1), else_=0)),
+            func.sum(case((part.c.type.in_(CONFIRM_TRANSACTION_TYPES), 1), else_=0)),
+            func.sum(case((and_(is_report, or_(hour >= NIGHT_START_HOUR, hour < NIGHT_END_HOUR)), 1), else_=0)),
+            literal(now),
+        ).group_by(part.c.user_id)
+        opening = models.LedgerOpeningBalance.__table__
+        counters = ("balance", "report_count", "confirm_count", "night_report_count")
+        stmt = pg_insert(opening).from_select(["user_id", *counters, "updated_at"], totals)
+        set_ = {c: opening.c[c] + stmt.excluded[c] for c in counters}
+        set_["updated_at"] = stmt.excluded.updated_at
+        user_count = db.execute(
+            stmt.on_conflict_do_update(index_elements=[opening.c.user_id], set_=set_)
+        ).rowcount
+
+        categories = select(
+            part.c.user_id, part.c.category_id, func.count()
+        ).where(is_report, part.c.category_id.isnot(None)).group_by(part.c.user_id, part.c.category_id)
+        opening_categories = models.LedgerOpeningCategoryReports.__table__
+        stmt = pg_insert(opening_categories).from_select(["user_id", "category_id", "report_count"], categories)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[opening_categories.c.user_id, opening_categories.c.category_id],
+            set_={"report_count": opening_categories.c.report_count + stmt.excluded.report_count},
+        ))
+
+        row_count = db.execute(select(func.count()).select_from(part)).scalar()
+        db.add(models.LedgerCompaction(
+            partition_name=name,
+            range_start=datetime.combine(partition["start"], datetime.min.time()),
+            range_end=datetime.combine(partition["end"], datetime.min.time()),
+            row_count=row_count,
+            user_count=user_count,
+            compacted_at=now,
+        ))
+        db.execute(text(f"ALTER TABLE point_transactions DETACH PARTITION {name}"))
+        db.commit()
+        compacted.append({"partition": name, "rows": row_count, "users": user_count})
+
+    return compacted
+
+
+# Arbitrary constant used as the advisory lock key for leaderboard rebuilds
+LEADERBOARD_LOCK_KEY = 728001
+
+
+def refresh_leaderboard(db: Session) -> Optional[int]:
+    """
+    Rebuild leaderboard_ranks from user_point_balances in one transaction.
+    Readers keep seeing the previous ranking until commit. Only one worker
+    rebuilds at a time; returns None if another worker holds the lock.
+    """
+    locked = db.execute(
+        select(func.pg_try_advisory_xact_lock(LEADERBOARD_LOCK_KEY))
+    ).scalar()
+    if not locked:
+        db.rollback()
+        return None
+
+    ranked = select(
+        func.row_number().over(
+            order_by=(models.UserPointBalance.balance.desc(), models.UserPointBalance.user_id)
+        ),
+        models.UserPointBalance.user_id,
+        models.UserPointBalance.balance,
+        literal(datetime.utcnow()),
+    )
+    db.query(models.LeaderboardRank).delete(synchronize_session=False)
+    result = db.execute(
+        insert(models.LeaderboardRank).from_select(
+            ["rank", "user_id", "total_points", "refreshed_at"], ranked
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _leaderboard_entry(row: models.LeaderboardRank) -> dict:
+    return {"user_id": row.user_id, "total_points": row.total_points, "rank": row.rank}
+
+
+def get_leaderboard(db: Session, limit: int = 100, offset: int = 0) -> List[dict]:
+    """Get a page of the precomputed leaderboard (rank range lookup on the PK)"""
+    rows = db.query(models.LeaderboardRank).filter(
+        models.LeaderboardRank.rank > offset,
+        models.LeaderboardRank.rank <= offset + limit,
+    ).order_by(models.LeaderboardRank.rank).all()
+    return [_leaderboard_entry(r) for r in rows]
+
+
+def get_leaderboard_size(db: Session) -> int:
+    """Number of ranked users (highest rank)"""
+    return db.query(func.max(models.LeaderboardRank.rank)).scalar() or 0
+
+
+def get_leaderboard_position(db: Session, user_id: int, radius: int = 5) -> dict:
+    """Get the user's rank and the entries directly above and below it"""
+    me = db.query(models.LeaderboardRank).filter(
+        models.LeaderboardRank.user_id == user_id
+    ).first()
+    if not me:
+        # Not ranked yet (no points or joined since the last refresh)
+        return {
             "user_id": user_id,
-            "total_points": total_points,
-            "rank": rank
-        })
-    
-    return leaderboard
+            "total_points": get_user_total_points(db, user_id),
+            "rank": None,
+            "total_ranked": get_leaderboard_size(db),
+            "neighbours": [],
+        }
+
+    neighbours = db.query(models.LeaderboardRank).filter(
+        models.LeaderboardRank.rank >= me.rank - radius,
+        models.LeaderboardRank.rank <= me.rank + radius,
+    ).order_by(models.LeaderboardRank.rank).all()
+    return {
+        "user_id": user_id,
+        "total_points": me.total_points,
+        "rank": me.rank,
+        "total_ranked": get_leaderboard_size(db),
+        "neighbours": [_leaderboard_entry(r) for r in neighbours],
+    }
+
+
+def get_window_start(window: str, now: Optional[datetime] = None) -> Optional[date]:
+    """First day (UTC) of the current calendar week / month; None for all-time"""
+    today = (now or datetime.utcnow()).date()
+    if window == "week":
+        return today - timedelta(days=today.weekday())
+    if window == "month":
+        return today.replace(day=1)
+    return None
 
 
-def get_confirmation_transaction(
+def get_windowed_leaderboard(
     db: Session,
-    user_id: int,
-    report_id: int
-) -> Optional[models.PointTransaction]:
-    """Check if user already confirmed this report"""
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.report_id == report_id,
-        models.PointTransaction.type == "REPORT_CONFIRMED"
-    ).first()
+    window: str,
+    city: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0
+) -> List[dict]:
+    """
+    Rank users by points earned within the window, optionally in one city.
+    Reads only user_daily_points (at most ~31 rows per active user).
+    """
+    total = func.sum(models.UserDailyPoints.points_earned)
+    query = db.query(models.UserDailyPoints.user_id, total.label("total_points"))
+    start = get_window_start(window)
+    if start:
+        query = query.filter(models.UserDailyPoints.day >= start)
+    if city is not None:
+        query = query.filter(models.UserDailyPoints.city == city)
+    results = query.group_by(
+        models.UserDailyPoints.user_id
+    ).having(total > 0).order_by(
+        total.desc(), models.UserDailyPoints.user_id
+    ).offset(offset).limit(limit).all()
+
+    return [
+        {"user_id": uid, "total_points": int(points), "rank": rank}
+        for rank, (uid, points) in enumerate(results, start=offset + 1)
+    ]
+
+
+def backfill_daily_rollups(db: Session, since: Optional[date] = None) -> int:
+    """
+    Rebuild user_daily_points from the ledger (all history, or from `since`).
+    The table lock blocks live rollup upserts until commit: transactions that
+    committed before are in the rebuilt sums, later ones add their delta after.
+    Days of compacted ledger months are kept as they are.
+    """
+    db.execute(text("LOCK TABLE user_daily_points IN SHARE ROW EXCLUSIVE MODE"))
+
+    compacted_until = get_ledger_compacted_until(db)
+    if compacted_until and (since is None or since < compacted_until.date()):
+        since = compacted_until.date()
+
+    pt = models.PointTransaction
+    day = cast(pt.created_at, Date)
+    rollup = db.query(models.UserDailyPoints)
+    ledger = select(
+        day,
+        pt.user_id,
+        func.coalesce(pt.city, ""),
+        func.sum(case((pt.points > 0, pt.points), else_=0)),
+        func.sum(case((pt.points < 0, -pt.points), else_=0)),
+        func.sum(case((pt.type.in_(REPORT_TRANSACTION_TYPES), 1), else_=0)),
+        func.sum(case((pt.type.in_(CONFIRM_TRANSACTION_TYPES), 1), else_=0)),
+    )
+    if since:
+        rollup = rollup.filter(models.UserDailyPoints.day >= since)
+        ledger = ledger.where(pt.created_at >= datetime.combine(since, datetime.min.time()))
+    ledger = ledger.group_by(day, pt.user_id, func.coalesce(pt.city, ""))
+
+    rollup.delete(synchronize_session=False)
+    result = db.execute(
+        insert(models.UserDailyPoints).from_select(
+            ["day", "user_id", "city", "points_earned", "points_spent", "report_count", "confirm_count"],
+            ledger,
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def backfill_user_stats(db: Session) -> int:
+    """
+    Rebuild user_stats and user_category_reports from the ledger under a
+    table lock (see backfill_daily_rollups). Night reports use the
+    transaction time, which is when legacy reports were created. Counts of
+    compacted ledger months come from the opening balances.
+    """
+    db.execute(text("LOCK TABLE user_stats, user_category_reports IN SHARE ROW EXCLUSIVE MODE"))
+
+    pt = models.PointTransaction
+    ob = models.LedgerOpeningBalance
+    oc = models.LedgerOpeningCategoryReports
+    is_report = pt.type.in_(REPORT_TRANSACTION_TYPES)
+    hour = extract("hour", pt.created_at)
+    live_stats = select(
+        pt.user_id.label("user_id"),
+        case((is_report, 1), else_=0).label("report_count"),
+        case((pt.type.in_(CONFIRM_TRANSACTION_TYPES), 1), else_=0).label("confirm_count"),
+        case((and_(is_report, or_(hour >= NIGHT_START_HOUR, hour < NIGHT_END_HOUR)), 1), else_=0).label("night_report_count"),
+    ).where(
+        pt.type.in_(REPORT_TRANSACTION_TYPES + CONFIRM_TRANSACTION_TYPES)
+    )
+    opening_stats = select(ob.user_id, ob.report_count, ob.confirm_count, ob.night_report_count).where(
+        or_(ob.report_count > 0, ob.confirm_count > 0)
+    )
+    entries = union_all(live_stats, opening_stats).subquery()
+    stats = select(
+        entries.c.user_id,
+        func.sum(entries.c.report_count),
+        func.sum(entries.c.confirm_count),
+        func.sum(entries.c.night_report_count),
+        literal(datetime.utcnow()),
+    ).group_by(entries.c.user_id)
+
+    live_categories = select(
+        pt.user_id.label("user_id"), pt.category_id.label("category_id"), literal(1).label("report_count")
+    ).where(is_report, pt.category_id.isnot(None))
+    opening_categories = select(oc.user_id, oc.category_id, oc.report_count)
+    entries = union_all(live_categories, opening_categories).subquery()
+    categories = select(
+        entries.c.user_id, entries.c.category_id, func.sum(entries.c.report_count)
+    ).group_by(entries.c.user_id, entries.c.category_id)
+
+    db.query(models.UserStats).delete(synchronize_session=False)
+    db.query(models.UserCategoryReports).delete(synchronize_session=False)
+    result = db.execute(insert(models.UserStats).from_select(
+        ["user_id", "report_count", "confirm_count", "night_report_count", "updated_at"], stats
+    ))
+    db.execute(insert(models.UserCategoryReports).from_select(
+        ["user_id", "category_id", "report_count"], categories
+    ))
+    db.commit()
+    return result.rowcount
+
+
+def claim_report_confirmation(db: Session, user_id: int, report_id: int) -> bool:
+    """
+    Record that the user confirmed the report (caller commits). Returns False
+    if they already had. Checked against report_confirmations rather than the
+    ledger, whose old REPORT_CONFIRMED rows are detached by compaction.
+    """
+    table = models.ReportConfirmation.__table__
+    stmt = pg_insert(table).values(
+        user_id=user_id, report_id=report_id, created_at=datetime.utcnow()
+    ).on_conflict_do_nothing(
+        index_elements=[table.c.user_id, table.c.report_id]
+    ).returning(table.c.user_id)
+    return db.execute(stmt).first() is not None
 
 
 # ── Achievement CRUD ─────────────────────────────────────────────────
@@ -93,6 +946,75 @@ def get_all_achievements(db: Session) -> List[models.Achievement]:
     ).order_by(models.Achievement.id).all()
 
 
+# ── Achievement / challenge catalog cache ───────────────────────────
+# The catalogs only change when admins seed or edit them. Every change bumps
+# catalog_versions (trigger, migration 005); workers compare that version at
+# most every CATALOG_VERSION_CHECK_SECONDS and reload on mismatch.
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "10"))
+CATALOG_VERSION_ID = 1
+_catalog = {"version": None, "checked_at": 0.0, "achievements": [], "challenges": []}
+_catalog_lock = threading.Lock()
+
+
+def get_catalog_version(db: Session) -> int:
+    version = db.query(models.CatalogVersion.version).filter(
+        models.CatalogVersion.id == CATALOG_VERSION_ID
+    ).scalar()
+    return version or 0
+
+
+def bump_catalog_version(db: Session) -> int:
+    """Signal a catalog edit to every worker (for edits made without the triggers)"""
+    table = models.CatalogVersion.__table__
+    stmt = pg_insert(table).values(id=CATALOG_VERSION_ID, version=1, updated_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+    ).returning(table.c.version)
+    version = db.execute(stmt).scalar()
+    db.commit()
+    with _catalog_lock:
+        _catalog["checked_at"] = 0.0
+    return version
+
+
+def _load_catalog(db: Session, version: int):
+    """Load active achievements and current + upcoming challenges as detached objects"""
+    achievements = get_all_achievements(db)
+    challenges = db.query(models.WeeklyChallenge).filter(
+        models.WeeklyChallenge.is_active == True,
+        models.WeeklyChallenge.week_end >= datetime.utcnow(),
+    ).order_by(models.WeeklyChallenge.id).all()
+    for obj in achievements + challenges:
+        db.expunge(obj)
+    with _catalog_lock:
+        _catalog.update(
+            version=version,
+            checked_at=time.monotonic(),
+            achievements=achievements,
+            challenges=challenges,
+        )
+
+
+def _get_catalog(db: Session) -> dict:
+    with _catalog_lock:
+        stale = time.monotonic() - _catalog["checked_at"] >= CATALOG_VERSION_CHECK_SECONDS
+    if stale:
+        version = get_catalog_version(db)
+        if version != _catalog["version"]:
+            _load_catalog(db, version)
+        else:
+            with _catalog_lock:
+                _catalog["checked_at"] = time.monotonic()
+    with _catalog_lock:
+        return dict(_catalog)
+
+
+def get_achievement_catalog(db: Session) -> List[models.Achievement]:
+    """Active achievements from the in-process catalog (detached objects)"""
+    return list(_get_catalog(db)["achievements"])
+
+
 def get_user_achievements(db: Session, user_id: int) -> List[models.UserAchievement]:
     """Get all achievements unlocked by a user"""
     return db.query(models.UserAchievement).filter(
@@ -108,6 +1030,16 @@ def get_user_achievement_ids(db: Session, user_id: int) -> set:
     return {r[0] for r in results}
 
 
+def get_user_unlock_map(db: Session, user_id: int) -> dict:
+    """Map of achievement_id -> unlocked_at for a user (one query)"""
+    return dict(db.query(
+        models.UserAchievement.achievement_id,
+        models.UserAchievement.unlocked_at,
+    ).filter(
+        models.UserAchievement.user_id == user_id
+    ).all())
+
+
 def unlock_achievement(db: Session, user_id: int, achievement_id: int) -> models.UserAchievement:
     """Unlock an achievement for a user"""
     ua = models.UserAchievement(user_id=user_id, achievement_id=achievement_id)
@@ -117,107 +1049,78 @@ def unlock_achievement(db: Session, user_id: int, achievement_id: int) -> models
     return ua
 
 
-def get_user_report_count(db: Session, user_id: int) -> int:
-    """Count reports created by user (from point transactions)"""
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type.in_(["REPORT_CREATED", "report_created"])
-    ).count()
-
-
-def get_user_confirm_count(db: Session, user_id: int) -> int:
-    """Count confirmations by user"""
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type == "REPORT_CONFIRMED"
-    ).count()
-
-
-def get_user_night_report_count(db: Session, user_id: int) -> int:
-    """Count reports created between 22:00 and 06:00"""
-    from sqlalchemy import extract
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type.in_(["REPORT_CREATED", "report_created"]),
-        (extract('hour', models.PointTransaction.created_at) >= 22) |
-        (extract('hour', models.PointTransaction.created_at) < 6)
-    ).count()
-
-
-def get_user_pothole_report_count(db: Session, user_id: int) -> int:
-    """Count pothole reports (category_id approximated via description/type)"""
-    # Since we store report_id, we count transactions with type REPORT_CREATED
-    # Pothole detection is done by checking description or separate tracking
-    # For now, count all reports as potential potholes (simplified)
-    return db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type.in_(["REPORT_CREATED", "report_created"]),
-        models.PointTransaction.description.ilike("%pothole%") |
-        models.PointTransaction.description.ilike("%حفرة%")
-    ).count()
+def get_user_stats(db: Session, user_id: int) -> dict:
+    """All achievement inputs for a user in one round-trip over the counter tables"""
+    def counter(column):
+        return select(column).where(models.UserStats.user_id == user_id).scalar_subquery()
+
+    pothole_count = select(
+        func.sum(models.UserCategoryReports.report_count)
+    ).where(
+        models.UserCategoryReports.user_id == user_id,
+        models.UserCategoryReports.category_id.in_(POTHOLE_CATEGORY_IDS),
+    ).scalar_subquery()
+    total_points = select(models.UserPointBalance.balance).where(
+        models.UserPointBalance.user_id == user_id
+    ).scalar_subquery()
+
+    row = db.execute(select(
+        counter(models.UserStats.report_count),
+        counter(models.UserStats.confirm_count),
+        counter(models.UserStats.night_report_count),
+        pothole_count,
+        total_points,
+    )).one()
+    keys = ("report_count", "confirm_count", "night_report", "pothole_count", "points_total")
+    return {key: value or 0 for key, value in zip(keys, row)}
 
 
 def check_and_unlock_achievements(db: Session, user_id: int) -> List[models.Achievement]:
-    """Check all achievements and unlock any newly earned ones"""
-    achievements = get_all_achievements(db)
+    """Check all achievements against the user's counters and unlock newly earned ones"""
+    achievements = get_achievement_catalog(db)
     already_unlocked = get_user_achievement_ids(db, user_id)
-    
-    # Gather user stats
-    report_count = get_user_report_count(db, user_id)
-    confirm_count = get_user_confirm_count(db, user_id)
-    night_count = get_user_night_report_count(db, user_id)
-    pothole_count = get_user_pothole_report_count(db, user_id)
-    total_points = get_user_total_points(db, user_id)
-    
-    newly_unlocked = []
-    
-    for achievement in achievements:
-        if achievement.id in already_unlocked:
-            continue
-        
-        earned = False
-        ct = achievement.condition_type
-        cv = achievement.condition_value
-        
-        if ct == "report_count" and report_count >= cv:
-            earned = True
-        elif ct == "confirm_count" and confirm_count >= cv:
-            earned = True
-        elif ct == "night_report" and night_count >= cv:
-            earned = True
-        elif ct == "pothole_count" and pothole_count >= cv:
-            earned = True
-        elif ct == "points_total" and total_points >= cv:
-            earned = True
-        
-        if earned:
-            unlock_achievement(db, user_id, achievement.id)
-            newly_unlocked.append(achievement)
-            
-            # Award bonus points if any
-            if achievement.points_reward > 0:
-                create_transaction(
-                    db=db,
-                    user_id=user_id,
-                    points=achievement.points_reward,
-                    transaction_type="achievement_bonus",
-                    report_id=None,
-                    description=f"Achievement unlocked: {achievement.name_en}"
-                )
-    
+    stats = get_user_stats(db, user_id)
+
+    # condition_type maps directly onto the counter names
+    newly_unlocked = [
+        a for a in achievements
+        if a.id not in already_unlocked
+        and a.condition_type in stats
+        and stats[a.condition_type] >= a.condition_value
+    ]
+    if not newly_unlocked:
+        return []
+
+    for achievement in newly_unlocked:
+        db.add(models.UserAchievement(user_id=user_id, achievement_id=achievement.id))
+        # Award bonus points if any
+        if achievement.points_reward > 0:
+            add_transaction(
+                db=db,
+                user_id=user_id,
+                points=achievement.points_reward,
+                transaction_type="achievement_bonus",
+                report_id=None,
+                description=f"Achievement unlocked: {achievement.name_en}"
+            )
+    db.commit()
+
     return newly_unlocked
 
 
 # ── Weekly Challenges CRUD ───────────────────────────────────────────
 
 def get_active_challenges(db: Session) -> List[models.WeeklyChallenge]:
-    """Get currently active weekly challenges"""
+    """
+    Get currently active weekly challenges from the catalog. Upcoming
+    challenges are cached too, so the active set follows week_start /
+    week_end boundaries without a reload.
+    """
     now = datetime.utcnow()
-    return db.query(models.WeeklyChallenge).filter(
-        models.WeeklyChallenge.is_active == True,
-        models.WeeklyChallenge.week_start <= now,
-        models.WeeklyChallenge.week_end >= now,
-    ).order_by(models.WeeklyChallenge.id).all()
+    return [
+        ch for ch in _get_catalog(db)["challenges"]
+        if ch.week_start <= now <= ch.week_end
+    ]
 
 
 def get_user_challenge_progress(db: Session, user_id: int, challenge_id: int) -> Optional[models.UserChallengeProgress]:
@@ -228,85 +1131,107 @@ def get_user_challenge_progress(db: Session, user_id: int, challenge_id: int) ->
     ).first()
 
 
-def get_or_create_progress(db: Session, user_id: int, challenge_id: int) -> models.UserChallengeProgress:
-    """Get or create challenge progress record"""
-    progress = get_user_challenge_progress(db, user_id, challenge_id)
-    if not progress:
-        progress = models.UserChallengeProgress(
-            user_id=user_id,
-            challenge_id=challenge_id,
-            current_value=0,
-            completed=False,
-        )
-        db.add(progress)
-        db.commit()
-        db.refresh(progress)
-    return progress
-
+def get_user_challenge_progress_map(
+    db: Session,
+    user_id: int,
+    challenge_ids: List[int]
+) -> dict:
+    """Get user's progress rows for several challenges in one query, keyed by challenge id"""
+    if not challenge_ids:
+        return {}
+    rows = db.query(models.UserChallengeProgress).filter(
+        models.UserChallengeProgress.user_id == user_id,
+        models.UserChallengeProgress.challenge_id.in_(challenge_ids),
+    ).all()
+    return {p.challenge_id: p for p in rows}
 
-def get_user_weekly_stats(db: Session, user_id: int, week_start: datetime, week_end: datetime) -> dict:
-    """Get user stats for a specific week period"""
-    report_count = db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type.in_(["REPORT_CREATED", "report_created"]),
-        models.PointTransaction.created_at >= week_start,
-        models.PointTransaction.created_at <= week_end,
-    ).count()
 
-    confirm_count = db.query(models.PointTransaction).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.type == "REPORT_CONFIRMED",
-        models.PointTransaction.created_at >= week_start,
-        models.PointTransaction.created_at <= week_end,
-    ).count()
+# Challenge condition_type -> aggregate computed per challenge window
+CHALLENGE_CONDITIONS = ("report_count", "confirm_count", "points_earned")
 
-    points_earned = db.query(func.coalesce(func.sum(models.PointTransaction.points), 0)).filter(
-        models.PointTransaction.user_id == user_id,
-        models.PointTransaction.points > 0,
-        models.PointTransaction.created_at >= week_start,
-        models.PointTransaction.created_at <= week_end,
-    ).scalar()
 
+def get_user_challenge_stats(
+    db: Session,
+    user_id: int,
+    challenges: List[models.WeeklyChallenge]
+) -> dict:
+    """
+    Aggregate the user's activity for every challenge window in a single
+    pass over their transactions. Returns {challenge_id: {condition: value}}.
+    """
+    if not challenges:
+        return {}
+    pt = models.PointTransaction
+    is_report = pt.type.in_(REPORT_TRANSACTION_TYPES)
+    is_confirm = pt.type.in_(CONFIRM_TRANSACTION_TYPES)
+
+    columns = []
+    for ch in challenges:
+        in_window = and_(pt.created_at >= ch.week_start, pt.created_at <= ch.week_end)
+        columns += [
+            func.coalesce(func.sum(case((and_(in_window, is_report), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((and_(in_window, is_confirm), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((and_(in_window, pt.points > 0), pt.points), else_=0)), 0),
+        ]
+
+    row = db.query(*columns).filter(
+        pt.user_id == user_id,
+        pt.created_at >= min(ch.week_start for ch in challenges),
+        pt.created_at <= max(ch.week_end for ch in challenges),
+    ).one()
+
+    n = len(CHALLENGE_CONDITIONS)
     return {
-        "report_count": report_count,
-        "confirm_count": confirm_count,
-        "points_earned": points_earned or 0,
+        ch.id: dict(zip(CHALLENGE_CONDITIONS, row[i * n:(i + 1) * n]))
+        for i, ch in enumerate(challenges)
     }
 
 
+# Arbitrary constant used with user_id as the advisory lock key for challenge evaluation
+CHALLENGE_LOCK_KEY = 728002
+
+
 def check_and_complete_challenges(db: Session, user_id: int) -> List[models.WeeklyChallenge]:
-    """Check active challenges and mark newly completed ones"""
+    """
+    Update progress for all active challenges and complete newly reached ones.
+    One aggregate query, one progress query and a single commit (including
+    bonus transactions). Evaluations for the same user are serialized.
+    """
     challenges = get_active_challenges(db)
-    newly_completed = []
+    if not challenges:
+        return []
 
-    for challenge in challenges:
-        progress = get_or_create_progress(db, user_id, challenge.id)
-        if progress.completed:
-            continue
+    db.execute(select(func.pg_advisory_xact_lock(CHALLENGE_LOCK_KEY, user_id)))
+    progress_map = get_user_challenge_progress_map(db, user_id, [ch.id for ch in challenges])
+    pending = [ch for ch in challenges if not (ch.id in progress_map and progress_map[ch.id].completed)]
+    if not pending:
+        db.rollback()
+        return []
 
-        # Get weekly stats
-        stats = get_user_weekly_stats(db, user_id, challenge.week_start, challenge.week_end)
-
-        # Determine current value based on condition type
-        current = 0
-        ct = challenge.condition_type
-        if ct == "report_count":
-            current = stats["report_count"]
-        elif ct == "confirm_count":
-            current = stats["confirm_count"]
-        elif ct == "points_earned":
-            current = stats["points_earned"]
+    stats = get_user_challenge_stats(db, user_id, pending)
+    newly_completed = []
 
-        # Update progress
+    for challenge in pending:
+        progress = progress_map.get(challenge.id)
+        if progress is None:
+            progress = models.UserChallengeProgress(
+                user_id=user_id,
+                challenge_id=challenge.id,
+                current_value=0,
+                completed=False,
+            )
+            db.add(progress)
+
+        current = stats[challenge.id].get(challenge.condition_type, 0)
         progress.current_value = current
-        if current >= challenge.target_value and not progress.completed:
+        if current >= challenge.target_value:
             progress.completed = True
             progress.completed_at = datetime.utcnow()
             newly_completed.append(challenge)
 
             # Award bonus points
             if challenge.bonus_points > 0:
-                create_transaction(
+                add_transaction(
                     db=db,
                     user_id=user_id,
                     points=challenge.bonus_points,
@@ -315,8 +1240,7 @@ def check_and_complete_challenges(db: Session, user_id: int) -> List[models.Week
                     description=f"Weekly challenge completed: {challenge.title_en}"
                 )
 
-        db.commit()
-
+    db.commit()
     return newly_completed
 
 
@@ -352,6 +1276,7 @@ def accept_friend_request(db: Session, friendship_id: int, user_id: int) -> Opti
         friendship.status = "accepted"
         db.commit()
         db.refresh(friendship)
+        invalidate_friend_cache(friendship.user_id, friendship.friend_id)
     return friendship
 
 
@@ -367,6 +1292,7 @@ def reject_friend_request(db: Session, friendship_id: int, user_id: int) -> Opti
     if friendship:
         db.delete(friendship)
         db.commit()
+        invalidate_friend_cache(friendship.user_id, friendship.friend_id)
     return friendship
 
 
@@ -388,41 +1314,80 @@ def get_pending_requests(db: Session, user_id: int) -> List[models.Friendship]:
     ).order_by(models.Friendship.created_at.desc()).all()
 
 
+# Accepted-friend adjacency cache: user_id -> (friendship version, friend ids).
+# Every friendship change bumps catalog_versions row 2 (trigger, migration
+# 008); workers compare that version at most every
+# FRIEND_VERSION_CHECK_SECONDS and drop all cached lists when it moves.
+# Entries are tagged with the version read before loading, so a load that
+# raced a change is discarded at the next check.
+FRIEND_VERSION_CHECK_SECONDS = float(os.getenv("FRIEND_VERSION_CHECK_SECONDS", "5"))
+FRIEND_CACHE_MAX_USERS = int(os.getenv("FRIEND_CACHE_MAX_USERS", "10000"))
+FRIENDSHIP_VERSION_ID = 2
+_friend_cache = {}
+_friend_version = {"version": None, "checked_at": 0.0}
+_friend_cache_lock = threading.Lock()
+
+
+def invalidate_friend_cache(*user_ids: int):
+    """Drop cached friend lists and re-check the version on the next read"""
+    with _friend_cache_lock:
+        for uid in user_ids:
+            _friend_cache.pop(uid, None)
+        _friend_version["checked_at"] = 0.0
+
+
+def _get_friendship_version(db: Session) -> int:
+    with _friend_cache_lock:
+        if time.monotonic() - _friend_version["checked_at"] < FRIEND_VERSION_CHECK_SECONDS:
+            return _friend_version["version"]
+    version = db.query(models.CatalogVersion.version).filter(
+        models.CatalogVersion.id == FRIENDSHIP_VERSION_ID
+    ).scalar() or 0
+    with _friend_cache_lock:
+        if version != _friend_version["version"]:
+            _friend_cache.clear()
+        _friend_version.update(version=version, checked_at=time.monotonic())
+    return version
+
+
 def get_friend_ids(db: Session, user_id: int) -> List[int]:
-    """Get list of friend user IDs"""
-    friendships = get_friends(db, user_id)
-    friend_ids = []
-    for f in friendships:
-        if f.user_id == user_id:
-            friend_ids.append(f.friend_id)
-        else:
-            friend_ids.append(f.user_id)
+    """Get list of friend user IDs (cached adjacency list)"""
+    version = _get_friendship_version(db)
+    with _friend_cache_lock:
+        cached = _friend_cache.get(user_id)
+    if cached and cached[0] == version:
+        return list(cached[1])
+
+    rows = db.query(models.Friendship.user_id, models.Friendship.friend_id).filter(
+        models.Friendship.status == "accepted",
+        or_(models.Friendship.user_id == user_id, models.Friendship.friend_id == user_id),
+    ).all()
+    friend_ids = [fid if uid == user_id else uid for uid, fid in rows]
+
+    with _friend_cache_lock:
+        # Not cached if the version moved (or was invalidated) during the load
+        if _friend_version["version"] == version and _friend_version["checked_at"]:
+            if len(_friend_cache) >= FRIEND_CACHE_MAX_USERS:
+                # Evict the oldest entry (dicts keep insertion order)
+                _friend_cache.pop(next(iter(_friend_cache)))
+            _friend_cache[user_id] = (version, tuple(friend_ids))
     return friend_ids
 
 
 def get_friend_leaderboard(db: Session, user_id: int) -> List[dict]:
-    """Get leaderboard only among friends (+ self)"""
-    friend_ids = get_friend_ids(db, user_id)
-    friend_ids.append(user_id)  # Include self
+    """Get leaderboard only among friends (+ self), from materialized balances"""
+    member_ids = set(get_friend_ids(db, user_id))
+    member_ids.add(user_id)  # Include self
 
-    results = db.query(
-        models.PointTransaction.user_id,
-        func.sum(models.PointTransaction.points).label("total_points"),
+    balances = dict(db.query(
+        models.UserPointBalance.user_id,
+        models.UserPointBalance.balance,
     ).filter(
-        models.PointTransaction.user_id.in_(friend_ids)
-    ).group_by(
-        models.PointTransaction.user_id
-    ).order_by(
-        func.sum(models.PointTransaction.points).desc()
-    ).all()
-
-    leaderboard = []
-    for rank, (uid, total_points) in enumerate(results, start=1):
-        leaderboard.append({
-            "user_id": uid,
-            "total_points": total_points or 0,
-            "rank": rank,
-        })
-
-    return leaderboard
-
+        models.UserPointBalance.user_id.in_(member_ids)
+    ).all())
+
+    ranked = sorted(member_ids, key=lambda uid: (-balances.get(uid, 0), uid))
+    return [
+        {"user_id": uid, "total_points": balances.get(uid, 0), "rank": rank}
+        for rank, uid in enumerate(ranked, start=1)
+    ]
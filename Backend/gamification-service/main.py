@@ -1,18 +1,20 @@
 import logging
 import os
 import threading
-from typing import Annotated, List
+from datetime import datetime
+from typing import Annotated, List, Optional
 
 import auth_client
 import crud
 import models
 import schemas
+from consumer_metrics import get_queue_stats, metrics
 from database import engine, get_db
-from fastapi import Depends, FastAPI, Header, HTTPException, status
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from json_logger import setup_logging
 from logging_middleware import RequestLoggingMiddleware
-from rabbitmq_consumer import start_consumer
+from rabbitmq_consumer import QUEUE_NAME, evaluate_challenges, start_consumer
 from rabbitmq_publisher import publish_event
 from sqlalchemy import text
 from sqlalchemy.orm import Session
@@ -42,6 +44,96 @@ logger = setup_logging("gamification")
 consumer_thread = threading.Thread(target=start_consumer, daemon=True)
 consumer_thread.start()
 
+# Interval for verifying user_point_balances against the ledger
+BALANCE_RECONCILE_INTERVAL_HOURS = float(os.getenv("BALANCE_RECONCILE_INTERVAL_HOURS", "6"))
+
+
+def periodic_balance_reconciliation():
+    """Verify materialized balances against the ledger on startup and then periodically"""
+    import time
+    from database import SessionLocal
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                repaired = crud.reconcile_point_balances(db)
+                if repaired:
+                    logger.warning(f"Balance reconciliation: repaired {len(repaired)} balances: {repaired[:20]}")
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Balance reconciliation error: {e}")
+        time.sleep(BALANCE_RECONCILE_INTERVAL_HOURS * 60 * 60)
+
+
+reconcile_thread = threading.Thread(target=periodic_balance_reconciliation, daemon=True)
+reconcile_thread.start()
+
+# How often leaderboard_ranks is rebuilt from the balance table
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60"))
+
+
+def periodic_leaderboard_refresh():
+    """Rebuild the precomputed leaderboard every LEADERBOARD_REFRESH_SECONDS"""
+    import time
+    from database import SessionLocal
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                crud.refresh_leaderboard(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Leaderboard refresh error: {e}")
+        time.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+
+leaderboard_thread = threading.Thread(target=periodic_leaderboard_refresh, daemon=True)
+leaderboard_thread.start()
+
+# Ledger partition upkeep: create upcoming months, compact old ones
+LEDGER_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("LEDGER_MAINTENANCE_INTERVAL_HOURS", "24"))
+
+
+def run_ledger_maintenance(db: Session):
+    created = crud.ensure_transaction_partitions(db)
+    if created:
+        logger.info(f"Created ledger partitions: {created}")
+    if crud.LEDGER_RETENTION_MONTHS > 0:
+        current = datetime.utcnow().date().replace(day=1)
+        before = crud.add_months(current, -crud.LEDGER_RETENTION_MONTHS)
+        for c in crud.compact_ledger(db, before):
+            logger.info(f"Compacted ledger partition {c['partition']}: {c['rows']} transactions, {c['users']} users")
+
+
+def periodic_ledger_maintenance():
+    """Keep point_transactions partitions ahead of time and compact expired months"""
+    import time
+    from database import SessionLocal
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                run_ledger_maintenance(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Ledger maintenance error: {e}")
+        time.sleep(LEDGER_MAINTENANCE_INTERVAL_HOURS * 60 * 60)
+
+
+# Partitions must exist before the first insert on a fresh database
+try:
+    from database import SessionLocal
+    with SessionLocal() as startup_db:
+        crud.ensure_transaction_partitions(startup_db)
+except Exception as e:
+    logger.error(f"Failed to create ledger partitions: {e}")
+
+ledger_thread = threading.Thread(target=periodic_ledger_maintenance, daemon=True)
+ledger_thread.start()
+
 
 @app.get("/health")
 def health_check():
@@ -110,6 +202,28 @@ async def get_current_user_id(authorization: Annotated[str, Header()]):
     return user["id"]
 
 
+async def get_current_admin_id(authorization: Annotated[str, Header()]):
+    """Verify token with auth service and require the ADMIN role"""
+    if not authorization.startswith("Bearer "):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authorization header"
+        )
+    token = authorization.replace("Bearer ", "")
+    user = await auth_client.verify_token(token)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    if user.get("role", "").upper() != "ADMIN":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admin can award points in bulk"
+        )
+    return user["id"]
+
+
 @app.get("/points/me", response_model=schemas.UserPoints)
 async def get_my_points(
     user_id: int = Depends(get_current_user_id),
@@ -133,12 +247,18 @@ async def get_user_points(
 @app.get("/transactions/me", response_model=List[schemas.PointTransaction])
 async def get_my_transactions(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Get current user's point transaction history"""
-    transactions = crud.get_user_transactions(db, user_id, skip, limit)
+    """
+    Get current user's point transaction history, newest first.
+    For the next page pass the created_at and id of the last item as
+    `before` and `before_id` instead of increasing `skip`.
+    """
+    transactions = crud.get_user_transactions(db, user_id, skip, limit, before=before, before_id=before_id)
     return transactions
 
 
@@ -181,33 +301,167 @@ async def award_points(
     except Exception as e:
         logger.error(f"Failed to publish points.transaction.created event: {e}")
     
+    evaluate_challenges(db, award.user_id)
+    
     return transaction
 
 
+# Batches above this size are processed in the background and return a job id
+BULK_AWARD_SYNC_LIMIT = int(os.getenv("BULK_AWARD_SYNC_LIMIT", "1000"))
+# Transactions per INSERT statement, commit and points.awarded.bulk event
+BULK_AWARD_CHUNK_SIZE = int(os.getenv("BULK_AWARD_CHUNK_SIZE", "5000"))
+
+
+def _award_bulk_chunk(db: Session, entries: List[schemas.BulkAwardEntry], job_id: Optional[str] = None) -> int:
+    """Award one chunk set-wise in a single transaction and publish one batched event"""
+    total_points = crud.bulk_add_transactions(db, entries)
+    if job_id:
+        job = crud.get_bulk_award_job(db, job_id)
+        job.processed += len(entries)
+        job.total_points += total_points
+    db.commit()
+
+    # One event per chunk replaces points.awarded + points.transaction.created per user
+    try:
+        publish_event("points.awarded.bulk", {
+            "job_id": job_id,
+            "transaction_type": "admin_award",
+            "awards": [
+                {"user_id": e.user_id, "points": e.points, "description": e.description}
+                for e in entries
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Failed to publish points.awarded.bulk event: {e}")
+
+    # Only points_earned challenges can be affected by an admin award
+    if any(ch.condition_type == "points_earned" for ch in crud.get_active_challenges(db)):
+        for uid in sorted({e.user_id for e in entries}):
+            evaluate_challenges(db, uid)
+    return total_points
+
+
+def run_bulk_award_job(job_id: str, entries: List[schemas.BulkAwardEntry]):
+    """Process a large bulk award chunk by chunk, recording progress on the job"""
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        job = crud.get_bulk_award_job(db, job_id)
+        job.status = "running"
+        db.commit()
+        for i in range(0, len(entries), BULK_AWARD_CHUNK_SIZE):
+            _award_bulk_chunk(db, entries[i:i + BULK_AWARD_CHUNK_SIZE], job_id)
+        job = crud.get_bulk_award_job(db, job_id)
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"Bulk award job {job_id}: awarded {job.total_points} points in {job.processed} transactions")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Bulk award job {job_id} failed: {e}")
+        job = crud.get_bulk_award_job(db, job_id)
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+
+
+@app.post("/points/award-bulk", response_model=schemas.BulkAwardResult)
+async def award_points_bulk(
+    award: schemas.BulkPointAward,
+    admin_id: int = Depends(get_current_admin_id),
+    db: Session = Depends(get_db)
+):
+    """
+    Award points to many users at once (admin only). Pass either explicit
+    entries or a filter plus per-user points. Batches larger than
+    BULK_AWARD_SYNC_LIMIT run in the background; poll the returned job id.
+    """
+    if (award.entries is None) == (award.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either entries or filter")
+
+    if award.filter is not None:
+        if award.points is None:
+            raise HTTPException(status_code=400, detail="points is required with filter")
+        if not award.filter.model_dump(exclude_none=True):
+            raise HTTPException(status_code=400, detail="filter must contain at least one criterion")
+        entries = [
+            schemas.BulkAwardEntry(user_id=uid, points=award.points, description=award.description)
+            for uid in crud.resolve_bulk_award_filter(db, award.filter)
+        ]
+    else:
+        entries = [
+            e if e.description is not None else e.model_copy(update={"description": award.description})
+            for e in award.entries
+        ]
+
+    if not entries:
+        return {"job_id": None, "status": "completed", "total": 0, "processed": 0, "total_points": 0}
+
+    if len(entries) > BULK_AWARD_SYNC_LIMIT:
+        import uuid
+        job = crud.create_bulk_award_job(db, str(uuid.uuid4()), len(entries), award.description, admin_id)
+        threading.Thread(target=run_bulk_award_job, args=(job.id, entries), daemon=True).start()
+        logger.info(f"Admin {admin_id} queued bulk award job {job.id} for {len(entries)} transactions")
+        return {"job_id": job.id, "status": job.status, "total": job.total, "processed": 0, "total_points": 0}
+
+    total_points = _award_bulk_chunk(db, entries)
+    logger.info(f"Admin {admin_id} awarded {total_points} points in {len(entries)} transactions")
+    return {
+        "job_id": None,
+        "status": "completed",
+        "total": len(entries),
+        "processed": len(entries),
+        "total_points": total_points,
+    }
+
+
+@app.get("/points/award-bulk/{job_id}", response_model=schemas.BulkAwardJob)
+async def get_bulk_award_job(
+    job_id: str,
+    admin_id: int = Depends(get_current_admin_id),
+    db: Session = Depends(get_db)
+):
+    """Get progress of a background bulk award job (admin only)"""
+    job = crud.get_bulk_award_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @app.post("/points/redeem", response_model=schemas.PointTransaction)
 async def redeem_points(
     redemption: schemas.PointRedemption,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Redeem points for coupons/rewards"""
-    # Check if user has enough points
-    total_points = crud.get_user_total_points(db, user_id)
-    if total_points < redemption.points:
+    """Redeem points for coupons/rewards (idempotent per `reference`)"""
+    if redemption.reference:
+        existing = crud.get_transaction_by_reference(db, user_id, redemption.reference, "redemption")
+        if existing:
+            return existing
+
+    # Conditional balance deduction + negative transaction in one DB transaction
+    transaction = crud.redeem_points(
+        db=db,
+        user_id=user_id,
+        points=redemption.points,
+        description=f"Redeemed for coupon {redemption.coupon_id}",
+        reference=redemption.reference
+    )
+    if not transaction:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Insufficient points"
         )
-    
-    # Create negative transaction for redemption
-    transaction = crud.create_transaction(
-        db=db,
-        user_id=user_id,
-        points=-redemption.points,
-        transaction_type="redemption",
-        report_id=None,
-        description=f"Redeemed for coupon {redemption.coupon_id}"
-    )
+    if transaction.type == crud.REDEMPTION_CANCELED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Redemption was already canceled"
+        )
     
     # Publish points.transaction.created to update auth-service total_points (negative points)
     try:
@@ -236,12 +490,30 @@ async def redeem_points(
 
 @app.get("/leaderboard", response_model=List[schemas.LeaderboardEntry])
 async def get_leaderboard(
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    window: str = Query("all", pattern="^(week|month|all)$"),
+    city: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get points leaderboard"""
-    leaderboard = crud.get_leaderboard(db, limit)
-    return leaderboard
+    """
+    Get points leaderboard.
+    window=all without city uses the precomputed balance ranking; week, month
+    and per-city boards rank points earned in the window from the daily rollups.
+    """
+    if window == "all" and city is None:
+        return crud.get_leaderboard(db, limit, offset)
+    return crud.get_windowed_leaderboard(db, window, city, limit, offset)
+
+
+@app.get("/leaderboard/me", response_model=schemas.LeaderboardPosition)
+async def get_my_leaderboard_position(
+    radius: int = Query(5, ge=0, le=50),
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's rank and the users ranked around them"""
+    return crud.get_leaderboard_position(db, user_id, radius)
 
 
 @app.post("/confirm-report/{report_id}")
@@ -251,9 +523,9 @@ async def confirm_report(
     db: Session = Depends(get_db)
 ):
     """Award 20 points for confirming a report exists"""
-    # Check if user already confirmed this report
-    existing_confirmation = crud.get_confirmation_transaction(db, user_id, report_id)
-    if existing_confirmation:
+    # Claim the (user, report) confirmation key; committed with the transaction
+    if not crud.claim_report_confirmation(db, user_id, report_id):
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You have already confirmed this report"
@@ -285,6 +557,8 @@ async def confirm_report(
     except Exception as e:
         logger.error(f"Failed to publish points.transaction.created event: {e}")
     
+    evaluate_challenges(db, user_id)
+    
     return {
         "points": CONFIRMATION_POINTS,
         "message": "Report confirmed successfully. You earned 20 points!",
@@ -302,7 +576,7 @@ async def get_all_achievements(
     db: Session = Depends(get_db)
 ):
     """Get all available achievements (public)"""
-    return crud.get_all_achievements(db)
+    return crud.get_achievement_catalog(db)
 
 
 @app.get("/achievements/my", response_model=List[schemas.AchievementWithStatus])
@@ -311,12 +585,8 @@ async def get_my_achievements(
     db: Session = Depends(get_db)
 ):
     """Get all achievements with user's unlock status"""
-    all_achievements = crud.get_all_achievements(db)
-    unlocked_ids = crud.get_user_achievement_ids(db, user_id)
-    
-    # Get unlock timestamps
-    user_achievements = crud.get_user_achievements(db, user_id)
-    unlock_map = {ua.achievement_id: ua.unlocked_at for ua in user_achievements}
+    all_achievements = crud.get_achievement_catalog(db)
+    unlock_map = crud.get_user_unlock_map(db, user_id)
     
     result = []
     for a in all_achievements:
@@ -336,7 +606,7 @@ async def get_my_achievements(
             points_reward=a.points_reward,
             is_active=a.is_active,
             created_at=a.created_at,
-            unlocked=a.id in unlocked_ids,
+            unlocked=a.id in unlock_map,
             unlocked_at=unlock_map.get(a.id),
         )
         result.append(data)
@@ -387,12 +657,17 @@ async def get_active_challenges(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Get all active weekly challenges with user progress"""
+    """
+    Get all active weekly challenges with user progress.
+    Read-only: progress is updated when transactions are ingested.
+    """
     challenges = crud.get_active_challenges(db)
+    progress_map = crud.get_user_challenge_progress_map(db, user_id, [ch.id for ch in challenges])
     result = []
     for ch in challenges:
-        progress = crud.get_or_create_progress(db, user_id, ch.id)
-        pct = min(100.0, (progress.current_value / ch.target_value * 100)) if ch.target_value > 0 else 0
+        progress = progress_map.get(ch.id)
+        current_value = progress.current_value if progress else 0
+        pct = min(100.0, (current_value / ch.target_value * 100)) if ch.target_value > 0 else 0
         result.append(schemas.ChallengeWithProgress(
             id=ch.id,
             title_en=ch.title_en,
@@ -409,9 +684,9 @@ async def get_active_challenges(
             week_end=ch.week_end,
             is_active=ch.is_active,
             created_at=ch.created_at,
-            current_value=progress.current_value,
-            completed=progress.completed,
-            completed_at=progress.completed_at,
+            current_value=current_value,
+            completed=progress.completed if progress else False,
+            completed_at=progress.completed_at if progress else None,
             progress_percent=round(pct, 1),
         ))
     return result
@@ -422,31 +697,13 @@ async def check_challenges(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Check and complete any weekly challenges"""
-    newly_completed = crud.check_and_complete_challenges(db, user_id)
-
-    # Publish events
-    for challenge in newly_completed:
-        try:
-            publish_event("challenge.completed", {
-                "user_id": user_id,
-                "challenge_id": challenge.id,
-                "challenge_title_en": challenge.title_en,
-                "bonus_points": challenge.bonus_points,
-            })
-        except Exception as e:
-            logger.error(f"Failed to publish challenge event: {e}")
-
-    if newly_completed:
-        logger.info(f"User {user_id} completed {len(newly_completed)} challenges")
+    """Check and complete any weekly challenges (also runs on every ingested transaction)"""
+    newly_completed = evaluate_challenges(db, user_id)
 
     # Get totals
     active = crud.get_active_challenges(db)
-    completed_count = 0
-    for ch in active:
-        prog = crud.get_user_challenge_progress(db, user_id, ch.id)
-        if prog and prog.completed:
-            completed_count += 1
+    progress_map = crud.get_user_challenge_progress_map(db, user_id, [ch.id for ch in active])
+    completed_count = sum(1 for p in progress_map.values() if p.completed)
 
     return {
         "completed_challenges": newly_completed,
@@ -558,6 +815,68 @@ def verify_internal_key(x_internal_key: str = Header(None)):
         raise HTTPException(status_code=403, detail="Invalid internal API key")
 
 
+@app.get("/internal/metrics")
+def get_consumer_metrics(_: None = Depends(verify_internal_key)):
+    """RabbitMQ consumer metrics of this worker plus the broker-side queue depth"""
+    return {
+        "service": "gamification",
+        "queue": get_queue_stats(QUEUE_NAME),
+        "consumer": metrics.snapshot(),
+    }
+
+
+@app.post("/internal/reconcile-balances")
+def reconcile_balances(
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_internal_key)
+):
+    """Verify user_point_balances against the ledger and repair mismatches"""
+    repaired = crud.reconcile_point_balances(db)
+    if repaired:
+        logger.warning(f"Balance reconciliation: repaired {len(repaired)} balances")
+    return {"repaired": len(repaired), "mismatches": repaired}
+
+
+@app.post("/internal/points/refund", response_model=Optional[schemas.PointTransaction])
+def refund_points(
+    refund: schemas.PointRefund,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_internal_key)
+):
+    """
+    Compensate a redemption made with `reference` (e.g. coupon reservation
+    failed after the points call). Returns null when nothing was deducted.
+    """
+    existing = crud.get_transaction_by_reference(db, refund.user_id, refund.reference, "redemption_refund")
+    transaction = crud.refund_redemption(db, refund.user_id, refund.reference)
+    if transaction and not existing:
+        try:
+            publish_event("points.transaction.created", {
+                "user_id": transaction.user_id,
+                "points": transaction.points,
+                "transaction_type": transaction.type,
+                "description": transaction.description
+            })
+        except Exception as e:
+            logger.error(f"Failed to publish points.transaction.created event for refund: {e}")
+        logger.info(f"Refunded {transaction.points} points to user {refund.user_id} for {refund.reference}")
+    return transaction
+
+
+@app.post("/internal/catalog/invalidate")
+def invalidate_catalog(
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_internal_key)
+):
+    """
+    Bump the achievement/challenge catalog version so every worker reloads.
+    Seeds and edits through SQL bump it automatically via trigger.
+    """
+    version = crud.bump_catalog_version(db)
+    logger.info(f"Catalog invalidated, now at version {version}")
+    return {"version": version}
+
+
 @app.delete("/internal/user-data/{user_id}")
 def delete_user_data(
     user_id: int,
@@ -565,6 +884,7 @@ def delete_user_data(
     _: None = Depends(verify_internal_key)
 ):
     """DSGVO Art. 17 — Delete all point transactions for a user"""
+    friend_ids = crud.get_friend_ids(db, user_id)
     count = db.query(models.PointTransaction).filter(
         models.PointTransaction.user_id == user_id
     ).delete()
@@ -577,7 +897,33 @@ def delete_user_data(
     count_ua = db.query(models.UserAchievement).filter(
         models.UserAchievement.user_id == user_id
     ).delete()
+    db.query(models.UserPointBalance).filter(
+        models.UserPointBalance.user_id == user_id
+    ).delete()
+    db.query(models.LeaderboardRank).filter(
+        models.LeaderboardRank.user_id == user_id
+    ).delete()
+    db.query(models.UserDailyPoints).filter(
+        models.UserDailyPoints.user_id == user_id
+    ).delete()
+    db.query(models.UserStats).filter(
+        models.UserStats.user_id == user_id
+    ).delete()
+    db.query(models.UserCategoryReports).filter(
+        models.UserCategoryReports.user_id == user_id
+    ).delete()
+    db.query(models.LedgerOpeningBalance).filter(
+        models.LedgerOpeningBalance.user_id == user_id
+    ).delete()
+    db.query(models.LedgerOpeningCategoryReports).filter(
+        models.LedgerOpeningCategoryReports.user_id == user_id
+    ).delete()
+    db.query(models.ReportConfirmation).filter(
+        models.ReportConfirmation.user_id == user_id
+    ).delete()
+    count += crud.delete_archived_transactions(db, user_id)
     db.commit()
+    crud.invalidate_friend_cache(user_id, *friend_ids)
 
     logger.info(f"DSGVO: Deleted {count} transactions, {count_cp} challenge progress, {count_fr} friendships, {count_ua} achievements for user {user_id}")
     return {"user_id": user_id, "deleted": {"point_transactions": count, "challenge_progress": count_cp, "friendships": count_fr, "achievements": count_ua}}
@@ -605,11 +951,29 @@ def export_user_data(
             "created_at": t.created_at.isoformat() if t.created_at else None,
         })
 
-    total_points = sum(t.points for t in transactions)
+    # Transactions of compacted ledger months are summarized in the opening balance
+    opening = db.query(models.LedgerOpeningBalance).filter(
+        models.LedgerOpeningBalance.user_id == user_id
+    ).first()
+    opening_balance = opening.balance if opening else 0
+    total_points = opening_balance + sum(t.points for t in transactions)
+
+    confirmations = db.query(models.ReportConfirmation).filter(
+        models.ReportConfirmation.user_id == user_id
+    ).order_by(models.ReportConfirmation.created_at.desc()).all()
+    confirmations_data = [
+        {
+            "report_id": c.report_id,
+            "created_at": c.created_at.isoformat() if c.created_at else None,
+        }
+        for c in confirmations
+    ]
 
     return {
         "service": "gamification",
         "user_id": user_id,
         "total_points": total_points,
+        "opening_balance": opening_balance,
         "transactions": transactions_data,
+        "report_confirmations": confirmations_data,
     }
\ No newline at end of file
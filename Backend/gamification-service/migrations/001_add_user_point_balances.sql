@@ -0,0 +1,19 @@
+-- Migration: Materialized per-user points balance
+-- Date: 2026-10-19
+-- Purpose: Replace SUM(points) over point_transactions on every balance read
+
+CREATE TABLE IF NOT EXISTS user_point_balances (
+    user_id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Backfill from the ledger (existing rows are recomputed)
+INSERT INTO user_point_balances (user_id, balance, updated_at)
+SELECT user_id, COALESCE(SUM(points), 0), CURRENT_TIMESTAMP
+FROM point_transactions
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE
+SET balance = EXCLUDED.balance, updated_at = EXCLUDED.updated_at;
+
+COMMENT ON TABLE user_point_balances IS 'Per-user points balance, updated in the same transaction as each point_transactions insert';
@@ -0,0 +1,24 @@
+-- Migration: Daily per-user points rollups for time-windowed leaderboards
+-- Date: 2026-10-19
+-- Purpose: Weekly / monthly / per-city leaderboards without aggregating point_transactions
+
+ALTER TABLE point_transactions
+ADD COLUMN IF NOT EXISTS city VARCHAR(100);
+
+CREATE TABLE IF NOT EXISTS user_daily_points (
+    day DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    city VARCHAR(100) NOT NULL DEFAULT '',
+    points_earned INTEGER NOT NULL DEFAULT 0,
+    points_spent INTEGER NOT NULL DEFAULT 0,
+    report_count INTEGER NOT NULL DEFAULT 0,
+    confirm_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, city)
+);
+
+CREATE INDEX IF NOT EXISTS ix_user_daily_points_day ON user_daily_points(day);
+CREATE INDEX IF NOT EXISTS ix_user_daily_points_user_id ON user_daily_points(user_id);
+
+-- Existing history: run `python backfill_rollups.py` inside the gamification container
+
+COMMENT ON TABLE user_daily_points IS 'Per-user daily rollup of point_transactions, maintained with each transaction insert';
@@ -0,0 +1,26 @@
+-- Migration: Incremental per-user counters for achievement evaluation
+-- Date: 2026-10-19
+-- Purpose: Replace per-check COUNT/SUM queries over point_transactions
+
+ALTER TABLE point_transactions
+ADD COLUMN IF NOT EXISTS category_id INTEGER;
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    report_count INTEGER NOT NULL DEFAULT 0,
+    confirm_count INTEGER NOT NULL DEFAULT 0,
+    night_report_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_category_reports (
+    user_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    report_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category_id)
+);
+
+-- Existing history: run `python backfill_rollups.py` inside the gamification container
+
+COMMENT ON TABLE user_stats IS 'Per-user report/confirmation/night-report counters for achievements';
+COMMENT ON TABLE user_category_reports IS 'Per-user report counts by category_id carried on report.created';
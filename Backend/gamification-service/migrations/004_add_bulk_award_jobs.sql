@@ -0,0 +1,20 @@
+-- Migration: Background jobs for bulk points awards
+-- Date: 2026-10-19
+-- Purpose: Track progress of large /points/award-bulk batches
+
+CREATE TABLE IF NOT EXISTS bulk_award_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    total_points INTEGER NOT NULL DEFAULT 0,
+    description TEXT,
+    error TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_bulk_award_jobs_created_at ON bulk_award_jobs (created_at);
+
+COMMENT ON TABLE bulk_award_jobs IS 'Status of bulk point awards processed in the background';
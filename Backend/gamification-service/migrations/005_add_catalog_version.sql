@@ -0,0 +1,34 @@
+-- Migration: Version counter for the achievement / challenge catalog cache
+-- Date: 2026-10-19
+-- Purpose: Let gamification workers cache catalogs and reload only after an edit
+
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO catalog_versions (id, version) VALUES (1, 1)
+ON CONFLICT (id) DO NOTHING;
+
+-- Any write to the catalogs (seed scripts, manual admin edits) bumps the version
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE catalog_versions
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_achievements_catalog_version ON achievements;
+CREATE TRIGGER trg_achievements_catalog_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON achievements
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+DROP TRIGGER IF EXISTS trg_weekly_challenges_catalog_version ON weekly_challenges;
+CREATE TRIGGER trg_weekly_challenges_catalog_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON weekly_challenges
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+COMMENT ON TABLE catalog_versions IS 'Bumped on every achievements / weekly_challenges change; gamification workers reload their catalog cache when it moves';
@@ -0,0 +1,98 @@
+-- Migration: Monthly range partitioning of point_transactions + ledger compaction tables
+-- Date: 2026-10-19
+-- Purpose: Keep the ledger's hot set small; old months are folded into
+--          per-user opening balances and detached for archiving
+--
+-- Rewrites point_transactions; run in a maintenance window (the table is
+-- locked for the duration of the copy).
+
+BEGIN;
+
+LOCK TABLE point_transactions IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE point_transactions RENAME TO point_transactions_unpartitioned;
+ALTER INDEX IF EXISTS point_transactions_pkey RENAME TO point_transactions_unpartitioned_pkey;
+ALTER INDEX IF EXISTS ix_point_transactions_id RENAME TO ix_point_transactions_unpartitioned_id;
+ALTER INDEX IF EXISTS ix_point_transactions_user_id RENAME TO ix_point_transactions_unpartitioned_user_id;
+ALTER INDEX IF EXISTS ix_point_transactions_created_at RENAME TO ix_point_transactions_unpartitioned_created_at;
+
+CREATE TABLE point_transactions (
+    id INTEGER NOT NULL DEFAULT nextval('point_transactions_id_seq'),
+    user_id INTEGER NOT NULL,
+    report_id INTEGER,
+    type VARCHAR(50) NOT NULL,
+    points INTEGER NOT NULL,
+    description TEXT,
+    city VARCHAR(100),
+    category_id INTEGER,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Keep the id sequence when the old table is dropped
+ALTER SEQUENCE point_transactions_id_seq OWNED BY point_transactions.id;
+
+CREATE INDEX ix_point_transactions_id ON point_transactions (id);
+CREATE INDEX ix_point_transactions_user_id ON point_transactions (user_id);
+CREATE INDEX ix_point_transactions_created_at ON point_transactions (created_at);
+CREATE INDEX ix_point_transactions_user_created ON point_transactions (user_id, created_at DESC, id DESC);
+
+-- Safety net for rows outside the pre-created months (kept empty by the service)
+CREATE TABLE point_transactions_default PARTITION OF point_transactions DEFAULT;
+
+-- One partition per month from the oldest transaction to two months ahead
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    SELECT date_trunc('month', COALESCE(MIN(created_at), CURRENT_TIMESTAMP))::date
+    INTO m FROM point_transactions_unpartitioned;
+    WHILE m <= (date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months')::date LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF point_transactions FOR VALUES FROM (%L) TO (%L)',
+            'point_transactions_y' || to_char(m, 'YYYY') || 'm' || to_char(m, 'MM'),
+            m, (m + INTERVAL '1 month')::date
+        );
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO point_transactions (id, user_id, report_id, type, points, description, city, category_id, created_at)
+SELECT id, user_id, report_id, type, points, description, city, category_id, created_at
+FROM point_transactions_unpartitioned;
+
+DROP TABLE point_transactions_unpartitioned;
+
+-- Totals of compacted (detached) partitions
+CREATE TABLE IF NOT EXISTS ledger_opening_balances (
+    user_id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL DEFAULT 0,
+    report_count INTEGER NOT NULL DEFAULT 0,
+    confirm_count INTEGER NOT NULL DEFAULT 0,
+    night_report_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ledger_opening_category_reports (
+    user_id INTEGER NOT NULL,
+    category_id INTEGER NOT NULL,
+    report_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS ledger_compactions (
+    id SERIAL PRIMARY KEY,
+    partition_name VARCHAR(63) NOT NULL UNIQUE,
+    range_start TIMESTAMP NOT NULL,
+    range_end TIMESTAMP NOT NULL,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    user_count INTEGER NOT NULL DEFAULT 0,
+    compacted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_ledger_compactions_range_end ON ledger_compactions (range_end);
+
+COMMENT ON TABLE point_transactions IS 'Points ledger, partitioned by month on created_at';
+COMMENT ON TABLE ledger_opening_balances IS 'Per-user totals of ledger months compacted out of point_transactions';
+
+COMMIT;
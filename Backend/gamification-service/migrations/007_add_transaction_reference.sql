@@ -0,0 +1,8 @@
+-- Migration: Idempotency reference on point transactions
+-- Date: 2026-10-19
+-- Purpose: Let coupons-service retry / compensate point redemptions safely
+
+ALTER TABLE point_transactions
+ADD COLUMN IF NOT EXISTS reference VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS ix_point_transactions_reference ON point_transactions (reference);
@@ -0,0 +1,24 @@
+-- Migration: Version counter for the friend-list cache
+-- Date: 2026-10-19
+-- Purpose: Let every gamification worker drop cached friend lists after a
+--          friendship is accepted or removed, not only the worker that wrote it
+--
+-- Reuses catalog_versions (migration 005): row 2 versions the friend graph.
+
+INSERT INTO catalog_versions (id, version) VALUES (2, 1)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_friendship_version() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO catalog_versions (id, version, updated_at)
+    VALUES (2, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE
+    SET version = catalog_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_friendships_version ON friendships;
+CREATE TRIGGER trg_friendships_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON friendships
+FOR EACH STATEMENT EXECUTE FUNCTION bump_friendship_version();
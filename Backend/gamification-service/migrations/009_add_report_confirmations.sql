@@ -0,0 +1,41 @@
+-- Migration: Per-(user, report) confirmation keys
+-- Date: 2026-10-19
+-- Purpose: Reject duplicate report confirmations even after the ledger month
+--          holding the original REPORT_CONFIRMED row has been compacted
+
+CREATE TABLE IF NOT EXISTS report_confirmations (
+    user_id INTEGER NOT NULL,
+    report_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, report_id)
+);
+
+-- Backfill from the live ledger
+INSERT INTO report_confirmations (user_id, report_id, created_at)
+SELECT user_id, report_id, MIN(created_at)
+FROM point_transactions
+WHERE type = 'REPORT_CONFIRMED' AND report_id IS NOT NULL
+GROUP BY user_id, report_id
+ON CONFLICT (user_id, report_id) DO NOTHING;
+
+-- ... and from compacted months still held in detached (not yet dropped) partitions
+DO $$
+DECLARE
+    name TEXT;
+BEGIN
+    FOR name IN SELECT partition_name FROM ledger_compactions LOOP
+        IF to_regclass(name) IS NULL THEN
+            CONTINUE;
+        END IF;
+        EXECUTE format(
+            'INSERT INTO report_confirmations (user_id, report_id, created_at) '
+            'SELECT user_id, report_id, MIN(created_at) FROM %I '
+            'WHERE type = ''REPORT_CONFIRMED'' AND report_id IS NOT NULL '
+            'GROUP BY user_id, report_id '
+            'ON CONFLICT (user_id, report_id) DO NOTHING',
+            name
+        );
+    END LOOP;
+END $$;
+
+COMMENT ON TABLE report_confirmations IS 'Who confirmed which report; survives ledger compaction';
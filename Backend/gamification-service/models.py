@@ -1,20 +1,125 @@
 from datetime import datetime
 
 from database import Base
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 
 
 class PointTransaction(Base):
+    """Append-only ledger, range-partitioned by month on created_at (see migration 006)"""
     __tablename__ = "point_transactions"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
     report_id = Column(Integer, nullable=True)  # Foreign key to reports if applicable
     type = Column(String(50), nullable=False)  # REPORT_CREATED, CONFIRMATION, REDEMPTION, etc.
     points = Column(Integer, nullable=False)  # Positive for earning, negative for spending
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    city = Column(String(100), nullable=True)  # From the originating event, for per-city leaderboards
+    category_id = Column(Integer, nullable=True)  # Report category from report.created
+    reference = Column(String(64), nullable=True, index=True)  # Caller's idempotency key (coupon redemptions)
+    # Part of the primary key because Postgres requires the partition key in it
+    created_at = Column(DateTime, default=datetime.utcnow, primary_key=True, index=True, nullable=False)
+
+    __table_args__ = (
+        Index("ix_point_transactions_user_created", "user_id", created_at.desc(), id.desc()),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class LedgerOpeningBalance(Base):
+    """Per-user totals of all compacted (detached) ledger partitions"""
+    __tablename__ = "ledger_opening_balances"
+
+    user_id = Column(Integer, primary_key=True)
+    balance = Column(Integer, nullable=False, default=0)
+    report_count = Column(Integer, nullable=False, default=0)
+    confirm_count = Column(Integer, nullable=False, default=0)
+    night_report_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class LedgerOpeningCategoryReports(Base):
+    """Per-user, per-category report counts of compacted ledger partitions"""
+    __tablename__ = "ledger_opening_category_reports"
+
+    user_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    report_count = Column(Integer, nullable=False, default=0)
+
+
+class LedgerCompaction(Base):
+    """One row per monthly partition folded into the opening balances and detached"""
+    __tablename__ = "ledger_compactions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    partition_name = Column(String(63), nullable=False, unique=True)
+    range_start = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False, index=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    user_count = Column(Integer, nullable=False, default=0)
+    compacted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ReportConfirmation(Base):
+    """One row per (user, report) confirmation; kept when ledger months are compacted"""
+    __tablename__ = "report_confirmations"
+
+    user_id = Column(Integer, primary_key=True)
+    report_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserPointBalance(Base):
+    """Materialized SUM(points) per user, kept in step with point_transactions"""
+    __tablename__ = "user_point_balances"
+
+    user_id = Column(Integer, primary_key=True)
+    balance = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class LeaderboardRank(Base):
+    """Precomputed global ranking, rebuilt from user_point_balances on a short schedule"""
+    __tablename__ = "leaderboard_ranks"
+
+    rank = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, nullable=False, unique=True, index=True)
+    total_points = Column(Integer, nullable=False)
+    refreshed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserDailyPoints(Base):
+    """Per-user daily rollup of point_transactions for time-windowed leaderboards"""
+    __tablename__ = "user_daily_points"
+
+    day = Column(Date, primary_key=True, index=True)
+    user_id = Column(Integer, primary_key=True, index=True)
+    city = Column(String(100), primary_key=True, default="")  # "" when the event carried no city
+    points_earned = Column(Integer, nullable=False, default=0)
+    points_spent = Column(Integer, nullable=False, default=0)
+    report_count = Column(Integer, nullable=False, default=0)
+    confirm_count = Column(Integer, nullable=False, default=0)
+
+
+class UserStats(Base):
+    """Per-user activity counters, maintained with each transaction insert"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    report_count = Column(Integer, nullable=False, default=0)
+    confirm_count = Column(Integer, nullable=False, default=0)
+    night_report_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserCategoryReports(Base):
+    """Per-user report count per reporting-service category"""
+    __tablename__ = "user_category_reports"
+
+    user_id = Column(Integer, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    report_count = Column(Integer, nullable=False, default=0)
 
 
 class Achievement(Base):
@@ -50,6 +155,15 @@ class UserAchievement(Base):
     achievement = relationship("Achievement", back_populates="user_achievements")
 
 
+class CatalogVersion(Base):
+    """Cache version counters bumped by triggers: row 1 for achievements / challenges, row 2 for friendships"""
+    __tablename__ = "catalog_versions"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 # ── Weekly Challenges ────────────────────────────────────────────────
 
 class WeeklyChallenge(Base):
@@ -92,6 +206,22 @@ class UserChallengeProgress(Base):
     )
 
 
+class BulkAwardJob(Base):
+    """Progress of a large /points/award-bulk batch processed in the background"""
+    __tablename__ = "bulk_award_jobs"
+
+    id = Column(String(36), primary_key=True)  # uuid4
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    total_points = Column(Integer, nullable=False, default=0)
+    description = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_by = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
 # ── Friends / Social ────────────────────────────────────────────────
 
 class Friendship(Base):
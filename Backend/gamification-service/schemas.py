@@ -28,9 +28,59 @@ class PointAward(BaseModel):
     description: Optional[str] = None
 
 
+class BulkAwardEntry(BaseModel):
+    user_id: int
+    points: int
+    description: Optional[str] = None
+
+
+class BulkAwardFilter(BaseModel):
+    """Select recipients from gamification data instead of listing them"""
+    user_ids: Optional[List[int]] = None
+    min_points: Optional[int] = None
+    active_since: Optional[datetime] = None
+    city: Optional[str] = None
+
+
+class BulkPointAward(BaseModel):
+    entries: Optional[List[BulkAwardEntry]] = None
+    filter: Optional[BulkAwardFilter] = None
+    points: Optional[int] = None  # Per user, required with filter
+    description: Optional[str] = None
+
+
+class BulkAwardResult(BaseModel):
+    job_id: Optional[str] = None
+    status: str
+    total: int
+    processed: int
+    total_points: int
+
+
+class BulkAwardJob(BaseModel):
+    id: str
+    status: str
+    total: int
+    processed: int
+    total_points: int
+    description: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class PointRedemption(BaseModel):
     points: int
     coupon_id: int
+    reference: Optional[str] = None  # Idempotency key, e.g. "coupon-redemption:42"
+
+
+class PointRefund(BaseModel):
+    user_id: int
+    reference: str
 
 
 class LeaderboardEntry(BaseModel):
@@ -42,6 +92,15 @@ class LeaderboardEntry(BaseModel):
         from_attributes = True
 
 
+class LeaderboardPosition(BaseModel):
+    """Caller's rank with the surrounding leaderboard entries"""
+    user_id: int
+    total_points: int
+    rank: Optional[int] = None
+    total_ranked: int = 0
+    neighbours: List[LeaderboardEntry] = []
+
+
 # ── Achievement Schemas ──────────────────────────────────────────────
 
 class AchievementBase(BaseModel):
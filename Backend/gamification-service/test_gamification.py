@@ -34,6 +34,20 @@ class TestGamificationService:
         response = client.get("/leaderboard/", params=params, headers=headers)
         assert response.status_code in [200, 401]
     
+    def test_get_windowed_leaderboard(self):
+        """Test weekly/monthly leaderboards and window validation"""
+        for window in ["week", "month", "all"]:
+            response = client.get("/leaderboard", params={"window": window, "limit": 10})
+            assert response.status_code == 200
+        response = client.get("/leaderboard", params={"window": "year"})
+        assert response.status_code == 422
+
+    def test_get_my_leaderboard_position(self):
+        """Test getting own rank with neighbours"""
+        headers = {"Authorization": "Bearer mock_token"}
+        response = client.get("/leaderboard/me", params={"radius": 3}, headers=headers)
+        assert response.status_code in [200, 401]
+
     def test_add_points(self):
         """Test awarding points to user"""
         headers = {"Authorization": "Bearer mock_token"}
@@ -44,7 +58,23 @@ class TestGamificationService:
         }
         response = client.post("/points/award", json=points_data, headers=headers)
         assert response.status_code in [200, 401, 422]
-    
+
+    def test_award_points_bulk(self):
+        """Test bulk awarding points (admin only)"""
+        headers = {"Authorization": "Bearer mock_token"}
+        bulk_data = {
+            "entries": [
+                {"user_id": 1, "points": 10},
+                {"user_id": 2, "points": 10}
+            ],
+            "description": "Campaign bonus"
+        }
+        response = client.post("/points/award-bulk", json=bulk_data, headers=headers)
+        assert response.status_code in [200, 401, 403]
+
+        response = client.get("/points/award-bulk/unknown-job", headers=headers)
+        assert response.status_code in [401, 403, 404]
+
     def test_redeem_points(self):
         """Test redeeming points"""
         headers = {"Authorization": "Bearer mock_token"}
@@ -55,6 +85,30 @@ class TestGamificationService:
         response = client.post("/points/redeem", json=points_data, headers=headers)
         assert response.status_code in [200, 400, 401, 422]
 
+    def test_internal_metrics(self):
+        """Test consumer metrics endpoint requires the internal key"""
+        response = client.get("/internal/metrics")
+        assert response.status_code == 403
+
+        headers = {"X-Internal-Key": "test-internal-key"}
+        response = client.get("/internal/metrics", headers=headers)
+        assert response.status_code in [200, 403]
+        if response.status_code == 200:
+            data = response.json()
+            assert data["service"] == "gamification"
+            assert "in_flight" in data["consumer"]
+
+    def test_catalog_invalidate(self):
+        """Test catalog invalidation requires the internal key and keeps achievements served"""
+        response = client.post("/internal/catalog/invalidate")
+        assert response.status_code == 403
+
+        headers = {"X-Internal-Key": "test-internal-key"}
+        response = client.post("/internal/catalog/invalidate", headers=headers)
+        assert response.status_code in [200, 403]
+        response = client.get("/achievements")
+        assert response.status_code == 200
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
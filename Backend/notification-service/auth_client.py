@@ -1,12 +1,14 @@
+import json
 import logging
 import os
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 import httpx
 
 logger = logging.getLogger(__name__)
 
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "kashif-internal-secret-2026")
 
 
 async def verify_token(token: str):
@@ -28,26 +30,55 @@ async def verify_token(token: str):
         return None
 
 
-async def get_users_by_role(token: str, role: Optional[str] = None) -> List[dict]:
-    """Get users from auth service, optionally filtered by role"""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{AUTH_SERVICE_URL}/users",
-                headers={"Authorization": f"Bearer {token}"},
-                params={"skip": 0, "limit": 10000}
-            )
-            
-            if response.status_code == 200:
-                users = response.json()
-                if role:
-                    # Filter users by role
-                    users = [u for u in users if u.get("role", "").upper() == role.upper()]
-                return users
-            else:
-                logger.error(f"Failed to get users: {response.status_code}")
-                return []
-                
-    except Exception as e:
-        logger.error(f"Failed to get users from auth service: {e}")
-        return []
+def _recipient_params(role: Optional[str], filters: dict) -> dict:
+    params = {"status": "ACTIVE"}
+    if role:
+        params["role"] = role
+    params.update({key: value for key, value in filters.items() if value is not None})
+    return params
+
+
+async def count_recipients(role: Optional[str] = None, after_id: int = 0, **filters) -> int:
+    """Number of active users iter_recipient_ids would yield; raises on errors"""
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(
+            f"{AUTH_SERVICE_URL}/internal/user-ids/count",
+            headers={"X-Internal-Key": INTERNAL_API_KEY},
+            params={"after_id": after_id, **_recipient_params(role, filters)}
+        )
+        response.raise_for_status()
+        return response.json()["count"]
+
+
+async def iter_recipient_ids(
+    role: Optional[str] = None,
+    page_size: int = 1000,
+    after_id: int = 0,
+    **filters
+) -> AsyncIterator[List[int]]:
+    """
+    Yield pages of active user ids above `after_id` from auth service's
+    internal NDJSON id stream (filtered in SQL there, paged by id). Extra
+    filters: is_verified, city, language. Raises on errors so callers never
+    mistake a failure for the end of the list.
+    """
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        while True:
+            params = {"after_id": after_id, "limit": page_size, **_recipient_params(role, filters)}
+            user_ids = []
+            async with client.stream(
+                "GET",
+                f"{AUTH_SERVICE_URL}/internal/user-ids",
+                headers={"X-Internal-Key": INTERNAL_API_KEY},
+                params=params
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        user_ids.append(json.loads(line)["id"])
+            if not user_ids:
+                return
+            yield user_ids
+            if len(user_ids) < page_size:
+                return
+            after_id = user_ids[-1]
@@ -0,0 +1,204 @@
+"""
+Per-user push coalescing.
+
+Activity events that arrive close together for one user (report received,
+points awarded, status changes) become one push and one inbox row instead of
+one of each per event. The first event opens a pending scheduled push
+COALESCE_WINDOW_SECONDS out; later events in the window rewrite it, and the
+delivery scheduler sends whatever it holds when the window closes. Users with
+the daily_digest preference get these pushes bundled once a day at
+DIGEST_HOUR_UTC (their inbox rows are still merged per window only).
+
+Each merge runs in one transaction under a per-user advisory lock, so events
+for the same user handled by different workers queue up behind each other.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import crud
+import fcm_service
+import inbox_stream
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW_SECONDS = float(os.getenv("PUSH_COALESCE_WINDOW_SECONDS", "15"))
+DIGEST_HOUR_UTC = int(os.getenv("PUSH_DIGEST_HOUR_UTC", "17"))
+# A push this close to its release no longer absorbs events (the scheduler may be sending it)
+MERGE_MARGIN_SECONDS = 2
+
+# Push preference type -> coalescing group; other types are pushed right away
+COALESCE_GROUPS = {
+    "REPORT_CREATED": "activity",
+    "REPORT_UPDATE": "activity",
+    "POINTS_AWARDED": "activity",
+}
+
+LANGUAGES = ("ar", "en", "ku")
+MERGED_TITLES = {"ar": "تحديثات كاشف", "en": "Kashif updates", "ku": "Nûçeyên Kashif"}
+POINTS_SUMMARY = {"ar": "+{points} نقطة", "en": "+{points} points", "ku": "+{points} xal"}
+SEPARATORS = {"ar": "، ", "en": ", ", "ku": ", "}
+
+
+def render(fragments: list) -> Dict[str, Tuple[str, str]]:
+    """
+    Language -> (title, body) for a list of events: a single event keeps its
+    own texts, several become one summary ("Report #12 received, +15 points")
+    """
+    if len(fragments) == 1:
+        return {lang: tuple(fragments[0]["texts"][lang]) for lang in LANGUAGES}
+
+    points = sum(fragment["points"] or 0 for fragment in fragments)
+    rendered = {}
+    for lang in LANGUAGES:
+        phrases = []
+        for fragment in fragments:
+            if fragment["points"] is None and fragment["summary"][lang] not in phrases:
+                phrases.append(fragment["summary"][lang])
+        if points:
+            phrases.append(POINTS_SUMMARY[lang].format(points=points))
+        rendered[lang] = (MERGED_TITLES[lang], SEPARATORS[lang].join(phrases))
+    return rendered
+
+
+def _columns(rendered: Dict[str, Tuple[str, str]]) -> dict:
+    """Notification title/body columns (Arabic is the primary language)"""
+    return {
+        "title": rendered["ar"][0],
+        "body": rendered["ar"][1],
+        "title_en": rendered["en"][0],
+        "body_en": rendered["en"][1],
+        "title_ku": rendered["ku"][0],
+        "body_ku": rendered["ku"][1],
+    }
+
+
+def _push_data(rendered: Dict[str, Tuple[str, str]], notification_id: int, data: dict) -> dict:
+    return {
+        **data,
+        "notification_id": str(notification_id),
+        "title_en": rendered["en"][0],
+        "body_en": rendered["en"][1],
+        "title_ku": rendered["ku"][0],
+        "body_ku": rendered["ku"][1],
+    }
+
+
+def notify(
+    db: Session,
+    user_id: int,
+    notification_type: str,
+    push_type: str,
+    texts: Dict[str, Tuple[str, str]],
+    summary: Optional[Dict[str, str]] = None,
+    points: Optional[int] = None,
+    data: dict = None,
+    related_report_id: Optional[int] = None
+) -> int:
+    """
+    Record one event in the user's inbox and push it, merging with the
+    user's other recent events of the same coalescing group.
+
+    `texts` maps language -> (title, body) of the event on its own;
+    `summary` maps language -> the short phrase used when it is merged with
+    others. Point events pass `points` instead, summed into one "+N points".
+    Returns the id of the (possibly merged) inbox notification.
+    """
+    data = data or {}
+    group = COALESCE_GROUPS.get(push_type)
+    profile = crud.get_delivery_profile(db, user_id) if group else None
+    digest = bool(profile and profile["prefs"]["daily_digest"])
+    if (
+        group is None
+        or (COALESCE_WINDOW_SECONDS <= 0 and not digest)
+        or not profile["tokens"]
+        or not crud.profile_allows(profile, push_type)
+    ):
+        rendered = {lang: tuple(texts[lang]) for lang in LANGUAGES}
+        notification = crud.create_notification(
+            db=db,
+            user_id=user_id,
+            notification_type=notification_type,
+            related_report_id=related_report_id,
+            **_columns(rendered)
+        )
+        fcm_service.send_push_notification(
+            db=db,
+            user_id=user_id,
+            title=rendered["ar"][0],
+            body=rendered["ar"][1],
+            data=_push_data(rendered, notification.id, data),
+            notification_type=push_type
+        )
+        return notification.id
+
+    # Held until the commit below: one merge per user at a time, across workers
+    crud.lock_coalescing(db, user_id)
+    now = datetime.utcnow()
+    push = crud.get_open_coalesced_push(db, user_id, group)
+    if push and push.deliver_after <= now + timedelta(seconds=MERGE_MARGIN_SECONDS):
+        # About to be released: leave it to the scheduler and open a new one
+        crud.close_coalesced_push(db, push)
+        push = None
+    earlier = json.loads(push.fragments) if push else []
+    fragment = {"type": push_type, "texts": texts, "summary": summary, "points": points, "data": data}
+
+    # Inbox: merge into the previous event's row while it is within the window
+    notification_id = None
+    merged = False
+    if earlier:
+        previous_id = earlier[-1]["notification_id"]
+        same_row = [f for f in earlier if f["notification_id"] == previous_id] + [fragment]
+        if crud.update_recent_notification(
+            db, previous_id, now - timedelta(seconds=COALESCE_WINDOW_SECONDS), **_columns(render(same_row))
+        ):
+            notification_id = previous_id
+            merged = True
+    if notification_id is None:
+        notification_id = crud.add_notification(
+            db=db,
+            user_id=user_id,
+            notification_type=notification_type,
+            related_report_id=related_report_id,
+            **_columns({lang: tuple(texts[lang]) for lang in LANGUAGES})
+        ).id
+    fragment["notification_id"] = notification_id
+
+    # Push: one pending row per user and group, rewritten with every event
+    fragments = earlier + [fragment]
+    rendered = render(fragments)
+    if len(fragments) == 1:
+        push_data = _push_data(rendered, notification_id, data)
+    else:
+        push_data = _push_data(rendered, notification_id, {"type": "activity_summary", "count": str(len(fragments))})
+    types = {f["type"] for f in fragments}
+
+    deliver_after = None
+    if push is None:
+        if digest:
+            deliver_after = crud.next_hour_at(DIGEST_HOUR_UTC, now)
+        else:
+            deliver_after = now + timedelta(seconds=COALESCE_WINDOW_SECONDS)
+        if crud.profile_in_quiet_hours(profile):
+            deliver_after = max(deliver_after, crud.next_hour_at(profile["prefs"]["quiet_hours_end"], now))
+
+    crud.save_coalesced_push(
+        db, push, user_id, group,
+        title=rendered["ar"][0],
+        body=rendered["ar"][1],
+        data=push_data,
+        notification_type=push_type if len(types) == 1 else None,
+        fragments=fragments,
+        deliver_after=deliver_after
+    )
+    db.commit()
+    if merged:
+        inbox_stream.notify_inbox_updated(user_id, notification_id)
+    else:
+        inbox_stream.notify_inbox_changed(user_id)
+    if push:
+        logger.info(f"Coalesced {push_type} for user {user_id} into pending push {push.id} ({len(fragments)} events)")
+    return notification_id
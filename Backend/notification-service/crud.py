@@ -1,7 +1,17 @@
-from datetime import datetime
-from typing import List, Optional
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 
+import inbox_stream
 import models
+from sqlalchemy import (and_, delete, func, insert, literal, not_, or_, select,
+                        text, tuple_, update)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
 
@@ -33,37 +43,113 @@ def update_notification_preferences(db: Session, user_id: int, updates: dict):
             setattr(prefs, key, value)
     
     db.commit()
+    invalidate_delivery_profiles(user_id)
     db.refresh(prefs)
     return prefs
 
 
-def is_notification_enabled(db: Session, user_id: int, notification_type: str) -> bool:
-    """Check if a specific notification type is enabled for a user"""
-    prefs = get_notification_preferences(db, user_id)
-    
-    type_mapping = {
-        "REPORT_UPDATE": prefs.status_updates,
-        "REPORT_CREATED": prefs.report_notifications,
-        "POINTS_AWARDED": prefs.points_notifications,
-        "COUPON_REDEEMED": prefs.coupon_notifications,
-        "WELCOME": prefs.general_notifications,
-        "GENERAL": prefs.general_notifications,
+# Preference column that switches each notification type on or off
+NOTIFICATION_TYPE_PREFERENCES = {
+    "REPORT_UPDATE": "status_updates",
+    "REPORT_CREATED": "report_notifications",
+    "POINTS_AWARDED": "points_notifications",
+    "COUPON_REDEEMED": "coupon_notifications",
+    "WELCOME": "general_notifications",
+    "GENERAL": "general_notifications",
+}
+
+
+# Column defaults used when a user has no preferences row yet
+DEFAULT_PREFERENCES = {
+    "report_notifications": True,
+    "status_updates": True,
+    "points_notifications": True,
+    "coupon_notifications": True,
+    "general_notifications": True,
+    "quiet_hours_enabled": False,
+    "quiet_hours_start": 22,
+    "quiet_hours_end": 7,
+    "daily_digest": False,
+}
+
+
+# ── Delivery profile cache ──────────────────────────────────────────
+# Preferences plus active device tokens per user, loaded in one query and
+# cached for DELIVERY_CACHE_TTL_SECONDS. Writes through this module
+# invalidate the entry; the TTL bounds staleness across workers.
+DELIVERY_CACHE_TTL_SECONDS = float(os.getenv("DELIVERY_CACHE_TTL_SECONDS", "60"))
+DELIVERY_CACHE_MAX_USERS = int(os.getenv("DELIVERY_CACHE_MAX_USERS", "50000"))
+_delivery_cache = {}
+_delivery_cache_lock = threading.Lock()
+
+
+def invalidate_delivery_profiles(*user_ids: int):
+    with _delivery_cache_lock:
+        for user_id in user_ids:
+            _delivery_cache.pop(user_id, None)
+
+
+def get_delivery_profile(db: Session, user_id: int) -> dict:
+    """
+    {"prefs": {...}, "tokens": [...]} for a user, from cache or one query
+    (preferences LEFT JOIN active device tokens). Never creates rows.
+    """
+    now = time.monotonic()
+    with _delivery_cache_lock:
+        cached = _delivery_cache.get(user_id)
+    if cached and now - cached["loaded_at"] < DELIVERY_CACHE_TTL_SECONDS:
+        return cached
+
+    prefs_model = models.UserNotificationPreferences
+    user = select(literal(user_id).label("user_id")).subquery()
+    rows = db.execute(
+        select(
+            *[getattr(prefs_model, column).label(column) for column in DEFAULT_PREFERENCES],
+            prefs_model.user_id.label("prefs_user_id"),
+            models.DeviceToken.token
+        ).select_from(user).outerjoin(
+            prefs_model, prefs_model.user_id == user.c.user_id
+        ).outerjoin(
+            models.DeviceToken,
+            and_(models.DeviceToken.user_id == user.c.user_id, models.DeviceToken.is_active == True)
+        ).order_by(models.DeviceToken.id)
+    ).all()
+
+    first = rows[0]
+    prefs = dict(DEFAULT_PREFERENCES)
+    if first.prefs_user_id is not None:
+        prefs.update({
+            column: getattr(first, column)
+            for column in DEFAULT_PREFERENCES
+            if getattr(first, column) is not None
+        })
+    profile = {
+        "prefs": prefs,
+        "tokens": [row.token for row in rows if row.token],
+        "loaded_at": now,
     }
-    
-    return type_mapping.get(notification_type, True)
+    with _delivery_cache_lock:
+        if user_id not in _delivery_cache and len(_delivery_cache) >= DELIVERY_CACHE_MAX_USERS:
+            _delivery_cache.pop(next(iter(_delivery_cache)))
+        _delivery_cache[user_id] = profile
+    return profile
 
 
-def is_in_quiet_hours(db: Session, user_id: int) -> bool:
-    """Check if user is currently in quiet hours"""
-    from datetime import datetime, timezone
-    prefs = get_notification_preferences(db, user_id)
-    
-    if not prefs.quiet_hours_enabled:
+def profile_allows(profile: dict, notification_type: Optional[str]) -> bool:
+    """Whether the profile's preferences allow `notification_type`"""
+    column = NOTIFICATION_TYPE_PREFERENCES.get(notification_type)
+    return profile["prefs"][column] if column else True
+
+
+def profile_in_quiet_hours(profile: dict) -> bool:
+    """Whether the profile's user is in quiet hours right now (UTC)"""
+    prefs = profile["prefs"]
+    if not prefs["quiet_hours_enabled"]:
         return False
     
     current_hour = datetime.now(timezone.utc).hour
-    start = prefs.quiet_hours_start
-    end = prefs.quiet_hours_end
+    start = prefs["quiet_hours_start"]
+    end = prefs["quiet_hours_end"]
     
     if start <= end:
         return start <= current_hour < end
@@ -71,6 +157,16 @@ def is_in_quiet_hours(db: Session, user_id: int) -> bool:
         return current_hour >= start or current_hour < end
 
 
+def is_notification_enabled(db: Session, user_id: int, notification_type: str) -> bool:
+    """Check if a specific notification type is enabled for a user"""
+    return profile_allows(get_delivery_profile(db, user_id), notification_type)
+
+
+def is_in_quiet_hours(db: Session, user_id: int) -> bool:
+    """Check if user is currently in quiet hours"""
+    return profile_in_quiet_hours(get_delivery_profile(db, user_id))
+
+
 # Device Token CRUD
 def create_or_update_device_token(db: Session, user_id: int, token: str, device_type: str):
     """Create or update device token"""
@@ -79,11 +175,13 @@ def create_or_update_device_token(db: Session, user_id: int, token: str, device_
     ).first()
     
     if existing:
+        previous_user_id = existing.user_id
         existing.user_id = user_id
         existing.device_type = device_type
         existing.is_active = True
         existing.updated_at = datetime.utcnow()
         db.commit()
+        invalidate_delivery_profiles(previous_user_id, user_id)
         db.refresh(existing)
         return existing
     else:
@@ -94,6 +192,7 @@ def create_or_update_device_token(db: Session, user_id: int, token: str, device_
         )
         db.add(device_token)
         db.commit()
+        invalidate_delivery_profiles(user_id)
         db.refresh(device_token)
         return device_token
 
@@ -106,6 +205,93 @@ def get_user_device_tokens(db: Session, user_id: int):
     ).all()
 
 
+def get_push_tokens_for_users(
+    db: Session,
+    user_ids: List[int],
+    notification_type: Optional[str] = None
+) -> List[str]:
+    """
+    Active device tokens of the given users, skipping users who disabled
+    `notification_type` or are in their quiet hours (missing preference rows
+    mean the defaults: everything on, no quiet hours).
+    """
+    if not user_ids:
+        return []
+    prefs = models.UserNotificationPreferences
+    query = db.query(models.DeviceToken.token).outerjoin(
+        prefs, prefs.user_id == models.DeviceToken.user_id
+    ).filter(
+        models.DeviceToken.user_id.in_(user_ids),
+        models.DeviceToken.is_active == True
+    )
+
+    column = NOTIFICATION_TYPE_PREFERENCES.get(notification_type)
+    if column:
+        query = query.filter(or_(prefs.user_id.is_(None), getattr(prefs, column) == True))
+
+    query = query.filter(or_(
+        prefs.user_id.is_(None),
+        prefs.quiet_hours_enabled == False,
+        not_(_in_quiet_hours_clause(prefs))
+    ))
+    return [row.token for row in query.all()]
+
+
+def get_quiet_hours_recipients(
+    db: Session,
+    user_ids: List[int],
+    notification_type: Optional[str] = None
+) -> List[tuple]:
+    """
+    (user_id, quiet_hours_end) of the given users who have an active device
+    token and allow `notification_type`, but are in their quiet hours right
+    now — the users get_push_tokens_for_users leaves out.
+    """
+    if not user_ids:
+        return []
+    prefs = models.UserNotificationPreferences
+    query = db.query(prefs.user_id, prefs.quiet_hours_end).filter(
+        prefs.user_id.in_(user_ids),
+        prefs.quiet_hours_enabled == True,
+        _in_quiet_hours_clause(prefs),
+        select(models.DeviceToken.id).where(
+            models.DeviceToken.user_id == prefs.user_id,
+            models.DeviceToken.is_active == True
+        ).exists()
+    )
+    column = NOTIFICATION_TYPE_PREFERENCES.get(notification_type)
+    if column:
+        query = query.filter(getattr(prefs, column) == True)
+    return [(row.user_id, row.quiet_hours_end) for row in query.all()]
+
+
+def _in_quiet_hours_clause(prefs):
+    """SQL for "the current UTC hour is inside the row's quiet hours window" """
+    hour = datetime.now(timezone.utc).hour
+    start = func.coalesce(prefs.quiet_hours_start, 22)
+    end = func.coalesce(prefs.quiet_hours_end, 7)
+    return or_(
+        and_(start <= end, start <= hour, end > hour),
+        and_(start > end, or_(start <= hour, end > hour))  # Wraps midnight (e.g., 22-7)
+    )
+
+
+def deactivate_device_tokens(db: Session, tokens: List[str]) -> int:
+    """Mark tokens FCM reported as unregistered / invalid as inactive"""
+    user_ids = db.execute(
+        update(models.DeviceToken).where(
+            models.DeviceToken.token.in_(tokens),
+            models.DeviceToken.is_active == True
+        ).values(
+            is_active=False,
+            updated_at=datetime.utcnow()
+        ).returning(models.DeviceToken.user_id)
+    ).scalars().all()
+    db.commit()
+    invalidate_delivery_profiles(*user_ids)
+    return len(user_ids)
+
+
 def delete_device_token(db: Session, user_id: int, token: str):
     """Delete device token"""
     device_token = db.query(models.DeviceToken).filter(
@@ -116,6 +302,7 @@ def delete_device_token(db: Session, user_id: int, token: str):
     if device_token:
         db.delete(device_token)
         db.commit()
+        invalidate_delivery_profiles(user_id)
         return True
     return False
 
@@ -135,6 +322,35 @@ def create_notification(
     body_ku: Optional[str] = None
 ):
     """Create a new notification"""
+    notification = add_notification(
+        db, user_id, title, body, notification_type,
+        related_report_id=related_report_id,
+        related_coupon_id=related_coupon_id,
+        title_en=title_en,
+        body_en=body_en,
+        title_ku=title_ku,
+        body_ku=body_ku
+    )
+    db.commit()
+    inbox_stream.notify_inbox_changed(user_id)
+    db.refresh(notification)
+    return notification
+
+
+def add_notification(
+    db: Session,
+    user_id: int,
+    title: str,
+    body: str,
+    notification_type: str,
+    related_report_id: Optional[int] = None,
+    related_coupon_id: Optional[int] = None,
+    title_en: Optional[str] = None,
+    body_en: Optional[str] = None,
+    title_ku: Optional[str] = None,
+    body_ku: Optional[str] = None
+) -> models.Notification:
+    """Stage a notification and its unread count (caller commits and wakes the inbox stream)"""
     notification = models.Notification(
         user_id=user_id,
         title=title,
@@ -148,63 +364,543 @@ def create_notification(
         related_coupon_id=related_coupon_id
     )
     db.add(notification)
-    db.commit()
-    db.refresh(notification)
+    _add_unread(db, [user_id], 1)
+    db.flush()
     return notification
 
 
+def bulk_create_notifications(
+    db: Session,
+    user_ids: List[int],
+    title: str,
+    body: str,
+    notification_type: str
+) -> int:
+    """Insert the same notification for many users in one statement"""
+    if not user_ids:
+        return 0
+    now = datetime.utcnow()
+    db.execute(insert(models.Notification).values([
+        {
+            "user_id": user_id,
+            "title": title,
+            "body": body,
+            "type": notification_type,
+            "is_read": False,
+            "created_at": now,
+        }
+        for user_id in user_ids
+    ]))
+    _add_unread(db, user_ids, 1)
+    db.commit()
+    inbox_stream.notify_inbox_changed(*user_ids)
+    return len(user_ids)
+
+
+# Broadcast jobs
+def create_broadcast_job(
+    db: Session,
+    job_id: str,
+    broadcast,
+    created_by: Optional[int]
+) -> models.BroadcastJob:
+    job = models.BroadcastJob(
+        id=job_id,
+        status="pending",
+        title=broadcast.title,
+        body=broadcast.body,
+        type=broadcast.type,
+        target_role=broadcast.target_role,
+        created_by=created_by
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_broadcast_job(db: Session, job_id: str) -> Optional[models.BroadcastJob]:
+    return db.query(models.BroadcastJob).filter(models.BroadcastJob.id == job_id).first()
+
+
+BROADCAST_UNFINISHED_STATUSES = ("pending", "running")
+
+
+def get_unfinished_broadcast_job_ids(db: Session) -> List[str]:
+    """Ids of broadcasts not yet completed or failed, oldest first"""
+    rows = db.query(models.BroadcastJob.id).filter(
+        models.BroadcastJob.status.in_(BROADCAST_UNFINISHED_STATUSES)
+    ).order_by(models.BroadcastJob.created_at).all()
+    return [job_id for (job_id,) in rows]
+
+# A worker delivering a broadcast holds this session-level advisory lock
+# (two-key form: class, hashed job id) on a dedicated connection. It is
+# released when the job ends or the worker dies, so exactly one worker runs
+# or resumes each job
+BROADCAST_JOB_LOCK_CLASS = 7310041
+
+
+def try_lock_broadcast_job(conn, job_id: str) -> bool:
+    """Claim a broadcast for this connection; False if another worker runs it"""
+    locked = conn.execute(select(
+        func.pg_try_advisory_lock(BROADCAST_JOB_LOCK_CLASS, func.hashtext(job_id))
+    )).scalar()
+    conn.commit()  # The lock outlives the transaction; don't sit idle in one
+    return locked
+
+
+def unlock_broadcast_job(conn, job_id: str):
+    conn.execute(select(func.pg_advisory_unlock(BROADCAST_JOB_LOCK_CLASS, func.hashtext(job_id))))
+    conn.commit()
+
+
+def _add_unread(db: Session, user_ids: List[int], delta: int):
+    """Shift the unread counters of `user_ids` by `delta` (part of the caller's transaction)"""
+    if not user_ids:
+        return
+    counts = models.UserUnreadCount.__table__
+    stmt = pg_insert(counts).values([
+        {"user_id": user_id, "unread_count": max(delta, 0), "updated_at": datetime.utcnow()}
+        for user_id in dict.fromkeys(user_ids)
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[counts.c.user_id],
+        set_={
+            "unread_count": func.greatest(counts.c.unread_count + delta, 0),
+            "updated_at": stmt.excluded.updated_at,
+        }
+    ))
+
+
 def get_user_notifications(
     db: Session,
     user_id: int,
     skip: int = 0,
     limit: int = 100,
-    unread_only: bool = False
+    unread_only: bool = False,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None
 ):
-    """Get user's notifications"""
-    query = db.query(models.Notification).filter(
-        models.Notification.user_id == user_id
-    )
+    """
+    Get user's notifications, newest first. Pass the created_at / id of the
+    last row seen as `before` / `before_id` to page by keyset on the
+    (user_id, created_at, id) index instead of skipping rows.
+    """
+    n = models.Notification
+    query = db.query(n).filter(n.user_id == user_id)
     
     if unread_only:
-        query = query.filter(models.Notification.is_read == False)
+        query = query.filter(n.is_read == False)
+
+    if before is not None:
+        if before_id is not None:
+            query = query.filter(or_(n.created_at < before, and_(n.created_at == before, n.id < before_id)))
+        else:
+            query = query.filter(n.created_at < before)
     
-    return query.order_by(
-        models.Notification.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    return query.order_by(n.created_at.desc(), n.id.desc()).offset(skip).limit(limit).all()
+
+
+def get_notifications_after(db: Session, user_id: int, after_id: int, limit: int):
+    """User's notifications with id above `after_id`, oldest first (stream replay)"""
+    return db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.id > after_id
+    ).order_by(models.Notification.id).limit(limit).all()
+
+
+def get_recent_notifications(db: Session, user_id: int, since: datetime, up_to_id: int):
+    """User's notifications created since `since` with id up to `up_to_id` (stream overlap window)"""
+    return db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.created_at >= since,
+        models.Notification.id <= up_to_id
+    ).order_by(models.Notification.id).all()
+
+
+def get_notifications_by_ids(db: Session, user_id: int, notification_ids: List[int]):
+    """The user's notifications among `notification_ids` (stream re-sends of rewritten rows)"""
+    if not notification_ids:
+        return []
+    return db.query(models.Notification).filter(
+        models.Notification.user_id == user_id,
+        models.Notification.id.in_(notification_ids)
+    ).order_by(models.Notification.id).all()
+
+
+def get_latest_notification_id(db: Session, user_id: int) -> int:
+    return db.query(func.max(models.Notification.id)).filter(
+        models.Notification.user_id == user_id
+    ).scalar() or 0
 
 
 def mark_notification_read(db: Session, notification_id: int, user_id: int):
     """Mark a notification as read"""
-    notification = db.query(models.Notification).filter(
+    marked = db.execute(
+        update(models.Notification).where(
+            models.Notification.id == notification_id,
+            models.Notification.user_id == user_id,
+            models.Notification.is_read == False
+        ).values(is_read=True)
+    ).rowcount
+    if marked:
+        _add_unread(db, [user_id], -1)
+    db.commit()
+    if marked:
+        inbox_stream.notify_inbox_changed(user_id)
+
+    return db.query(models.Notification).filter(
         models.Notification.id == notification_id,
         models.Notification.user_id == user_id
     ).first()
-    
-    if notification:
-        notification.is_read = True
-        notification.read_at = datetime.utcnow()
-        db.commit()
-        db.refresh(notification)
-    
-    return notification
 
 
 def mark_all_notifications_read(db: Session, user_id: int):
-    """Mark all notifications as read for a user"""
-    count = db.query(models.Notification).filter(
+    """Mark all notifications as read for a user and reset the unread counter"""
+    count = db.execute(
+        update(models.Notification).where(
+            models.Notification.user_id == user_id,
+            models.Notification.is_read == False
+        ).values(is_read=True)
+    ).rowcount
+
+    # Whatever is still unread now arrived concurrently (normally nothing)
+    remaining = select(func.count(models.Notification.id)).where(
         models.Notification.user_id == user_id,
         models.Notification.is_read == False
-    ).update({
-        "is_read": True,
-        "read_at": datetime.utcnow()
-    })
+    ).scalar_subquery()
+    counts = models.UserUnreadCount.__table__
+    stmt = pg_insert(counts).values(user_id=user_id, unread_count=remaining, updated_at=datetime.utcnow())
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[counts.c.user_id],
+        set_={"unread_count": stmt.excluded.unread_count, "updated_at": stmt.excluded.updated_at}
+    ))
     db.commit()
+    if count:
+        inbox_stream.notify_inbox_changed(user_id)
     return count
 
 
 def get_unread_count(db: Session, user_id: int):
-    """Get count of unread notifications"""
-    return db.query(models.Notification).filter(
-        models.Notification.user_id == user_id,
-        models.Notification.is_read == False
-    ).count()
+    """Get count of unread notifications (materialized per user)"""
+    return db.query(models.UserUnreadCount.unread_count).filter(
+        models.UserUnreadCount.user_id == user_id
+    ).scalar() or 0
+
+
+# ── Inbox partitions and retention ──────────────────────────────────
+# notifications is range-partitioned by month (migrations/
+# add_notification_partitions.sql). Read notifications older than
+# NOTIFICATION_RETENTION_DAYS are moved, in batches, into
+# notification_archives (or deleted); emptied months are dropped.
+NOTIFICATION_PARTITION_MONTHS_AHEAD = int(os.getenv("NOTIFICATION_PARTITION_MONTHS_AHEAD", "2"))
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "180"))  # 0 disables retention
+NOTIFICATION_RETENTION_MODE = os.getenv("NOTIFICATION_RETENTION_MODE", "archive")  # archive or delete
+NOTIFICATION_RETENTION_BATCH_SIZE = int(os.getenv("NOTIFICATION_RETENTION_BATCH_SIZE", "2000"))
+NOTIFICATION_DEFAULT_PARTITION = "notifications_default"
+NOTIFICATION_MAINTENANCE_LOCK_KEY = 7310049
+_PARTITION_NAME = re.compile(r"^notifications_y(\d{4})m(\d{2})$")
+
+# Column order of the rows in an archive payload
+ARCHIVE_FIELDS = (
+    "id", "created_at", "type", "title", "body", "title_en", "body_en",
+    "title_ku", "body_ku", "related_report_id", "related_coupon_id",
+)
+
+
+def add_months(month: date, n: int) -> date:
+    """First day of the month `n` months after `month`"""
+    years, m = divmod(month.month - 1 + n, 12)
+    return date(month.year + years, m + 1, 1)
+
+
+def notification_partition_name(month: date) -> str:
+    return f"notifications_y{month:%Y}m{month:%m}"
+
+
+def is_inbox_partitioned(db: Session) -> bool:
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('notifications'))"
+    )).scalar()
+
+
+def list_notification_partitions(db: Session) -> List[dict]:
+    """Attached monthly partitions, oldest first: [{name, start, end}]"""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('notifications')"
+    )).scalars().all()
+    partitions = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            start = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append({"name": name, "start": start, "end": add_months(start, 1)})
+    return sorted(partitions, key=lambda p: p["start"])
+
+
+def ensure_notification_partitions(db: Session, months_ahead: int = NOTIFICATION_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the default partition and monthly partitions up to `months_ahead`"""
+    if not is_inbox_partitioned(db):
+        db.rollback()
+        return []
+    db.execute(select(func.pg_advisory_xact_lock(NOTIFICATION_MAINTENANCE_LOCK_KEY)))
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {NOTIFICATION_DEFAULT_PARTITION} PARTITION OF notifications DEFAULT"
+    ))
+    existing = {p["name"] for p in list_notification_partitions(db)}
+    current = datetime.utcnow().date().replace(day=1)
+    created = []
+    for i in range(months_ahead + 1):
+        start = add_months(current, i)
+        name = notification_partition_name(start)
+        if name in existing:
+            continue
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF notifications "
+            f"FOR VALUES FROM ('{start}') TO ('{add_months(start, 1)}')"
+        ))
+        created.append(name)
+    db.commit()
+    return created
+
+
+def encode_archive(rows: list) -> bytes:
+    """gzip'd JSON list of rows (lists in ARCHIVE_FIELDS order)"""
+    return gzip.compress(json.dumps(
+        [[row[field].isoformat() if field == "created_at" else row[field] for field in ARCHIVE_FIELDS] for row in rows],
+        ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8"))
+
+
+def decode_archive(payload: bytes) -> List[dict]:
+    return [dict(zip(ARCHIVE_FIELDS, row)) for row in json.loads(gzip.decompress(payload))]
+
+
+def retire_read_notifications(
+    db: Session,
+    cutoff: datetime,
+    batch_size: int = NOTIFICATION_RETENTION_BATCH_SIZE,
+    archive: bool = True,
+    user_id: Optional[int] = None
+) -> int:
+    """
+    Move one batch of read notifications created before `cutoff` out of the
+    inbox (into notification_archives unless `archive` is False), oldest
+    first, in one transaction. Only `user_id`'s rows are retired when given.
+    Returns how many rows were retired.
+    """
+    n = models.Notification.__table__
+    batch = select(n.c.id, n.c.created_at).where(
+        n.c.is_read == True,
+        n.c.created_at < cutoff
+    )
+    if user_id is not None:
+        batch = batch.where(n.c.user_id == user_id)
+    batch = batch.order_by(n.c.created_at).limit(batch_size).with_for_update(skip_locked=True)
+    rows = db.execute(
+        delete(n).where(tuple_(n.c.id, n.c.created_at).in_(batch)).returning(n.c.user_id, *[n.c[f] for f in ARCHIVE_FIELDS])
+    ).mappings().all()
+
+    if archive and rows:
+        per_user = {}
+        for row in rows:
+            per_user.setdefault(row["user_id"], []).append(row)
+        db.execute(insert(models.NotificationArchive), [
+            {
+                "user_id": user_id,
+                "range_start": min(r["created_at"] for r in user_rows),
+                "range_end": max(r["created_at"] for r in user_rows),
+                "notification_count": len(user_rows),
+                "payload": encode_archive(user_rows),
+                "archived_at": datetime.utcnow(),
+            }
+            for user_id, user_rows in per_user.items()
+        ])
+    db.commit()
+    return len(rows)
+
+
+def drop_empty_notification_partitions(db: Session, before: date) -> List[str]:
+    """Drop monthly partitions ending on or before `before` that retention has emptied"""
+    if not is_inbox_partitioned(db):
+        db.rollback()
+        return []
+    dropped = []
+    for partition in list_notification_partitions(db):
+        if partition["end"] > before:
+            break
+        name = partition["name"]
+        db.execute(select(func.pg_advisory_xact_lock(NOTIFICATION_MAINTENANCE_LOCK_KEY)))
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is None:
+            db.rollback()
+            continue  # Dropped by another worker
+        db.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+        if db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+            db.rollback()
+            continue  # Unread rows keep the month
+        db.execute(text(f"ALTER TABLE notifications DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        dropped.append(name)
+    return dropped
+
+
+def get_archived_notifications(db: Session, user_id: int) -> List[dict]:
+    """Every archived notification of a user (DSGVO export), oldest first"""
+    archives = db.query(models.NotificationArchive).filter(
+        models.NotificationArchive.user_id == user_id
+    ).order_by(models.NotificationArchive.range_start).all()
+    return [row for archive in archives for row in decode_archive(archive.payload)]
+
+
+# ============================================================
+# Scheduled Pushes (quiet hours deferral)
+# ============================================================
+
+def next_hour_at(hour: int, now: datetime = None) -> datetime:
+    """Next UTC datetime (naive) on the full `hour`, e.g. when quiet hours ending at `hour` are over"""
+    now = now or datetime.utcnow()
+    end = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if end <= now:
+        end += timedelta(days=1)
+    return end
+
+
+def schedule_pushes(
+    db: Session,
+    recipients: List[Tuple[int, datetime]],
+    title: str,
+    body: str,
+    data: dict = None,
+    notification_type: str = None
+) -> int:
+    """Hold one push per (user_id, deliver_after) until the scheduler releases it"""
+    if not recipients:
+        return 0
+    payload = json.dumps(data) if data else None
+    db.execute(insert(models.ScheduledPush), [
+        {
+            "user_id": user_id,
+            "title": title,
+            "body": body,
+            "data": payload,
+            "notification_type": notification_type,
+            "deliver_after": deliver_after,
+            "status": "pending",
+            "created_at": datetime.utcnow(),
+        }
+        for user_id, deliver_after in recipients
+    ])
+    db.commit()
+    return len(recipients)
+
+
+def get_due_pushes(db: Session, limit: int) -> list:
+    """Oldest pending pushes whose deliver_after has passed"""
+    push = models.ScheduledPush
+    return db.execute(
+        select(
+            push.id, push.user_id, push.title, push.body, push.data, push.notification_type
+        ).where(
+            push.status == "pending",
+            push.deliver_after <= datetime.utcnow()
+        ).order_by(push.deliver_after, push.id).limit(limit)
+    ).all()
+
+
+def update_scheduled_pushes(db: Session, push_ids: List[int], **values) -> None:
+    """Set status / deliver_after / sent_at on a set of scheduled pushes"""
+    if not push_ids:
+        return
+    db.execute(
+        update(models.ScheduledPush).where(models.ScheduledPush.id.in_(push_ids)).values(**values)
+    )
+    db.commit()
+
+
+def count_pending_pushes(db: Session) -> int:
+    """Pushes waiting for release (including ones not yet due)"""
+    return db.query(func.count(models.ScheduledPush.id)).filter(
+        models.ScheduledPush.status == "pending"
+    ).scalar()
+
+
+# Coalescing read-modify-writes of one user hold this advisory lock (two-key
+# form: class, user_id) until commit, so events handled by different workers
+# merge into one push instead of opening two or losing a fragment
+PUSH_COALESCE_LOCK_CLASS = 7310045
+
+
+def lock_coalescing(db: Session, user_id: int):
+    """Serialize push coalescing for one user until the caller commits"""
+    db.execute(select(func.pg_advisory_xact_lock(PUSH_COALESCE_LOCK_CLASS, user_id)))
+
+
+def get_open_coalesced_push(
+    db: Session,
+    user_id: int,
+    coalesce_key: str
+) -> Optional[models.ScheduledPush]:
+    """The user's pending coalesced push for the key (unique index; call under lock_coalescing)"""
+    return db.query(models.ScheduledPush).filter(
+        models.ScheduledPush.user_id == user_id,
+        models.ScheduledPush.coalesce_key == coalesce_key,
+        models.ScheduledPush.status == "pending"
+    ).first()
+
+
+def close_coalesced_push(db: Session, push: models.ScheduledPush):
+    """Stop a pending push absorbing events; it is still sent when due (caller commits)"""
+    push.coalesce_key = None
+    db.flush()
+
+
+def save_coalesced_push(
+    db: Session,
+    push: Optional[models.ScheduledPush],
+    user_id: int,
+    coalesce_key: str,
+    title: str,
+    body: str,
+    data: dict,
+    notification_type: Optional[str],
+    fragments: list,
+    deliver_after: datetime = None
+) -> models.ScheduledPush:
+    """Create an open coalesced push, or rewrite `push` with the merged content (caller commits)"""
+    if push is None:
+        push = models.ScheduledPush(
+            user_id=user_id,
+            coalesce_key=coalesce_key,
+            deliver_after=deliver_after,
+            status="pending"
+        )
+        db.add(push)
+    push.title = title
+    push.body = body
+    push.data = json.dumps(data)
+    push.notification_type = notification_type
+    push.fragments = json.dumps(fragments)
+    db.flush()
+    return push
+
+
+def update_recent_notification(
+    db: Session,
+    notification_id: int,
+    created_after: datetime,
+    **texts
+) -> bool:
+    """
+    Rewrite title/body columns of an unread notification created after
+    `created_after`; False if none matched. The caller commits and then
+    calls inbox_stream.notify_inbox_updated for the row.
+    """
+    updated = db.query(models.Notification).filter(
+        models.Notification.id == notification_id,
+        models.Notification.is_read == False,
+        models.Notification.created_at > created_after
+    ).update(texts, synchronize_session=False)
+    return bool(updated)
@@ -1,13 +1,25 @@
 """
 Email Service for sending verification and password reset emails
 Uses SMTP with STARTTLS for secure email delivery
+
+Emails are queued and sent by a small pool of worker threads, each keeping
+one authenticated SMTP connection open, so a slow mail server never blocks
+the RabbitMQ consumer. Failed sends are retried with exponential backoff.
+Templates are rendered once per language and cached.
 """
+import heapq
 import logging
 import os
+import queue
 import smtplib
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Optional
+from functools import lru_cache
+from html import escape
+from string import Template
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -20,11 +32,208 @@ SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "noreply@kashifroad.com")
 SMTP_FROM_NAME = os.getenv("SMTP_FROM_NAME", "Kashif Road")
 SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
 
+# Delivery pool: connections (= worker threads), messages per connection
+# check-out, idle time after which a connection is closed, retry policy
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_BATCH_SIZE = int(os.getenv("SMTP_BATCH_SIZE", "20"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_MAX_ATTEMPTS = int(os.getenv("SMTP_MAX_ATTEMPTS", "5"))
+SMTP_RETRY_BASE_SECONDS = float(os.getenv("SMTP_RETRY_BASE_SECONDS", "5"))
+
 # Frontend URL for verification links - use API domain for password reset page
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://api.kashifroad.com/api/auth")
 ADMIN_URL = os.getenv("ADMIN_URL", "https://admin.kashifroad.com")
 
 
+class LocalSMTP:
+    """
+    In-memory SMTP stand-in for tests and local runs (SMTP_BACKEND=local).
+    Speaks the part of smtplib.SMTP the pool uses and records every message
+    in the class-level `outbox`; recipients in `rejected` fail permanently.
+    """
+
+    outbox = []
+    rejected = set()
+
+    def __init__(self, host=None, port=None, timeout=None):
+        self.host = host
+        self.port = port
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return (250, b"OK")
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if to_addrs in self.rejected:
+            raise smtplib.SMTPRecipientsRefused({to_addrs: (550, b"Mailbox unavailable")})
+        self.outbox.append({"from": from_addr, "to": to_addrs, "message": msg})
+        return {}
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+smtp_factory = LocalSMTP if os.getenv("SMTP_BACKEND", "").lower() == "local" else smtplib.SMTP
+
+
+def set_smtp_factory(factory):
+    """Swap the SMTP connection class (tests); open pool connections are dropped"""
+    global smtp_factory
+    smtp_factory = factory
+    with _state_lock:
+        _generation[0] += 1
+
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx replies and refused recipients will not succeed on retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException) and not isinstance(error, smtplib.SMTPAuthenticationError):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+# ── Queue and worker pool ──────────────────────────────────────────
+# (to_email, subject, message_string, attempt)
+_outbox = queue.Queue()
+_retries = []  # heap of (due_monotonic, seq, item)
+_retry_seq = [0]
+_state_lock = threading.Lock()
+_workers = []
+_generation = [0]  # bumped by set_smtp_factory so workers reconnect
+_stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+
+def _build_message(to_email: str, subject: str, html_content: str, plain_content: Optional[str]) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+    msg["To"] = to_email
+
+    # Add plain text version (fallback)
+    if plain_content:
+        msg.attach(MIMEText(plain_content, "plain", "utf-8"))
+
+    # Add HTML version
+    msg.attach(MIMEText(html_content, "html", "utf-8"))
+    return msg.as_string()
+
+
+class _PooledConnection:
+    """One authenticated SMTP connection, reopened when dropped or after idling"""
+
+    def __init__(self):
+        self.server = None
+        self.generation = None
+        self.last_used = 0.0
+
+    def get(self):
+        stale = time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT
+        if self.server is not None and (stale or self.generation != _generation[0]):
+            self.close()
+        if self.server is None:
+            server = smtp_factory(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_USE_TLS:
+                server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            self.server = server
+            self.generation = _generation[0]
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+    def send(self, to_email: str, message: str):
+        try:
+            self.get().sendmail(SMTP_FROM_EMAIL, to_email, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Server closed the idle connection; reconnect once
+            self.close()
+            self.get().sendmail(SMTP_FROM_EMAIL, to_email, message)
+        self.last_used = time.monotonic()
+
+
+def _retry_later(item: tuple, error: Exception):
+    to_email, subject, message, attempt = item
+    if _is_permanent(error) or attempt + 1 >= SMTP_MAX_ATTEMPTS:
+        with _state_lock:
+            _stats["failed"] += 1
+        logger.error(f"Giving up on email to {to_email} ({subject}) after {attempt + 1} attempts: {error}")
+        return
+    delay = SMTP_RETRY_BASE_SECONDS * (2 ** attempt)
+    with _state_lock:
+        _stats["retried"] += 1
+        _retry_seq[0] += 1
+        heapq.heappush(_retries, (time.monotonic() + delay, _retry_seq[0], (to_email, subject, message, attempt + 1)))
+    logger.warning(f"Email to {to_email} failed ({error}), retry {attempt + 1} in {delay:.0f}s")
+
+
+def _release_due_retries():
+    now = time.monotonic()
+    with _state_lock:
+        while _retries and _retries[0][0] <= now:
+            _outbox.put(heapq.heappop(_retries)[2])
+
+
+def _worker():
+    connection = _PooledConnection()
+    while True:
+        _release_due_retries()
+        try:
+            batch = [_outbox.get(timeout=1)]
+        except queue.Empty:
+            if connection.server is not None and time.monotonic() - connection.last_used > SMTP_IDLE_TIMEOUT:
+                connection.close()
+            continue
+        while len(batch) < SMTP_BATCH_SIZE:
+            try:
+                batch.append(_outbox.get_nowait())
+            except queue.Empty:
+                break
+
+        for item in batch:
+            to_email, subject, message, attempt = item
+            try:
+                connection.send(to_email, message)
+                with _state_lock:
+                    _stats["sent"] += 1
+                logger.info(f"Email sent successfully to {to_email}")
+            except smtplib.SMTPAuthenticationError as e:
+                logger.error(f"SMTP Authentication failed: {e}")
+                connection.close()
+                _retry_later(item, e)
+            except Exception as e:
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    connection.close()
+                _retry_later(item, e)
+            finally:
+                _outbox.task_done()
+
+
+def _ensure_workers():
+    with _state_lock:
+        if _workers:
+            return
+        for _ in range(max(SMTP_POOL_SIZE, 1)):
+            thread = threading.Thread(target=_worker, daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
 def send_email(
     to_email: str,
     subject: str,
@@ -32,92 +241,80 @@ def send_email(
     plain_content: Optional[str] = None
 ) -> bool:
     """
-    Send an email using SMTP with STARTTLS
-    
+    Queue an email for delivery by the SMTP pool
+
     Args:
         to_email: Recipient email address
         subject: Email subject
         html_content: HTML body of the email
         plain_content: Optional plain text alternative
-    
+
     Returns:
-        True if email sent successfully, False otherwise
+        True if the email was queued, False if it could not be built
     """
     try:
-        # Create message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
-        msg["To"] = to_email
-        
-        # Add plain text version (fallback)
-        if plain_content:
-            part1 = MIMEText(plain_content, "plain", "utf-8")
-            msg.attach(part1)
-        
-        # Add HTML version
-        part2 = MIMEText(html_content, "html", "utf-8")
-        msg.attach(part2)
-        
-        # Connect to SMTP server and send
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            if SMTP_USE_TLS:
-                server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            server.sendmail(SMTP_FROM_EMAIL, to_email, msg.as_string())
-        
-        logger.info(f"Email sent successfully to {to_email}")
-        return True
-        
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error(f"SMTP Authentication failed: {e}")
-        return False
-    except smtplib.SMTPException as e:
-        logger.error(f"SMTP error sending email to {to_email}: {e}")
-        return False
+        message = _build_message(to_email, subject, html_content, plain_content)
     except Exception as e:
-        logger.error(f"Unexpected error sending email to {to_email}: {e}")
+        logger.error(f"Unexpected error building email to {to_email}: {e}")
         return False
+    _ensure_workers()
+    with _state_lock:
+        _stats["queued"] += 1
+    _outbox.put((to_email, subject, message, 0))
+    return True
 
 
-def send_verification_email(
-    to_email: str,
-    full_name: str,
-    verification_token: str,
-    language: str = "ar"
-) -> bool:
-    """
-    Send account verification email
-    
-    Args:
-        to_email: User's email address
-        full_name: User's full name
-        verification_token: JWT token for verification
-        language: User's preferred language (ar, de, en)
-    
-    Returns:
-        True if email sent successfully
-    """
-    verification_link = f"{FRONTEND_URL}/verify?token={verification_token}"
+def wait_until_sent(timeout: float = 10) -> bool:
+    """Block until the queue (including pending retries) is drained; False on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with _state_lock:
+            idle = not _retries and _outbox.unfinished_tasks == 0
+        if idle:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def stats() -> dict:
+    """Delivery counters of this worker plus the current backlog"""
+    with _state_lock:
+        return {**_stats, "backlog": _outbox.qsize(), "retry_pending": len(_retries)}
+
+
+def _render(template: Tuple[str, str, str], **values) -> Tuple[str, str, str]:
+    """Fill a cached (subject, html, plain) template; values are HTML-escaped in the HTML part"""
+    subject, html_content, plain_content = template
+    return (
+        subject,
+        Template(html_content).safe_substitute({key: escape(str(value)) for key, value in values.items()}),
+        Template(plain_content).safe_substitute(values),
+    )
+
+
+@lru_cache(maxsize=16)
+def _verification_template(language: str) -> Tuple[str, str, str]:
+    """(subject, html, plain) for `language`, with $full_name / $link placeholders"""
+    verification_link = "$link"
     
     # Multi-language support
     if language == "de":
         subject = "Bestätigen Sie Ihr Kashif Road Konto"
-        greeting = f"Hallo {full_name},"
+        greeting = "Hallo $full_name,"
         message = "Vielen Dank für Ihre Registrierung bei Kashif Road! Bitte klicken Sie auf den Button unten, um Ihr Konto zu bestätigen:"
         button_text = "Konto bestätigen"
         footer = "Wenn Sie sich nicht bei Kashif Road registriert haben, ignorieren Sie bitte diese E-Mail."
         expiry_note = "Dieser Link ist 24 Stunden gültig."
     elif language == "en":
         subject = "Verify Your Kashif Road Account"
-        greeting = f"Hello {full_name},"
+        greeting = "Hello $full_name,"
         message = "Thank you for registering with Kashif Road! Please click the button below to verify your account:"
         button_text = "Verify Account"
         footer = "If you did not register with Kashif Road, please ignore this email."
         expiry_note = "This link is valid for 24 hours."
     else:  # Arabic (default)
         subject = "تأكيد حسابك في Kashif Road"
-        greeting = f"مرحباً {full_name}،"
+        greeting = "مرحباً $full_name،"
         message = "شكراً لتسجيلك في Kashif Road! يرجى النقر على الزر أدناه لتأكيد حسابك:"
         button_text = "تأكيد الحساب"
         footer = "إذا لم تقم بالتسجيل في Kashif Road، يرجى تجاهل هذا البريد الإلكتروني."
@@ -188,47 +385,57 @@ def send_verification_email(
     
     plain_content = f"{greeting}\n\n{message}\n\n{verification_link}\n\n{expiry_note}\n\n{footer}"
     
-    return send_email(to_email, subject, html_content, plain_content)
+    return subject, html_content, plain_content
 
 
-def send_password_reset_email(
+def send_verification_email(
     to_email: str,
     full_name: str,
-    reset_token: str,
+    verification_token: str,
     language: str = "ar"
 ) -> bool:
     """
-    Send password reset email
+    Send account verification email
     
     Args:
         to_email: User's email address
         full_name: User's full name
-        reset_token: JWT token for password reset
+        verification_token: JWT token for verification
         language: User's preferred language (ar, de, en)
     
     Returns:
-        True if email sent successfully
+        True if the email was queued
     """
-    reset_link = f"{FRONTEND_URL}/reset-password?token={reset_token}"
+    return send_email(to_email, *_render(
+        _verification_template(language),
+        full_name=full_name,
+        link=f"{FRONTEND_URL}/verify?token={verification_token}"
+    ))
+
+
+@lru_cache(maxsize=16)
+def _password_reset_template(language: str) -> Tuple[str, str, str]:
+    """(subject, html, plain) for `language`, with $full_name / $link placeholders"""
+    reset_link = "$link"
     
     # Multi-language support
     if language == "de":
         subject = "Passwort zurücksetzen - Kashif Road"
-        greeting = f"Hallo {full_name},"
+        greeting = "Hallo $full_name,"
         message = "Sie haben eine Anfrage zum Zurücksetzen Ihres Passworts gestellt. Klicken Sie auf den Button unten, um ein neues Passwort festzulegen:"
         button_text = "Passwort zurücksetzen"
         footer = "Wenn Sie diese Anfrage nicht gestellt haben, ignorieren Sie diese E-Mail. Ihr Passwort bleibt unverändert."
         expiry_note = "Dieser Link ist 1 Stunde gültig."
     elif language == "en":
         subject = "Reset Your Password - Kashif Road"
-        greeting = f"Hello {full_name},"
+        greeting = "Hello $full_name,"
         message = "You have requested to reset your password. Click the button below to set a new password:"
         button_text = "Reset Password"
         footer = "If you did not request this, please ignore this email. Your password will remain unchanged."
         expiry_note = "This link is valid for 1 hour."
     else:  # Arabic (default)
         subject = "إعادة تعيين كلمة المرور - Kashif Road"
-        greeting = f"مرحباً {full_name}،"
+        greeting = "مرحباً $full_name،"
         message = "لقد طلبت إعادة تعيين كلمة المرور الخاصة بك. انقر على الزر أدناه لتعيين كلمة مرور جديدة:"
         button_text = "إعادة تعيين كلمة المرور"
         footer = "إذا لم تطلب ذلك، يرجى تجاهل هذا البريد الإلكتروني. ستبقى كلمة المرور الخاصة بك دون تغيير."
@@ -308,41 +515,51 @@ def send_password_reset_email(
     
     plain_content = f"{greeting}\n\n{message}\n\n{reset_link}\n\n{expiry_note}\n\n{footer}"
     
-    return send_email(to_email, subject, html_content, plain_content)
+    return subject, html_content, plain_content
 
 
-def send_verification_code_email(
+def send_password_reset_email(
     to_email: str,
     full_name: str,
-    verification_code: str,
+    reset_token: str,
     language: str = "ar"
 ) -> bool:
     """
-    Send verification code email (6-digit code)
+    Send password reset email
     
     Args:
         to_email: User's email address
         full_name: User's full name
-        verification_code: 6-digit verification code
+        reset_token: JWT token for password reset
         language: User's preferred language (ar, de, en)
     
     Returns:
-        True if email sent successfully
+        True if the email was queued
     """
+    return send_email(to_email, *_render(
+        _password_reset_template(language),
+        full_name=full_name,
+        link=f"{FRONTEND_URL}/reset-password?token={reset_token}"
+    ))
+
+
+@lru_cache(maxsize=16)
+def _verification_code_template(language: str) -> Tuple[str, str, str]:
+    """(subject, html, plain) for `language`, with $full_name / $code placeholders"""
     # Multi-language support
     if language == "de":
         subject = "Ihr Bestätigungscode - Kashif Road"
-        greeting = f"Hallo {full_name},"
+        greeting = "Hallo $full_name,"
         message = "Hier ist Ihr Bestätigungscode:"
         footer = "Dieser Code ist 10 Minuten gültig. Teilen Sie diesen Code mit niemandem."
     elif language == "en":
         subject = "Your Verification Code - Kashif Road"
-        greeting = f"Hello {full_name},"
+        greeting = "Hello $full_name,"
         message = "Here is your verification code:"
         footer = "This code is valid for 10 minutes. Do not share this code with anyone."
     else:  # Arabic (default)
         subject = "رمز التحقق الخاص بك - Kashif Road"
-        greeting = f"مرحباً {full_name}،"
+        greeting = "مرحباً $full_name،"
         message = "إليك رمز التحقق الخاص بك:"
         footer = "هذا الرمز صالح لمدة 10 دقائق. لا تشارك هذا الرمز مع أي شخص."
     
@@ -398,7 +615,7 @@ def send_verification_code_email(
         <div class="content">
             <p>{greeting}</p>
             <p>{message}</p>
-            <div class="code">{verification_code}</div>
+            <div class="code">$code</div>
             <p><small>{footer}</small></p>
         </div>
         <div class="footer">
@@ -408,6 +625,38 @@ def send_verification_code_email(
     </html>
     """
     
-    plain_content = f"{greeting}\n\n{message}\n\n{verification_code}\n\n{footer}"
+    plain_content = f"{greeting}\n\n{message}\n\n$code\n\n{footer}"
     
-    return send_email(to_email, subject, html_content, plain_content)
+    return subject, html_content, plain_content
+
+
+def send_verification_code_email(
+    to_email: str,
+    full_name: str,
+    verification_code: str,
+    language: str = "ar"
+) -> bool:
+    """
+    Send verification code email (6-digit code)
+    
+    Args:
+        to_email: User's email address
+        full_name: User's full name
+        verification_code: 6-digit verification code
+        language: User's preferred language (ar, de, en)
+    
+    Returns:
+        True if the email was queued
+    """
+    return send_email(to_email, *_render(
+        _verification_code_template(language),
+        full_name=full_name,
+        code=verification_code
+    ))
+
+
+# Pre-render every language once at import
+for _language in ("ar", "en", "de"):
+    _verification_template(_language)
+    _password_reset_template(_language)
+    _verification_code_template(_language)
@@ -1,9 +1,14 @@
+import json
 import logging
 import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
 
 import crud
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials, exceptions, messaging
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
@@ -26,6 +31,151 @@ else:
     logger.warning("Firebase credentials not found. Push notifications will not work.")
 
 
+# FCM accepts at most 500 tokens per multicast request
+FCM_MULTICAST_LIMIT = 500
+
+# Per-token errors after which FCM will never deliver to the token again
+DEAD_TOKEN_ERRORS = {"UNREGISTERED", "SENDER_ID_MISMATCH", "INVALID_REGISTRATION_TOKEN"}
+
+
+def _error_code(error: Exception) -> str:
+    if isinstance(error, messaging.UnregisteredError):
+        return "UNREGISTERED"
+    if isinstance(error, messaging.SenderIdMismatchError):
+        return "SENDER_ID_MISMATCH"
+    # INVALID_ARGUMENT also covers bad payloads; only a bad token kills the token
+    if isinstance(error, exceptions.InvalidArgumentError) and "registration token" in str(error).lower():
+        return "INVALID_REGISTRATION_TOKEN"
+    return getattr(error, "code", None) or type(error).__name__
+
+
+class FirebaseTransport:
+    """Sends through the Firebase Admin SDK (HTTP v1, one call per multicast)"""
+
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: dict) -> List[Optional[str]]:
+        """Error code per token, None where the send succeeded"""
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+            tokens=tokens
+        )
+        response = messaging.send_each_for_multicast(message)
+        return [None if r.success else _error_code(r.exception) for r in response.responses]
+
+
+class FakeTransport:
+    """
+    In-memory FCM stand-in for tests and local runs (FCM_TRANSPORT=fake).
+    Records every multicast; tokens in `dead_tokens` fail as UNREGISTERED.
+    """
+
+    def __init__(self, dead_tokens=None):
+        self.sent = []
+        self.dead_tokens = set(dead_tokens or [])
+
+    def send_multicast(self, tokens: List[str], title: str, body: str, data: dict) -> List[Optional[str]]:
+        self.sent.append({"tokens": list(tokens), "title": title, "body": body, "data": dict(data)})
+        return ["UNREGISTERED" if token in self.dead_tokens else None for token in tokens]
+
+
+transport = FakeTransport() if os.getenv("FCM_TRANSPORT", "").lower() == "fake" else FirebaseTransport()
+
+
+def set_transport(new_transport):
+    """Swap the FCM transport (tests)"""
+    global transport
+    transport = new_transport
+
+
+# Service-wide send-rate budget (device tokens per second). Every sender in
+# a worker (consumer handlers, broadcasts and the scheduler) draws from one
+# bucket, and each of the WEB_CONCURRENCY uvicorn workers gets an equal share,
+# so the service as a whole stays within the budget. Bursts (bulk status
+# changes, broadcasts) are smoothed instead of hitting FCM at once.
+# 0 disables the limit.
+FCM_SEND_RATE_PER_SECOND = float(os.getenv("FCM_SEND_RATE_PER_SECOND", "500"))
+WORKER_COUNT = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+WORKER_SEND_RATE_PER_SECOND = FCM_SEND_RATE_PER_SECOND / WORKER_COUNT
+
+
+class SendRateLimiter:
+    """
+    Token bucket: callers take `count` tokens and sleep off any deficit, so
+    concurrent senders queue up behind each other at `rate` per second.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.available = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int) -> float:
+        """Take `count` tokens, blocking until they are paid for; returns the wait"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            self.available -= count
+            wait = -self.available / self.rate if self.available < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+rate_limiter = SendRateLimiter(
+    WORKER_SEND_RATE_PER_SECOND,
+    max(int(WORKER_SEND_RATE_PER_SECOND), FCM_MULTICAST_LIMIT)
+)
+
+
+def send_to_tokens(
+    db: Session,
+    tokens: List[str],
+    title: str,
+    body: str,
+    data: dict = None
+) -> Dict[str, int]:
+    """
+    Send one notification to any number of tokens, in multicast batches of
+    FCM_MULTICAST_LIMIT. Tokens FCM reports as dead are deactivated.
+    """
+    # FCM data payloads only carry strings
+    payload = {key: str(value) for key, value in (data or {}).items() if value is not None}
+    success_count = 0
+    failure_count = 0
+    dead_tokens = []
+
+    for start in range(0, len(tokens), FCM_MULTICAST_LIMIT):
+        batch = tokens[start:start + FCM_MULTICAST_LIMIT]
+        rate_limiter.acquire(len(batch))
+        try:
+            errors = transport.send_multicast(batch, title, body, payload)
+        except Exception as e:
+            logger.error(f"FCM multicast of {len(batch)} tokens failed: {e}")
+            failure_count += len(batch)
+            continue
+        for token, error in zip(batch, errors):
+            if error is None:
+                success_count += 1
+                continue
+            failure_count += 1
+            if error in DEAD_TOKEN_ERRORS:
+                dead_tokens.append(token)
+            else:
+                logger.warning(f"Failed to send to token {token[:20]}...: {error}")
+
+    deactivated = 0
+    if dead_tokens:
+        deactivated = crud.deactivate_device_tokens(db, dead_tokens)
+        logger.info(f"Deactivated {deactivated} dead device tokens")
+
+    return {"success_count": success_count, "failure_count": failure_count, "deactivated": deactivated}
+
+
 def send_push_notification(
     db: Session,
     user_id: int,
@@ -36,59 +186,119 @@ def send_push_notification(
 ):
     """Send push notification to user's devices (respects preferences)"""
     try:
+        # Preferences and device tokens, cached per user
+        profile = crud.get_delivery_profile(db, user_id)
+        
         # Check notification preferences
         if notification_type:
-            if not crud.is_notification_enabled(db, user_id, notification_type):
+            if not crud.profile_allows(profile, notification_type):
                 logger.info(f"Notification type '{notification_type}' disabled for user {user_id}, skipping push")
                 return {"success_count": 0, "failure_count": 0, "skipped": "disabled"}
         
-        # Check quiet hours
-        if crud.is_in_quiet_hours(db, user_id):
-            logger.info(f"User {user_id} is in quiet hours, skipping push")
-            return {"success_count": 0, "failure_count": 0, "skipped": "quiet_hours"}
-
-        # Get user's device tokens
-        device_tokens = crud.get_user_device_tokens(db, user_id)
-        
-        if not device_tokens:
+        tokens = profile["tokens"]
+        if not tokens:
             logger.info(f"No device tokens found for user {user_id}")
             return
+
+        # Hold the push until quiet hours are over
+        if crud.profile_in_quiet_hours(profile):
+            deliver_after = crud.next_hour_at(profile["prefs"]["quiet_hours_end"])
+            crud.schedule_pushes(db, [(user_id, deliver_after)], title, body, data, notification_type)
+            logger.info(f"User {user_id} is in quiet hours, push deferred until {deliver_after}")
+            return {
+                "success_count": 0,
+                "failure_count": 0,
+                "deferred": "quiet_hours",
+                "deliver_after": deliver_after.isoformat()
+            }
         
-        tokens = [dt.token for dt in device_tokens]
         logger.info(f"Sending push notification to user {user_id} with {len(tokens)} tokens")
         
-        # Send to each token individually using HTTP v1 API
-        success_count = 0
-        failure_count = 0
-        
-        for token in tokens:
-            try:
-                # Create message for single token
-                message = messaging.Message(
-                    notification=messaging.Notification(
-                        title=title,
-                        body=body
-                    ),
-                    data=data or {},
-                    token=token
-                )
-                
-                # Send message using HTTP v1 API
-                message_id = messaging.send(message)
-                logger.info(f"Successfully sent notification to user {user_id}, message_id: {message_id}")
-                success_count += 1
-                
-            except Exception as token_error:
-                logger.error(f"Failed to send to token {token[:20]}...: {token_error}")
-                failure_count += 1
-        
+        result = send_to_tokens(db, tokens, title, body, data)
         logger.info(
             f"Push notification sent to user {user_id}: "
-            f"{success_count} successful, {failure_count} failed"
+            f"{result['success_count']} successful, {result['failure_count']} failed"
         )
         
-        return {"success_count": success_count, "failure_count": failure_count}
+        return result
         
     except Exception as e:
         logger.error(f"Failed to send push notification: {e}", exc_info=True)
         return None
+
+
+def send_push_to_users(
+    db: Session,
+    user_ids: List[int],
+    title: str,
+    body: str,
+    data: dict = None,
+    notification_type: str = None
+) -> Dict[str, int]:
+    """
+    Send the same notification to many users, batching tokens across users.
+    Preferences and quiet hours are applied in the token query; users in
+    their quiet hours get the push deferred instead.
+    """
+    quiet = crud.get_quiet_hours_recipients(db, user_ids, notification_type)
+    deferred = crud.schedule_pushes(
+        db,
+        [(user_id, crud.next_hour_at(end)) for user_id, end in quiet],
+        title, body, data, notification_type
+    )
+    tokens = crud.get_push_tokens_for_users(db, user_ids, notification_type)
+    if not tokens:
+        return {"success_count": 0, "failure_count": 0, "deactivated": 0, "deferred": deferred}
+    result = send_to_tokens(db, tokens, title, body, data)
+    result["deferred"] = deferred
+    return result
+
+
+def release_scheduled_pushes(db: Session, limit: int) -> Dict[str, int]:
+    """
+    Deliver up to `limit` due scheduled pushes. Preferences are re-checked at
+    release: disabled types or users without tokens are skipped, users whose
+    quiet hours moved are deferred again. Identical payloads go out as one
+    multicast across users, paced by the send-rate budget.
+    """
+    rows = crud.get_due_pushes(db, limit)
+    groups = {}
+    skipped = []
+    rescheduled = {}
+    for row in rows:
+        profile = crud.get_delivery_profile(db, row.user_id)
+        if not profile["tokens"] or not crud.profile_allows(profile, row.notification_type):
+            skipped.append(row.id)
+            continue
+        if crud.profile_in_quiet_hours(profile):
+            deliver_after = crud.next_hour_at(profile["prefs"]["quiet_hours_end"])
+            rescheduled.setdefault(deliver_after, []).append(row.id)
+            continue
+        push_ids, tokens = groups.setdefault((row.title, row.body, row.data), ([], []))
+        push_ids.append(row.id)
+        tokens.extend(profile["tokens"])
+
+    crud.update_scheduled_pushes(db, skipped, status="skipped")
+    for deliver_after, push_ids in rescheduled.items():
+        crud.update_scheduled_pushes(db, push_ids, deliver_after=deliver_after)
+
+    success_count = 0
+    failure_count = 0
+    for (title, body, data), (push_ids, tokens) in groups.items():
+        result = send_to_tokens(db, tokens, title, body, json.loads(data) if data else None)
+        success_count += result["success_count"]
+        failure_count += result["failure_count"]
+        crud.update_scheduled_pushes(
+            db, push_ids,
+            status="sent" if result["success_count"] else "failed",
+            sent_at=datetime.utcnow()
+        )
+
+    return {
+        "due": len(rows),
+        "released": sum(len(push_ids) for push_ids, _ in groups.values()),
+        "skipped": len(skipped),
+        "rescheduled": sum(len(push_ids) for push_ids in rescheduled.values()),
+        "success_count": success_count,
+        "failure_count": failure_count,
+    }
@@ -1,19 +1,24 @@
 import logging
 import os
 import threading
+from datetime import datetime, timedelta
 from typing import Annotated, List, Optional
 
 import auth_client
 import crud
+import email_service
 import fcm_service
+import inbox_stream
 import models
 import schemas
+from consumer_metrics import get_queue_stats, metrics
 from database import engine, get_db
-from fastapi import Depends, FastAPI, Header, HTTPException, status
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from json_logger import setup_logging
 from logging_middleware import RequestLoggingMiddleware
-from rabbitmq_consumer import start_consumer
+from rabbitmq_consumer import QUEUE_NAME, start_consumer
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
@@ -38,10 +43,22 @@ app.add_middleware(RequestLoggingMiddleware)
 
 logger = setup_logging("notification")
 
+# Partitions must exist before the consumer's first insert on a fresh database
+try:
+    from database import SessionLocal
+    with SessionLocal() as startup_db:
+        crud.ensure_notification_partitions(startup_db)
+except Exception as e:
+    logger.error(f"Failed to create notification partitions: {e}")
+
 # Start RabbitMQ consumer
 consumer_thread = threading.Thread(target=start_consumer, daemon=True)
 consumer_thread.start()
 
+# Inbox stream fan-out across workers
+threading.Thread(target=inbox_stream.run_publisher, daemon=True).start()
+threading.Thread(target=inbox_stream.run_listener, daemon=True).start()
+
 
 @app.get("/health")
 def health_check():
@@ -144,18 +161,26 @@ async def unregister_device(
 @app.get("/", response_model=List[schemas.Notification])
 async def get_notifications(
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
     unread_only: bool = False,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    """Get user's notifications"""
+    """
+    Get user's notifications, newest first.
+    For the next page pass the created_at and id of the last item as
+    `before` and `before_id` instead of increasing `skip`.
+    """
     return crud.get_user_notifications(
         db=db,
         user_id=user_id,
         skip=skip,
         limit=limit,
-        unread_only=unread_only
+        unread_only=unread_only,
+        before=before,
+        before_id=before_id
     )
 
 
@@ -195,6 +220,74 @@ async def get_unread_count(
     return {"unread_count": count}
 
 
+def _load_stream_changes(
+    user_id: int,
+    last_id: Optional[int],
+    updated_ids: List[int] = (),
+    sent_ids: Optional[set] = None
+):
+    """
+    Notifications after `last_id`, the rows to re-send (already-sent ones
+    among `updated_ids`, rewritten since, and rows of the overlap window
+    committed after a higher id went out), the unread count, and the ids the
+    client now holds in the overlap window, for one stream read
+    """
+    from database import SessionLocal
+
+    def dump(rows):
+        return [schemas.Notification.model_validate(n).model_dump(mode="json") for n in rows]
+
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(seconds=inbox_stream.STREAM_OVERLAP_SECONDS)
+        if last_id is None:
+            # Fresh connection: the client has just loaded its inbox
+            last_id = crud.get_latest_notification_id(db, user_id)
+            window = crud.get_recent_notifications(db, user_id, since, last_id)
+            return [], [], last_id, crud.get_unread_count(db, user_id), {n.id for n in window}
+
+        # Without sent_ids (resumed via Last-Event-ID) the whole window is re-sent
+        window = crud.get_recent_notifications(db, user_id, since, last_id)
+        late = [n for n in window if sent_ids is None or n.id not in sent_ids]
+        late_ids = {n.id for n in late}
+        # Rewrites of rows not sent yet arrive with the replay below
+        rewritten = crud.get_notifications_by_ids(
+            db, user_id, [i for i in updated_ids if i <= last_id and i not in late_ids]
+        )
+        notifications = dump(
+            crud.get_notifications_after(db, user_id, last_id, inbox_stream.STREAM_REPLAY_LIMIT)
+        )
+        if notifications:
+            last_id = notifications[-1]["id"]
+        window_ids = {n.id for n in window} | {n["id"] for n in notifications}
+        resent = dump(sorted(late + rewritten, key=lambda n: n.id))
+        return notifications, resent, last_id, crud.get_unread_count(db, user_id), window_ids
+    finally:
+        db.close()
+
+
+@app.get("/stream")
+async def stream_notifications(
+    request: Request,
+    last_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Server-Sent Events stream of the user's inbox: a `notification` event per
+    new notification and an `unread_count` event whenever the count changes,
+    with a heartbeat comment while idle. Reconnecting clients resume after
+    the Last-Event-ID header (or `last_id`).
+    """
+    if last_event_id and last_event_id.isdigit():
+        last_id = int(last_event_id)
+    return StreamingResponse(
+        inbox_stream.event_stream(request, user_id, last_id, _load_stream_changes),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 # ============================================================
 # Notification Preferences Endpoints
 # ============================================================
@@ -218,7 +311,7 @@ async def update_preferences(
     return crud.update_notification_preferences(
         db=db,
         user_id=user_id,
-        updates=prefs.model_dump()
+        updates=prefs.model_dump(exclude_unset=True)
     )
 
 
@@ -255,14 +348,13 @@ async def send_notification(
     return db_notification
 
 
-@app.post("/broadcast")
-async def broadcast_notification(
-    notification: schemas.BroadcastNotificationCreate,
-    authorization: Annotated[str, Header()],
-    db: Session = Depends(get_db)
-):
-    """Broadcast notification to multiple users based on role (admin only)"""
-    # Verify token first
+# Recipients resolved per auth page; each page is one notification insert
+# and one set of multicast pushes
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "1000"))
+
+
+async def get_current_admin(authorization: Annotated[str, Header()]) -> dict:
+    """Verify the bearer token and require the ADMIN role"""
     if not authorization.startswith("Bearer "):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -276,68 +368,229 @@ async def broadcast_notification(
             detail="Invalid token"
         )
     
-    # Only admin can broadcast
     if current_user.get("role", "").upper() != "ADMIN":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admin can broadcast notifications"
         )
-    
-    # Get users based on role filter
-    users = await auth_client.get_users_by_role(token, notification.target_role)
-    
-    if not users:
-        return {
-            "message": "No users found matching criteria",
-            "sent_count": 0,
-            "failed_count": 0
-        }
-    
-    sent_count = 0
-    failed_count = 0
-    
-    for user in users:
-        user_id = user.get("id")
-        if not user_id:
-            continue
-            
-        try:
-            # Create notification in database
-            db_notification = crud.create_notification(
+    return current_user
+
+
+def run_broadcast_job(job_id: str):
+    """
+    Deliver a broadcast page by page, recording progress and the last
+    recipient on the job so a worker restarted mid-job resumes after it
+    """
+    import asyncio
+    from database import SessionLocal
+
+    async def deliver(db: Session, job: models.BroadcastJob):
+        if job.status == "pending":
+            job.total = await auth_client.count_recipients(job.target_role)
+            job.status = "running"
+            db.commit()
+        async for user_ids in auth_client.iter_recipient_ids(
+            job.target_role, BROADCAST_PAGE_SIZE, after_id=job.last_user_id
+        ):
+            # The cursor commits together with the page's notifications
+            job.last_user_id = user_ids[-1]
+            job.processed += len(user_ids)
+            crud.bulk_create_notifications(db, user_ids, job.title, job.body, job.type)
+            push = fcm_service.send_push_to_users(
                 db=db,
-                user_id=user_id,
-                title=notification.title,
-                body=notification.body,
-                notification_type=notification.type
+                user_ids=user_ids,
+                title=job.title,
+                body=job.body,
+                data={"notification_id": "broadcast", "broadcast_id": job.id, "type": job.type},
+                notification_type=job.type
+            )
+            job.push_success += push["success_count"]
+            job.push_failure += push["failure_count"]
+            db.commit()
+
+    with engine.connect() as lock_conn:
+        if not crud.try_lock_broadcast_job(lock_conn, job_id):
+            return  # Delivered by another worker
+        db = SessionLocal()
+        try:
+            job = crud.get_broadcast_job(db, job_id)
+            if job is None or job.status not in crud.BROADCAST_UNFINISHED_STATUSES:
+                return
+            if job.last_user_id:
+                logger.info(f"Broadcast job {job_id}: resuming after user {job.last_user_id}")
+            asyncio.run(deliver(db, job))
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"Broadcast job {job_id}: {job.processed}/{job.total} notifications, "
+                f"{job.push_success} pushes sent, {job.push_failure} failed"
             )
-            
-            # Send push notification
-            try:
-                fcm_service.send_push_notification(
-                    db=db,
-                    user_id=user_id,
-                    title=notification.title,
-                    body=notification.body,
-                    data={"notification_id": str(db_notification.id)}
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Failed to send push to user {user_id}: {e}")
-                sent_count += 1  # Notification was created, just push failed
-                
         except Exception as e:
-            logger.error(f"Failed to create notification for user {user_id}: {e}")
-            failed_count += 1
+            db.rollback()
+            logger.error(f"Broadcast job {job_id} failed: {e}")
+            job = crud.get_broadcast_job(db, job_id)
+            if job:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+            crud.unlock_broadcast_job(lock_conn, job_id)
+
+
+def resume_broadcast_jobs():
+    """Restart broadcasts left pending or running when a worker stopped"""
+    from database import SessionLocal
+    with SessionLocal() as db:
+        job_ids = crud.get_unfinished_broadcast_job_ids(db)
+    for job_id in job_ids:
+        threading.Thread(target=run_broadcast_job, args=(job_id,), daemon=True).start()
+
+
+try:
+    resume_broadcast_jobs()
+except Exception as e:
+    logger.error(f"Failed to resume broadcast jobs: {e}")
+
+
+@app.post("/broadcast")
+async def broadcast_notification(
+    notification: schemas.BroadcastNotificationCreate,
+    current_user: dict = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Broadcast notification to multiple users based on role (admin only).
+    Delivery runs in the background; poll GET /broadcast/{job_id} for progress.
+    """
+    import uuid
+    job = crud.create_broadcast_job(db, str(uuid.uuid4()), notification, current_user.get("id"))
+    threading.Thread(target=run_broadcast_job, args=(job.id,), daemon=True).start()
     
     target_desc = notification.target_role if notification.target_role else "ALL"
+    logger.info(f"Admin {current_user.get('id')} queued broadcast job {job.id} to {target_desc} users")
     return {
-        "message": f"Broadcast to {target_desc} users completed",
-        "sent_count": sent_count,
-        "failed_count": failed_count,
-        "total_users": len(users)
+        "message": f"Broadcast to {target_desc} users started",
+        "job_id": job.id,
+        "status": job.status
     }
 
 
+@app.get("/broadcast/{job_id}", response_model=schemas.BroadcastJob)
+async def get_broadcast_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Progress of a broadcast job (admin only)"""
+    job = crud.get_broadcast_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return job
+
+
+# ============================================================
+# Deferred delivery scheduler
+# ============================================================
+
+# Pushes held back (coalescing window, daily digest, quiet hours) are released
+# by one worker at a time (a PostgreSQL advisory lock), so a due push is
+# never sent twice; pacing comes from fcm_service.rate_limiter
+PUSH_SCHEDULER_INTERVAL_SECONDS = float(os.getenv("PUSH_SCHEDULER_INTERVAL_SECONDS", "5"))
+PUSH_RELEASE_BATCH_SIZE = int(os.getenv("PUSH_RELEASE_BATCH_SIZE", "1000"))
+PUSH_SCHEDULER_LOCK_KEY = 7310044
+
+
+def release_due_pushes() -> int:
+    """Release every due scheduled push in batches; returns how many were released"""
+    from database import SessionLocal
+
+    released = 0
+    with engine.connect() as lock_conn:
+        locked = lock_conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": PUSH_SCHEDULER_LOCK_KEY}
+        ).scalar()
+        if not locked:
+            return 0
+        db = SessionLocal()
+        try:
+            while True:
+                result = fcm_service.release_scheduled_pushes(db, PUSH_RELEASE_BATCH_SIZE)
+                released += result["released"]
+                if result["released"]:
+                    logger.info(f"Push scheduler released {result['released']} deferred pushes: {result}")
+                if result["due"] < PUSH_RELEASE_BATCH_SIZE:
+                    break
+        finally:
+            db.close()
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": PUSH_SCHEDULER_LOCK_KEY})
+            lock_conn.commit()
+    return released
+
+
+def run_push_scheduler():
+    import time
+
+    while True:
+        time.sleep(PUSH_SCHEDULER_INTERVAL_SECONDS)
+        try:
+            release_due_pushes()
+        except Exception as e:
+            logger.error(f"Push scheduler run failed: {e}")
+
+
+threading.Thread(target=run_push_scheduler, daemon=True).start()
+
+
+# ============================================================
+# Inbox partitions and retention
+# ============================================================
+
+NOTIFICATION_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("NOTIFICATION_MAINTENANCE_INTERVAL_HOURS", "6"))
+
+
+def run_notification_maintenance(db: Session):
+    created = crud.ensure_notification_partitions(db)
+    if created:
+        logger.info(f"Created notification partitions: {created}")
+    if crud.NOTIFICATION_RETENTION_DAYS <= 0:
+        return
+    cutoff = datetime.utcnow() - timedelta(days=crud.NOTIFICATION_RETENTION_DAYS)
+    archive = crud.NOTIFICATION_RETENTION_MODE != "delete"
+    retired = 0
+    while True:
+        batch = crud.retire_read_notifications(db, cutoff, archive=archive)
+        retired += batch
+        if batch < crud.NOTIFICATION_RETENTION_BATCH_SIZE:
+            break
+    if retired:
+        logger.info(f"Retention {'archived' if archive else 'deleted'} {retired} read notifications before {cutoff}")
+    dropped = crud.drop_empty_notification_partitions(db, cutoff.date().replace(day=1))
+    if dropped:
+        logger.info(f"Dropped emptied notification partitions: {dropped}")
+
+
+def periodic_notification_maintenance():
+    """Keep notifications partitions ahead of time and apply the retention policy"""
+    import time
+    from database import SessionLocal
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                run_notification_maintenance(db)
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Notification maintenance error: {e}")
+        time.sleep(NOTIFICATION_MAINTENANCE_INTERVAL_HOURS * 60 * 60)
+
+
+threading.Thread(target=periodic_notification_maintenance, daemon=True).start()
+
+
 # ============================================================
 # DSGVO / GDPR — Internal Endpoints (service-to-service only)
 # ============================================================
@@ -348,6 +601,18 @@ def verify_internal_key(x_internal_key: str = Header(None)):
         raise HTTPException(status_code=403, detail="Invalid internal API key")
 
 
+@app.get("/internal/metrics")
+def get_consumer_metrics(_: None = Depends(verify_internal_key)):
+    """RabbitMQ consumer metrics of this worker plus the broker-side queue depth"""
+    return {
+        "service": "notification",
+        "queue": get_queue_stats(QUEUE_NAME),
+        "consumer": metrics.snapshot(),
+        "email": email_service.stats(),
+        "streams": inbox_stream.hub.connected(),
+    }
+
+
 @app.post("/internal/push")
 def internal_send_push(
     request: schemas.InternalPushRequest,
@@ -404,12 +669,26 @@ def delete_user_data(
         models.Notification.user_id == user_id
     ).delete()
 
+    # Delete pushes still waiting for release
+    db.query(models.ScheduledPush).filter(
+        models.ScheduledPush.user_id == user_id
+    ).delete()
+
+    db.query(models.NotificationArchive).filter(
+        models.NotificationArchive.user_id == user_id
+    ).delete()
+
+    db.query(models.UserUnreadCount).filter(
+        models.UserUnreadCount.user_id == user_id
+    ).delete()
+
     # Delete notification preferences
     prefs_deleted = db.query(models.UserNotificationPreferences).filter(
         models.UserNotificationPreferences.user_id == user_id
     ).delete()
 
     db.commit()
+    crud.invalidate_delivery_profiles(user_id)
 
     logger.info(f"DSGVO: Deleted data for user {user_id}: "
                 f"{tokens_deleted} tokens, {notifications_deleted} notifications, "
@@ -453,6 +732,15 @@ def export_user_data(
         "is_read": n.is_read,
         "created_at": n.created_at.isoformat() if n.created_at else None,
     } for n in notifications]
+    # Read notifications moved to the archive by the retention policy
+    notifications_data += [{
+        "id": n["id"],
+        "title": n["title"],
+        "body": n["body"],
+        "type": n["type"],
+        "is_read": True,
+        "created_at": n["created_at"],
+    } for n in reversed(crud.get_archived_notifications(db, user_id))]
 
     # Preferences
     prefs = db.query(models.UserNotificationPreferences).filter(
@@ -467,6 +755,7 @@ def export_user_data(
         "quiet_hours_enabled": prefs.quiet_hours_enabled if prefs else False,
         "quiet_hours_start": prefs.quiet_hours_start if prefs else 22,
         "quiet_hours_end": prefs.quiet_hours_end if prefs else 7,
+        "daily_digest": prefs.daily_digest if prefs else False,
     }
 
     return {
@@ -0,0 +1,4 @@
+-- Migration: Resume cursor for background broadcast jobs
+-- Run inside kashif_notifications database
+
+ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS last_user_id INTEGER NOT NULL DEFAULT 0;
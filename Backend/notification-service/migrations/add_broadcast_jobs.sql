@@ -0,0 +1,19 @@
+-- Migration: Background broadcast jobs
+-- Run inside kashif_notifications database
+
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    title VARCHAR(150) NOT NULL,
+    body TEXT NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    target_role VARCHAR(50),
+    total INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    push_success INTEGER NOT NULL DEFAULT 0,
+    push_failure INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
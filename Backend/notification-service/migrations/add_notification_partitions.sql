@@ -0,0 +1,89 @@
+-- Migration: Monthly range partitioning of notifications + compact archive
+-- Run inside kashif_notifications database
+--
+-- Rewrites notifications; run in a maintenance window (the table is locked
+-- for the duration of the copy). Apply add_unread_counts.sql first.
+
+BEGIN;
+
+LOCK TABLE notifications IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE notifications RENAME TO notifications_unpartitioned;
+ALTER INDEX IF EXISTS notifications_pkey RENAME TO notifications_unpartitioned_pkey;
+ALTER INDEX IF EXISTS ix_notifications_id RENAME TO ix_notifications_unpartitioned_id;
+ALTER INDEX IF EXISTS ix_notifications_user_id RENAME TO ix_notifications_unpartitioned_user_id;
+ALTER INDEX IF EXISTS ix_notifications_is_read RENAME TO ix_notifications_unpartitioned_is_read;
+ALTER INDEX IF EXISTS ix_notifications_created_at RENAME TO ix_notifications_unpartitioned_created_at;
+ALTER INDEX IF EXISTS ix_notifications_user_created RENAME TO ix_notifications_unpartitioned_user_created;
+
+CREATE TABLE notifications (
+    id INTEGER NOT NULL DEFAULT nextval('notifications_id_seq'),
+    user_id INTEGER NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    body TEXT NOT NULL,
+    title_en VARCHAR(150),
+    body_en TEXT,
+    title_ku VARCHAR(150),
+    body_ku TEXT,
+    type VARCHAR(50) NOT NULL,
+    related_report_id INTEGER,
+    related_coupon_id INTEGER,
+    is_read BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- Keep the id sequence when the old table is dropped
+ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id;
+
+CREATE INDEX ix_notifications_id ON notifications (id);
+CREATE INDEX ix_notifications_user_id ON notifications (user_id);
+CREATE INDEX ix_notifications_is_read ON notifications (is_read);
+CREATE INDEX ix_notifications_created_at ON notifications (created_at);
+CREATE INDEX ix_notifications_user_created ON notifications (user_id, created_at DESC, id DESC);
+
+-- Safety net for rows outside the pre-created months (kept empty by the service)
+CREATE TABLE notifications_default PARTITION OF notifications DEFAULT;
+
+-- One partition per month from the oldest notification to two months ahead
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    SELECT date_trunc('month', COALESCE(MIN(created_at), CURRENT_TIMESTAMP))::date
+    INTO m FROM notifications_unpartitioned;
+    WHILE m <= (date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '2 months')::date LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF notifications FOR VALUES FROM (%L) TO (%L)',
+            'notifications_y' || to_char(m, 'YYYY') || 'm' || to_char(m, 'MM'),
+            m, (m + INTERVAL '1 month')::date
+        );
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO notifications (id, user_id, title, body, title_en, body_en, title_ku, body_ku, type,
+                           related_report_id, related_coupon_id, is_read, created_at)
+SELECT id, user_id, title, body, title_en, body_en, title_ku, body_ku, type,
+       related_report_id, related_coupon_id, is_read, created_at
+FROM notifications_unpartitioned;
+
+DROP TABLE notifications_unpartitioned;
+
+-- Read notifications past the retention period, gzip-compressed JSON per user
+CREATE TABLE IF NOT EXISTS notification_archives (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    range_start TIMESTAMP NOT NULL,
+    range_end TIMESTAMP NOT NULL,
+    notification_count INTEGER NOT NULL,
+    payload BYTEA NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_archives_user_id ON notification_archives (user_id);
+
+COMMENT ON TABLE notifications IS 'User inbox, partitioned by month on created_at';
+COMMENT ON TABLE notification_archives IS 'Read notifications moved out of the inbox by the retention policy';
+
+COMMIT;
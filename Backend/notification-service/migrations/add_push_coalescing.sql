@@ -0,0 +1,11 @@
+-- Migration: Push coalescing window and daily digest preference
+-- Run inside kashif_notifications database
+
+ALTER TABLE user_notification_preferences ADD COLUMN IF NOT EXISTS daily_digest BOOLEAN NOT NULL DEFAULT FALSE;
+
+ALTER TABLE scheduled_pushes ADD COLUMN IF NOT EXISTS coalesce_key VARCHAR(50);
+ALTER TABLE scheduled_pushes ADD COLUMN IF NOT EXISTS fragments TEXT;
+
+-- At most one open (pending) coalesced push per user and key
+CREATE UNIQUE INDEX IF NOT EXISTS ix_scheduled_pushes_open_coalesce
+    ON scheduled_pushes (user_id, coalesce_key) WHERE status = 'pending' AND coalesce_key IS NOT NULL;
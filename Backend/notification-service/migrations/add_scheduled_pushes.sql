@@ -0,0 +1,18 @@
+-- Migration: Deferred pushes (quiet hours) for the delivery scheduler
+-- Run inside kashif_notifications database
+
+CREATE TABLE IF NOT EXISTS scheduled_pushes (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    title VARCHAR(150) NOT NULL,
+    body TEXT NOT NULL,
+    data TEXT,
+    notification_type VARCHAR(50),
+    deliver_after TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_scheduled_pushes_user_id ON scheduled_pushes (user_id);
+CREATE INDEX IF NOT EXISTS ix_scheduled_pushes_status_deliver_after ON scheduled_pushes (status, deliver_after);
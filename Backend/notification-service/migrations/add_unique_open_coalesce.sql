@@ -0,0 +1,20 @@
+-- Migration: Enforce one open coalesced push per user and key
+-- Run inside kashif_notifications database
+-- (for databases that applied add_push_coalescing.sql with a non-unique index)
+
+BEGIN;
+
+-- Close duplicates left by concurrent workers; they are still sent when due
+UPDATE scheduled_pushes SET coalesce_key = NULL
+WHERE status = 'pending' AND coalesce_key IS NOT NULL
+  AND id NOT IN (
+      SELECT MAX(id) FROM scheduled_pushes
+      WHERE status = 'pending' AND coalesce_key IS NOT NULL
+      GROUP BY user_id, coalesce_key
+  );
+
+DROP INDEX IF EXISTS ix_scheduled_pushes_open_coalesce;
+CREATE UNIQUE INDEX ix_scheduled_pushes_open_coalesce
+    ON scheduled_pushes (user_id, coalesce_key) WHERE status = 'pending' AND coalesce_key IS NOT NULL;
+
+COMMIT;
@@ -0,0 +1,21 @@
+-- Migration: Materialized unread counters and keyset inbox index
+-- Run inside kashif_notifications database
+
+CREATE TABLE IF NOT EXISTS user_unread_counts (
+    user_id INTEGER PRIMARY KEY,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Backfill from the inbox (existing rows are recomputed)
+INSERT INTO user_unread_counts (user_id, unread_count, updated_at)
+SELECT user_id, COUNT(*), CURRENT_TIMESTAMP
+FROM notifications
+WHERE is_read = FALSE
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE
+SET unread_count = EXCLUDED.unread_count, updated_at = EXCLUDED.updated_at;
+
+CREATE INDEX IF NOT EXISTS ix_notifications_user_created ON notifications (user_id, created_at DESC, id DESC);
+
+COMMENT ON TABLE user_unread_counts IS 'Per-user unread notification count, updated with every notifications insert / read';
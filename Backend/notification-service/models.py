@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from database import Base
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, String,
-                        Text)
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Index, Integer,
+                        LargeBinary, String, Text, text)
 from sqlalchemy.orm import relationship
 
 
@@ -18,6 +18,7 @@ class UserNotificationPreferences(Base):
     quiet_hours_enabled = Column(Boolean, default=False, nullable=False)
     quiet_hours_start = Column(Integer, default=22)  # 0-23
     quiet_hours_end = Column(Integer, default=7)  # 0-23
+    daily_digest = Column(Boolean, default=False, nullable=False)  # Activity pushes once a day
 
 
 class DeviceToken(Base):
@@ -33,9 +34,10 @@ class DeviceToken(Base):
 
 
 class Notification(Base):
+    """User inbox, range-partitioned by month on created_at (see migrations/add_notification_partitions.sql)"""
     __tablename__ = "notifications"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
     title = Column(String(150), nullable=False)
     body = Column(Text, nullable=False)
@@ -47,4 +49,86 @@ class Notification(Base):
     related_report_id = Column(Integer, nullable=True)
     related_coupon_id = Column(Integer, nullable=True)
     is_read = Column(Boolean, default=False, index=True, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+    # Part of the primary key because Postgres requires the partition key in it
+    created_at = Column(DateTime, default=datetime.utcnow, primary_key=True, index=True, nullable=False)
+
+    __table_args__ = (
+        # Inbox pages by keyset: newest first per user
+        Index("ix_notifications_user_created", "user_id", created_at.desc(), id.desc()),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class NotificationArchive(Base):
+    """
+    Read notifications moved out of the inbox by the retention policy: one
+    row per user and retention batch, payload = gzip'd JSON list of rows in
+    ARCHIVE_FIELDS order (see crud)
+    """
+    __tablename__ = "notification_archives"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    range_start = Column(DateTime, nullable=False)  # created_at of the oldest / newest archived row
+    range_end = Column(DateTime, nullable=False)
+    notification_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserUnreadCount(Base):
+    """Per-user unread notification count, updated in the same transaction as the inbox"""
+    __tablename__ = "user_unread_counts"
+
+    user_id = Column(Integer, primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class BroadcastJob(Base):
+    """Progress of an admin broadcast delivered in the background"""
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(String(36), primary_key=True)  # uuid4
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    title = Column(String(150), nullable=False)
+    body = Column(Text, nullable=False)
+    type = Column(String(50), nullable=False)
+    target_role = Column(String(50), nullable=True)  # None = all users
+    total = Column(Integer, nullable=False, default=0)  # Recipients counted when the job started
+    processed = Column(Integer, nullable=False, default=0)  # Notifications created
+    last_user_id = Column(Integer, nullable=False, default=0)  # Resume cursor: last recipient delivered
+    push_success = Column(Integer, nullable=False, default=0)
+    push_failure = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_by = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ScheduledPush(Base):
+    """
+    Push held back until deliver_after (coalescing window, daily digest or
+    quiet hours), released by the delivery scheduler
+    """
+    __tablename__ = "scheduled_pushes"
+    __table_args__ = (
+        Index("ix_scheduled_pushes_status_deliver_after", "status", "deliver_after"),
+        Index(
+            "ix_scheduled_pushes_open_coalesce", "user_id", "coalesce_key", unique=True,
+            postgresql_where=text("status = 'pending' AND coalesce_key IS NOT NULL")
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    title = Column(String(150), nullable=False)
+    body = Column(Text, nullable=False)
+    data = Column(Text, nullable=True)  # JSON object of FCM data fields
+    notification_type = Column(String(50), nullable=True)
+    coalesce_key = Column(String(50), nullable=True)  # Open rows with a key absorb later events
+    fragments = Column(Text, nullable=True)  # JSON list of the merged events
+    deliver_after = Column(DateTime, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent, skipped, failed
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
@@ -13,6 +13,7 @@ class NotificationPreferences(BaseModel):
     quiet_hours_enabled: bool = False
     quiet_hours_start: int = 22  # 0-23
     quiet_hours_end: int = 7  # 0-23
+    daily_digest: bool = False  # Report / points pushes bundled into one per day
 
 
 class NotificationPreferencesResponse(NotificationPreferences):
@@ -55,6 +56,24 @@ class BroadcastNotificationCreate(BaseModel):
     target_role: Optional[str] = None  # None = all users, "USER" = regular users, "COMPANY" = company users, "GOVERNMENT" = government employees
 
 
+class BroadcastJob(BaseModel):
+    id: str
+    status: str
+    title: str
+    type: str
+    target_role: Optional[str] = None
+    total: int
+    processed: int
+    push_success: int
+    push_failure: int
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class InternalPushRequest(BaseModel):
     """Schema for internal service-to-service push requests"""
     user_id: int
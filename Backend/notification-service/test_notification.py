@@ -1,10 +1,60 @@
+import asyncio
+import json
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+import auth_client
+import coalescing
+import crud
+import email_service
+import fcm_service
+import inbox_stream
+import main
+import models
 import pytest
+import schemas
+from database import SessionLocal, engine
 from fastapi.testclient import TestClient
 from main import app
 
 client = TestClient(app)
 
 
+class PushHarness:
+    """Fake FCM transport and a session; users given tokens are cleaned up afterwards"""
+
+    def __init__(self, transport, db):
+        self.transport = transport
+        self.db = db
+        self.user_ids = set()
+
+    def register(self, user_id: int, token: str, device_type: str = "android"):
+        self.user_ids.add(user_id)
+        crud.create_or_update_device_token(self.db, user_id, token, device_type)
+
+
+@pytest.fixture
+def push():
+    """Swap in a FakeTransport for one test and delete its users' push state afterwards"""
+    transport = fcm_service.FakeTransport()
+    fcm_service.set_transport(transport)
+    harness = PushHarness(transport, SessionLocal())
+    try:
+        yield harness
+    finally:
+        db = harness.db
+        db.rollback()
+        user_ids = list(harness.user_ids)
+        for model in (models.ScheduledPush, models.Notification, models.UserUnreadCount,
+                      models.UserNotificationPreferences, models.DeviceToken):
+            db.query(model).filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+        crud.invalidate_delivery_profiles(*user_ids)
+        db.close()
+        fcm_service.set_transport(fcm_service.FirebaseTransport())
+
+
 class TestNotificationService:
     """Test suite for Notification Service"""
     
@@ -62,6 +112,258 @@ class TestNotificationService:
         response = client.get("/preferences", headers=headers)
         assert response.status_code in [200, 401]
 
+    
+    def test_broadcast_requires_admin(self):
+        """Test broadcast and job progress are admin only"""
+        headers = {"Authorization": "Bearer mock_token"}
+        broadcast = {"title": "Hello", "body": "Everyone", "type": "GENERAL"}
+        response = client.post("/broadcast", json=broadcast, headers=headers)
+        assert response.status_code in [200, 401, 403]
+
+        response = client.get("/broadcast/unknown-job", headers=headers)
+        assert response.status_code in [401, 403, 404]
+    
+    def test_broadcast_job_resumes_after_cursor(self, monkeypatch):
+        """Test an interrupted broadcast resumes after its last recipient, in one worker only"""
+        cursors = []
+
+        async def recipient_ids(role=None, page_size=1000, after_id=0, **filters):
+            cursors.append(after_id)
+            yield [990021, 990022]
+
+        monkeypatch.setattr(auth_client, "iter_recipient_ids", recipient_ids)
+        broadcast = schemas.BroadcastNotificationCreate(title="Resume", body="Body", type="GENERAL")
+        db = SessionLocal()
+        try:
+            job = crud.create_broadcast_job(db, "test-resume-job", broadcast, None)
+            job.status, job.total, job.processed, job.last_user_id = "running", 3, 1, 990020
+            db.commit()
+
+            with engine.connect() as other_worker:
+                assert crud.try_lock_broadcast_job(other_worker, job.id)
+                main.run_broadcast_job(job.id)
+                assert cursors == []
+                crud.unlock_broadcast_job(other_worker, job.id)
+
+            main.run_broadcast_job(job.id)
+            assert cursors == [990020]
+            db.refresh(job)
+            assert (job.status, job.total, job.processed, job.last_user_id) == ("completed", 3, 3, 990022)
+        finally:
+            db.query(models.Notification).filter(models.Notification.user_id.in_([990021, 990022])).delete()
+            db.query(models.UserUnreadCount).filter(models.UserUnreadCount.user_id.in_([990021, 990022])).delete()
+            db.query(models.BroadcastJob).filter(models.BroadcastJob.id == "test-resume-job").delete()
+            db.commit()
+            db.close()
+
+    def test_multicast_prunes_dead_tokens(self, push):
+        """Test pushes go out as one multicast and unregistered tokens are deactivated"""
+        push.transport.dead_tokens.add("test_dead_token")
+        push.register(990001, "test_live_token", "android")
+        push.register(990002, "test_dead_token", "ios")
+        result = fcm_service.send_push_to_users(push.db, [990001, 990002], "Hello", "World")
+        assert len(push.transport.sent) == 1
+        assert result["success_count"] == 1
+        assert result["deactivated"] == 1
+        assert crud.get_user_device_tokens(push.db, 990002) == []
+
+    def test_quiet_hours_push_is_deferred(self, push):
+        """Test pushes in quiet hours are held and released by the scheduler afterwards"""
+        hour = datetime.utcnow().hour
+        db = push.db
+        push.register(990003, "test_quiet_token")
+        crud.update_notification_preferences(db, 990003, {
+            "quiet_hours_enabled": True,
+            "quiet_hours_start": hour,
+            "quiet_hours_end": (hour + 1) % 24,
+        })
+        result = fcm_service.send_push_notification(db, 990003, "Later", "Quiet")
+        assert result["deferred"] == "quiet_hours"
+        assert push.transport.sent == []
+
+        crud.update_notification_preferences(db, 990003, {"quiet_hours_enabled": False})
+        db.query(models.ScheduledPush).filter(models.ScheduledPush.user_id == 990003).update(
+            {"deliver_after": datetime.utcnow() - timedelta(minutes=1)}
+        )
+        db.commit()
+        result = fcm_service.release_scheduled_pushes(db, 1000)
+        assert result["released"] >= 1
+        assert any(sent["tokens"] == ["test_quiet_token"] for sent in push.transport.sent)
+
+    def test_activity_pushes_are_coalesced(self, push):
+        """Test a report and its points within the window become one inbox row and one push"""
+        texts = {lang: ("Report Received", "Thanks") for lang in ["ar", "en", "ku"]}
+        summary = {lang: "Report #7 received" for lang in ["ar", "en", "ku"]}
+        db = push.db
+        push.register(990004, "test_coalesce_token")
+        first = coalescing.notify(
+            db, 990004, "REPORT_UPDATE", "REPORT_CREATED", texts, summary=summary, related_report_id=7
+        )
+        second = coalescing.notify(db, 990004, "POINTS_AWARDED", "POINTS_AWARDED", texts, points=10)
+        third = coalescing.notify(db, 990004, "POINTS_AWARDED", "POINTS_AWARDED", texts, points=5)
+        assert first == second == third
+        assert push.transport.sent == []
+
+        pushes = db.query(models.ScheduledPush).filter(models.ScheduledPush.user_id == 990004).all()
+        assert len(pushes) == 1
+        pushes[0].deliver_after = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        fcm_service.release_scheduled_pushes(db, 1000)
+        sent = [s for s in push.transport.sent if s["tokens"] == ["test_coalesce_token"]]
+        assert len(sent) == 1
+        assert sent[0]["data"]["body_en"] == "Report #7 received, +15 points"
+
+    def test_concurrent_coalescing_merges_into_one_push(self, push):
+        """Test events for one user handled by concurrent workers land in a single pending push"""
+        texts = {lang: ("Points", "Earned") for lang in ["ar", "en", "ku"]}
+        push.register(990008, "test_concurrent_token")
+        barrier = threading.Barrier(4)
+
+        def award(points):
+            worker_db = SessionLocal()
+            try:
+                barrier.wait()
+                coalescing.notify(worker_db, 990008, "POINTS_AWARDED", "POINTS_AWARDED", texts, points=points)
+            finally:
+                worker_db.close()
+
+        workers = [threading.Thread(target=award, args=(p,)) for p in (1, 2, 3, 4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        pushes = push.db.query(models.ScheduledPush).filter(models.ScheduledPush.user_id == 990008).all()
+        assert len(pushes) == 1
+        assert json.loads(pushes[0].data)["body_en"] == "+10 points"
+
+    def test_emails_are_queued_through_pool(self):
+        """Test emails go out through the pooled queue with escaped, cached templates"""
+        email_service.set_smtp_factory(email_service.LocalSMTP)
+        email_service.LocalSMTP.outbox.clear()
+        email_service.LocalSMTP.rejected.add("bounce@example.com")
+        try:
+            assert email_service.send_verification_code_email("user@example.com", "<Sam>", "123456", "en")
+            assert email_service.send_password_reset_email("bounce@example.com", "Sam", "token", "en")
+            assert email_service.wait_until_sent(timeout=10)
+            assert [mail["to"] for mail in email_service.LocalSMTP.outbox] == ["user@example.com"]
+            assert email_service.stats()["failed"] >= 1
+            assert email_service._verification_code_template.cache_info().hits >= 1
+        finally:
+            email_service.LocalSMTP.rejected.clear()
+            email_service.set_smtp_factory(smtplib.SMTP)
+
+    def test_unread_counter_and_keyset_inbox(self):
+        """Test the materialized unread counter follows create / read / mark-all and keyset paging"""
+        db = SessionLocal()
+        try:
+            first = crud.create_notification(db, 990005, "One", "Body", "GENERAL")
+            second = crud.create_notification(db, 990005, "Two", "Body", "GENERAL")
+            assert crud.get_unread_count(db, 990005) == 2
+
+            crud.mark_notification_read(db, first.id, 990005)
+            crud.mark_notification_read(db, first.id, 990005)
+            assert crud.get_unread_count(db, 990005) == 1
+
+            crud.bulk_create_notifications(db, [990005], "Three", "Body", "GENERAL")
+            assert crud.mark_all_notifications_read(db, 990005) == 2
+            assert crud.get_unread_count(db, 990005) == 0
+
+            page = crud.get_user_notifications(db, 990005, limit=2)
+            assert len(page) == 2
+            rest = crud.get_user_notifications(db, 990005, before=page[-1].created_at, before_id=page[-1].id)
+            assert {n.id for n in page} | {n.id for n in rest} >= {first.id, second.id}
+            assert not {n.id for n in page} & {n.id for n in rest}
+        finally:
+            db.query(models.Notification).filter(models.Notification.user_id == 990005).delete()
+            db.query(models.UserUnreadCount).filter(models.UserUnreadCount.user_id == 990005).delete()
+            db.commit()
+            db.close()
+
+    def test_stream_requires_auth(self):
+        """Test the SSE inbox stream is authenticated"""
+        headers = {"Authorization": "Bearer mock_token"}
+        response = client.get("/stream", headers=headers)
+        assert response.status_code == 401
+
+    def test_stream_replays_after_last_id(self):
+        """Test the stream resumes after the last event id and reports the unread count"""
+        from main import _load_stream_changes
+
+        class Disconnected:
+            async def is_disconnected(self):
+                return True
+
+        async def collect(last_id):
+            return [chunk async for chunk in inbox_stream.event_stream(
+                Disconnected(), 990006, last_id, _load_stream_changes
+            )]
+
+        db = SessionLocal()
+        try:
+            notification = crud.create_notification(db, 990006, "Live", "Body", "GENERAL")
+            chunks = asyncio.run(collect(notification.id - 1))
+            assert any(c.startswith(f"id: {notification.id}\nevent: notification") for c in chunks)
+            assert any('"unread_count": 1' in c for c in chunks)
+            assert inbox_stream.hub.connected() == 0
+
+            # A rewritten row is re-sent without moving the event id back
+            _, resent, last_id, _, sent_ids = _load_stream_changes(
+                990006, notification.id, [notification.id], {notification.id}
+            )
+            assert [n["id"] for n in resent] == [notification.id]
+            assert last_id == notification.id
+
+            # A lower id committed after a higher one was streamed is still delivered, once
+            late_db = SessionLocal()
+            late = models.Notification(user_id=990006, title="Late", body="Body", type="GENERAL")
+            late_db.add(late)
+            late_db.flush()
+            live = crud.create_notification(db, 990006, "Newer", "Body", "GENERAL")
+            assert late.id < live.id
+            notifications, resent, last_id, _, sent_ids = _load_stream_changes(990006, last_id, [], sent_ids)
+            assert [n["id"] for n in notifications] == [live.id] and resent == []
+            late_db.commit()
+            late_id = late.id
+            late_db.close()
+            notifications, resent, last_id, _, sent_ids = _load_stream_changes(990006, last_id, [], sent_ids)
+            assert notifications == [] and [n["id"] for n in resent] == [late_id]
+            assert last_id == live.id
+            _, resent, _, _, _ = _load_stream_changes(990006, last_id, [], sent_ids)
+            assert resent == []
+        finally:
+            db.query(models.Notification).filter(models.Notification.user_id == 990006).delete()
+            db.query(models.UserUnreadCount).filter(models.UserUnreadCount.user_id == 990006).delete()
+            db.commit()
+            db.close()
+
+    def test_retention_archives_read_notifications(self):
+        """Test old read notifications move to the compact archive and stay exportable"""
+        db = SessionLocal()
+        try:
+            old_id = crud.create_notification(db, 990007, "Old", "Body", "GENERAL").id
+            unread_id = crud.create_notification(db, 990007, "Unread", "Body", "GENERAL").id
+            crud.mark_notification_read(db, old_id, 990007)
+            cutoff = datetime.utcnow() + timedelta(seconds=1)
+            while crud.retire_read_notifications(db, cutoff, batch_size=500, user_id=990007):
+                pass
+            remaining = crud.get_user_notifications(db, 990007)
+            assert [n.id for n in remaining] == [unread_id]
+            archived = crud.get_archived_notifications(db, 990007)
+            assert [(n["id"], n["title"]) for n in archived] == [(old_id, "Old")]
+
+            headers = {"X-Internal-Key": "test-internal-key"}
+            response = client.get("/internal/user-data/990007/export", headers=headers)
+            assert response.status_code in [200, 403]
+            if response.status_code == 200:
+                assert {n["id"] for n in response.json()["notifications"]} == {old_id, unread_id}
+        finally:
+            db.query(models.Notification).filter(models.Notification.user_id == 990007).delete()
+            db.query(models.NotificationArchive).filter(models.NotificationArchive.user_id == 990007).delete()
+            db.query(models.UserUnreadCount).filter(models.UserUnreadCount.user_id == 990007).delete()
+            db.commit()
+            db.close()
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
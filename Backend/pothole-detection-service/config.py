@@ -35,6 +35,15 @@ class Settings(BaseSettings):
     MODEL_PATH: str = os.getenv("MODEL_PATH", "/app/models/pothole_model.pt")
     CONFIDENCE_THRESHOLD: float = float(os.getenv("CONFIDENCE_THRESHOLD", "0.5"))
     
+    # Image run through the detectors once at startup before /ready turns green
+    WARMUP_IMAGE_PATH: str = os.getenv(
+        "WARMUP_IMAGE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "warmup.png")
+    )
+    # A failed warm-up is retried, doubling the wait up to the maximum
+    WARMUP_RETRY_INITIAL_SECONDS: float = float(os.getenv("WARMUP_RETRY_INITIAL_SECONDS", "5"))
+    WARMUP_RETRY_MAX_SECONDS: float = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+    
     # Admin user for auto-reports
     ADMIN_USER_ID: int = int(os.getenv("ADMIN_USER_ID", "1"))
     
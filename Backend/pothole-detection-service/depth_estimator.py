@@ -63,6 +63,26 @@ class DepthEstimator:
             "Authorization": f"Token {self.api_token}",
             "Content-Type": "application/json"
         }
+        # Keep-alive connections to Replicate, reused across predictions
+        self.session = requests.Session()
+        # model name -> "name:version", resolved once instead of per prediction
+        self._model_versions: Dict[str, str] = {}
+    
+    def resolve_model_version(self, model_id: str) -> str:
+        """Pin "owner/model" to its latest version (looked up once)"""
+        if ":" in model_id:
+            return model_id
+        if model_id not in self._model_versions:
+            model_url = f"https://api.replicate.com/v1/models/{model_id}"
+            model_response = self.session.get(model_url, headers=self.headers, timeout=10)
+            if model_response.status_code != 200:
+                return model_id
+            latest_version = model_response.json().get("latest_version", {}).get("id")
+            if not latest_version:
+                return model_id
+            self._model_versions[model_id] = f"{model_id}:{latest_version}"
+            print(f"   Using latest version: {self._model_versions[model_id][:50]}...")
+        return self._model_versions[model_id]
     
     def _image_to_base64(self, image_path: str) -> str:
         """Convert image file to base64 data URI"""
@@ -90,17 +110,7 @@ class DepthEstimator:
             # 2. Model name only: "owner/model" (uses latest version)
             
             # First, get the latest version if not specified
-            if ":" not in model_id:
-                # Get model info to find latest version
-                model_url = f"https://api.replicate.com/v1/models/{model_id}"
-                model_response = requests.get(model_url, headers=self.headers, timeout=10)
-                
-                if model_response.status_code == 200:
-                    model_info = model_response.json()
-                    latest_version = model_info.get("latest_version", {}).get("id")
-                    if latest_version:
-                        model_id = f"{model_id}:{latest_version}"
-                        print(f"   Using latest version: {model_id[:50]}...")
+            model_id = self.resolve_model_version(model_id)
             
             # Create prediction
             payload = {
@@ -110,7 +120,7 @@ class DepthEstimator:
                 }
             }
             
-            response = requests.post(
+            response = self.session.post(
                 REPLICATE_API_URL,
                 headers=self.headers,
                 json=payload,
@@ -128,7 +138,7 @@ class DepthEstimator:
             # Poll for result
             start_time = time.time()
             while time.time() - start_time < timeout:
-                poll_response = requests.get(get_url, headers=self.headers, timeout=10)
+                poll_response = self.session.get(get_url, headers=self.headers, timeout=10)
                 result = poll_response.json()
                 
                 status = result.get("status")
@@ -152,7 +162,7 @@ class DepthEstimator:
     def _download_depth_map(self, url: str) -> Optional[np.ndarray]:
         """Download depth map image from URL and convert to numpy array"""
         try:
-            response = requests.get(url, timeout=30)
+            response = self.session.get(url, timeout=30)
             if response.status_code != 200:
                 return None
             
@@ -375,6 +385,7 @@ class HuggingFaceDepthEstimator:
     def __init__(self, api_token: Optional[str] = None):
         self.api_token = api_token or os.getenv("HUGGINGFACE_API_TOKEN", "")
         self.headers = {"Authorization": f"Bearer {self.api_token}"}
+        self.session = requests.Session()
         
         # Model endpoints
         self.midas_url = "https://api-inference.huggingface.co/models/Intel/dpt-large"
@@ -387,7 +398,7 @@ class HuggingFaceDepthEstimator:
                 image_data = f.read()
             
             # Try DepthAnything first (newer, more accurate)
-            response = requests.post(
+            response = self.session.post(
                 self.depth_anything_url,
                 headers=self.headers,
                 data=image_data,
@@ -410,7 +421,7 @@ class HuggingFaceDepthEstimator:
                     )
             
             # Fallback to MiDaS
-            response = requests.post(
+            response = self.session.post(
                 self.midas_url,
                 headers=self.headers,
                 data=image_data,
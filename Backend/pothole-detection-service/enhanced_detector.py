@@ -81,7 +81,8 @@ class EnhancedPotholeDetector:
         depth_model: DepthModel = DepthModel.MIDAS,  # Use MiDaS only for reliability
         enable_depth_estimation: bool = True,
         enable_reference_detection: bool = True,
-        camera_height_m: float = 1.5
+        camera_height_m: float = 1.5,
+        roboflow_detector: Optional[RoboflowPotholeDetector] = None
     ):
         """
         Initialize the enhanced detector.
@@ -93,8 +94,9 @@ class EnhancedPotholeDetector:
             enable_depth_estimation: Whether to run depth estimation
             enable_reference_detection: Whether to detect reference objects
             camera_height_m: Assumed camera height for scale estimation
+            roboflow_detector: Existing base detector to share (created if not given)
         """
-        self.roboflow_detector = RoboflowPotholeDetector(api_key=roboflow_api_key)
+        self.roboflow_detector = roboflow_detector or RoboflowPotholeDetector(api_key=roboflow_api_key)
         self.depth_model = depth_model
         self.enable_depth = enable_depth_estimation
         self.enable_reference = enable_reference_detection
@@ -110,13 +112,21 @@ class EnhancedPotholeDetector:
         
         # Initialize dimension calculator
         self.dimension_calculator = DimensionCalculator(camera_height_m=camera_height_m)
+        
+        # Stricter filter used once depth data is available
+        self.depth_filter = DetectionFilter(
+            min_confidence=0.35,
+            min_overall_score=0.70
+        )
     
     def detect(
         self,
         image_path: str,
         save_annotated: bool = True,
         save_depth_map: bool = False,
-        output_dir: Optional[str] = None
+        output_dir: Optional[str] = None,
+        depth_model: Optional[DepthModel] = None,
+        enable_reference: Optional[bool] = None
     ) -> EnhancedDetectionResult:
         """
         Detect potholes with enhanced dimension estimation.
@@ -126,10 +136,16 @@ class EnhancedPotholeDetector:
             save_annotated: Whether to save annotated image
             save_depth_map: Whether to save the depth map visualization
             output_dir: Output directory for generated files
+            depth_model: Depth model(s) for this call (defaults to self.depth_model)
+            enable_reference: Reference detection for this call (defaults to self.enable_reference)
         
         Returns:
             EnhancedDetectionResult with detections and dimensions
         """
+        # Per-call options leave the shared detector untouched
+        depth_model = depth_model or self.depth_model
+        enable_reference = self.enable_reference if enable_reference is None else enable_reference
+        
         # Step 1: Run YOLO detection
         print(f"🔍 Running pothole detection on {os.path.basename(image_path)}")
         base_result = self.roboflow_detector.detect(
@@ -147,9 +163,9 @@ class EnhancedPotholeDetector:
         # Step 2: Run depth estimation (if enabled and available)
         depth_result = None
         if self.enable_depth and self.depth_estimator:
-            print(f"🔬 Running depth estimation ({self.depth_model.value})...")
+            print(f"🔬 Running depth estimation ({depth_model.value})...")
             try:
-                depth_result = self.depth_estimator.estimate(image_path, self.depth_model)
+                depth_result = self.depth_estimator.estimate(image_path, depth_model)
                 if depth_result.success:
                     print(f"✅ Depth estimation succeeded: {depth_result.model_used}")
                     if depth_result.confidence_score > 0:
@@ -162,11 +178,7 @@ class EnhancedPotholeDetector:
                     image = cv2.imread(image_path)
                     if image is not None and depth_result.depth_map is not None:
                         print("🧠 Running depth-based validation on detections...")
-                        depth_filter = DetectionFilter(
-                            min_confidence=0.35,
-                            min_overall_score=0.70  # Stricter with depth data available
-                        )
-                        valid, rejected = depth_filter.filter_detections(
+                        valid, rejected = self.depth_filter.filter_detections(
                             image, base_result.detections, depth_result.depth_map
                         )
                         if rejected:
@@ -194,7 +206,7 @@ class EnhancedPotholeDetector:
                 raise ValueError(f"Could not read image: {image_path}")
             
             # Step 3a: Detect reference object and filter overlapping detections
-            if self.enable_reference and base_result.detections:
+            if enable_reference and base_result.detections:
                 reference = None
                 for ref_type in ["credit_card", "smartphone", "ruler_10cm"]:
                     reference = self.dimension_calculator.detect_reference_object(image, ref_type)
@@ -269,7 +281,7 @@ class EnhancedPotholeDetector:
                     image=image,
                     depth_result=depth_result,
                     pothole_bboxes=bboxes,
-                    try_reference_detection=self.enable_reference
+                    try_reference_detection=enable_reference
                 )
                 
                 print("📏 Calculated dimensions:")
@@ -387,7 +399,8 @@ class EnhancedPotholeDetector:
 def create_enhanced_detector(
     roboflow_key: Optional[str] = None,
     replicate_token: Optional[str] = None,
-    use_both_models: bool = True
+    use_both_models: bool = True,
+    roboflow_detector: Optional[RoboflowPotholeDetector] = None
 ) -> EnhancedPotholeDetector:
     """
     Factory function to create an enhanced detector with environment defaults.
@@ -396,6 +409,7 @@ def create_enhanced_detector(
         roboflow_key: Roboflow API key (uses env ROBOFLOW_API_KEY if not provided)
         replicate_token: Replicate API token (uses env REPLICATE_API_TOKEN if not provided)
         use_both_models: Whether to use both depth models for comparison
+        roboflow_detector: Existing base detector to share
     
     Returns:
         Configured EnhancedPotholeDetector
@@ -411,5 +425,6 @@ def create_enhanced_detector(
         replicate_api_token=replicate_token,
         depth_model=depth_model,
         enable_depth_estimation=bool(replicate_token),
-        enable_reference_detection=True
+        enable_reference_detection=True,
+        roboflow_detector=roboflow_detector
     )
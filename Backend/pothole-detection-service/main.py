@@ -5,6 +5,8 @@ Uses Roboflow's pretrained model for better accuracy
 """
 import json
 import os
+import threading
+import time
 from datetime import datetime
 from typing import List, Optional
 
@@ -14,6 +16,8 @@ from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
 
 from config import settings
+from depth_estimator import MIDAS_MODEL, DepthModel
+from enhanced_detector import EnhancedPotholeDetector, create_enhanced_detector
 from roboflow_detector import RoboflowPotholeDetector
 from heic_processor import extract_metadata, process_heic_image
 from processor import ImageProcessor, process_images_from_cli
@@ -38,6 +42,14 @@ app.add_middleware(
 # Global processor instance
 processor: Optional[ImageProcessor] = None
 
+# Long-lived detectors, created once on startup and shared by all requests
+detector: Optional[RoboflowPotholeDetector] = None
+enhanced_detector: Optional[EnhancedPotholeDetector] = None
+
+# Set once the startup warm-up inference has succeeded; `error` holds the
+# last failure while it is being retried
+warmup_state = {"done": False, "duration_ms": None, "error": None, "attempts": 0}
+
 
 class DetectionResponse(BaseModel):
     """Response model for detection results"""
@@ -70,10 +82,36 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 
+def warm_up_detectors():
+    """Run the bundled fixture image through the detectors, retrying with backoff until it succeeds"""
+    delay = settings.WARMUP_RETRY_INITIAL_SECONDS
+    while True:
+        warmup_state["attempts"] += 1
+        start_time = time.time()
+        try:
+            # Opens the inference connection and exercises the local analysis paths
+            detector.detect(settings.WARMUP_IMAGE_PATH, save_annotated=False)
+            if enhanced_detector is not None and enhanced_detector.depth_estimator is not None:
+                # Resolve the depth model version and open the Replicate connection;
+                # a full depth prediction is too slow and costly for every startup
+                enhanced_detector.depth_estimator.resolve_model_version(MIDAS_MODEL)
+        except Exception as e:
+            warmup_state["error"] = str(e)
+            print(f"⚠️ Detector warm-up failed (attempt {warmup_state['attempts']}), retrying in {delay:.0f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+            continue
+        warmup_state["duration_ms"] = (time.time() - start_time) * 1000
+        warmup_state["error"] = None
+        warmup_state["done"] = True
+        print(f"✅ Detectors warmed up in {warmup_state['duration_ms']:.0f}ms")
+        return
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize components on startup"""
-    global processor
+    global processor, detector, enhanced_detector
     
     print("🚀 Starting Pothole Detection Service...")
     
@@ -82,8 +120,22 @@ async def startup_event():
     os.makedirs(settings.PROCESSED_DIR, exist_ok=True)
     os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
     
+    detector = RoboflowPotholeDetector()
+    
+    # Enhanced detector shares the base detector (and its HTTP session)
+    replicate_token = os.getenv("REPLICATE_API_TOKEN")
+    if replicate_token:
+        enhanced_detector = create_enhanced_detector(
+            replicate_token=replicate_token,
+            use_both_models=False,
+            roboflow_detector=detector
+        )
+    
     # Initialize processor (will lazy-load model)
-    processor = ImageProcessor()
+    processor = ImageProcessor(detector=detector)
+    
+    # Warm up in the background; /ready reports when it is done
+    threading.Thread(target=warm_up_detectors, daemon=True).start()
     
     print("✅ Service ready")
 
@@ -107,6 +159,22 @@ async def health():
     return await health_check()
 
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the startup warm-up inference has succeeded"""
+    ready = warmup_state["done"] and not warmup_state["error"]
+    body = {
+        "ready": ready,
+        "warmup_ms": warmup_state["duration_ms"],
+        "warmup_error": warmup_state["error"],
+        "warmup_attempts": warmup_state["attempts"],
+        "enhanced_available": enhanced_detector is not None,
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
 @app.post("/detect", response_model=DetectionResponse)
 async def detect_from_upload(
     file: UploadFile = File(...),
@@ -311,9 +379,7 @@ async def analyze_image_only(
     Returns AI-generated description and annotated image for the existing report.
     Used by reporting-service when user uploads a photo.
     """
-    global processor
-    
-    if not processor:
+    if not detector:
         raise HTTPException(status_code=503, detail="Service not initialized")
     
     # Check file extension
@@ -339,9 +405,6 @@ async def analyze_image_only(
             content = await file.read()
             f.write(content)
         
-        # Use RoboflowPotholeDetector directly
-        detector = RoboflowPotholeDetector()
-        
         # Convert HEIC if needed
         if ext in {'.heic', '.heif'}:
             from heic_processor import process_heic_image
@@ -505,23 +568,15 @@ async def analyze_with_depth(
         else:
             detect_path = temp_path
         
-        # Try to use enhanced detector
-        replicate_token = os.getenv("REPLICATE_API_TOKEN")
-        
-        if replicate_token:
-            from enhanced_detector import create_enhanced_detector, DepthModel
-            
-            detector = create_enhanced_detector(
-                replicate_token=replicate_token,
-                use_both_models=use_both_depth_models
-            )
-            detector.enable_reference = detect_reference_object
-            
-            result = detector.detect(
+        # Enhanced detector exists only when REPLICATE_API_TOKEN is set
+        if enhanced_detector is not None:
+            result = enhanced_detector.detect(
                 detect_path,
                 save_annotated=True,
                 save_depth_map=True,
-                output_dir=settings.OUTPUT_DIR
+                output_dir=settings.OUTPUT_DIR,
+                depth_model=DepthModel.BOTH if use_both_depth_models else DepthModel.MIDAS,
+                enable_reference=detect_reference_object
             )
             
             # Read and encode annotated image
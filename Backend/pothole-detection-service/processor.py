@@ -76,8 +76,8 @@ class ImageProcessor:
     
     SUPPORTED_EXTENSIONS = {'.heic', '.heif', '.jpg', '.jpeg', '.png'}
     
-    def __init__(self):
-        self.detector = RoboflowPotholeDetector()
+    def __init__(self, detector: Optional[RoboflowPotholeDetector] = None):
+        self.detector = detector or RoboflowPotholeDetector()
         self.report_generator = ReportGenerator()
         
         # Ensure directories exist
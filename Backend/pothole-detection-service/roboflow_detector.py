@@ -205,6 +205,8 @@ class RoboflowPotholeDetector:
         self.model_id = ROBOFLOW_MODEL_ID
         self.api_url = ROBOFLOW_API_URL
         self.use_roboflow = bool(self.api_key)
+        # Keep-alive connection to the inference API, reused across detections
+        self.session = requests.Session()
         
         if self.use_roboflow:
             print(f"✅ Roboflow API configured - using model: {self.model_id}")
@@ -326,7 +328,7 @@ class RoboflowPotholeDetector:
             import time as api_time
             api_time.sleep(0.5)  # Small delay to avoid rate limiting
             
-            response = requests.post(
+            response = self.session.post(
                 inference_url,
                 params={
                     "api_key": self.api_key,
@@ -4,6 +4,7 @@ from typing import List, Optional, Tuple
 
 import models
 import schemas
+from export_stream import EXPORT_BATCH_SIZE
 from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 
@@ -290,8 +291,41 @@ def get_reports(
     Set include_pending=True to include pending reports.
     Set include_deleted=True to include soft-deleted reports.
     """
-    query = db.query(models.Report)
-    
+    query = _filter_reports(
+        db.query(models.Report), status, category, latitude, longitude,
+        radius_km, include_pending, include_deleted
+    )
+    return query.order_by(models.Report.created_at.desc()).offset(skip).limit(limit).all()
+
+
+def iter_reports(
+    db: Session,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    include_pending: bool = False,
+    include_deleted: bool = False
+):
+    """Stream filtered reports, newest first, through a server-side cursor"""
+    query = _filter_reports(
+        db.query(models.Report), status, category, None, None, None,
+        include_pending, include_deleted
+    )
+    return query.order_by(
+        models.Report.created_at.desc(), models.Report.id.desc()
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _filter_reports(
+    query,
+    status: Optional[str],
+    category: Optional[str],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    radius_km: Optional[float],
+    include_pending: bool,
+    include_deleted: bool
+):
+    """Apply the shared report-listing filters to a Report query"""
     # Filter out deleted reports by default
     if not include_deleted:
         query = query.filter(models.Report.deleted_at == None)
@@ -320,7 +354,7 @@ def get_reports(
             )
         )
     
-    return query.order_by(models.Report.created_at.desc()).offset(skip).limit(limit).all()
+    return query
 
 
 def get_user_reports(db: Session, user_id: int, skip: int = 0, limit: int = 100):
@@ -13,13 +13,16 @@ import mahlula_client
 import models
 import notification_client
 import schemas
-from database import engine, get_db
+from consumer_metrics import get_queue_stats, metrics
+from database import SessionLocal, engine, get_db
+from export_stream import stream_export
 from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, Header, HTTPException, Query, UploadFile, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from json_logger import setup_logging
 from logging_middleware import RequestLoggingMiddleware
-from rabbitmq_consumer import start_consumer
+from rabbitmq_consumer import QUEUE_NAME, start_consumer
 from rabbitmq_publisher import publish_event
 from sqlalchemy import text
 from sqlalchemy.orm import Session
@@ -477,9 +480,10 @@ async def _forward_to_mahlula(report):
 @app.post("/", response_model=schemas.Report)
 async def create_report(
     report: schemas.ReportCreate,
-    user_id: int = Depends(get_current_user_id),
+    user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    user_id = user["id"]
     # Create report - may also confirm a matching pending report
     db_report, confirmed_report = crud.create_report(db=db, report=report, user_id=user_id)
     
@@ -493,6 +497,8 @@ async def create_report(
                 "longitude": float(db_report.longitude)
             },
             "category_id": db_report.category_id,
+            "city": user.get("city"),  # Reporter's profile city, for per-city leaderboards
+            "reported_at": db_report.created_at.isoformat() if db_report.created_at else None,
             "confirmation_status": db_report.confirmation_status,
             "award_points": True  # Award points for creating a report
         })
@@ -1373,48 +1379,81 @@ async def bulk_delete_reports(
     )
 
 
+REPORT_EXPORT_HEADER = [
+    "ID", "Title", "Description", "Category ID", "Status ID",
+    "Latitude", "Longitude", "Address", "Severity ID",
+    "Confirmation Status", "Created At", "Updated At"
+]
+
+
+def _report_export_row(r: models.Report) -> list:
+    return [
+        r.id, r.title, r.description, r.category_id, r.status_id,
+        float(r.latitude) if r.latitude else "", float(r.longitude) if r.longitude else "",
+        r.address_text or "", r.severity_id,
+        r.confirmation_status, r.created_at, r.updated_at
+    ]
+
+
+def _report_export_item(r: models.Report) -> dict:
+    return {
+        "id": r.id, "title": r.title, "description": r.description,
+        "category_id": r.category_id, "status_id": r.status_id,
+        "latitude": float(r.latitude) if r.latitude is not None else None,
+        "longitude": float(r.longitude) if r.longitude is not None else None,
+        "address": r.address_text, "severity_id": r.severity_id,
+        "confirmation_status": r.confirmation_status,
+        "created_at": r.created_at, "updated_at": r.updated_at
+    }
+
+
 @app.get("/export/csv")
 async def export_reports_csv(
     status_filter: Optional[str] = None,
     category: Optional[str] = None,
-    user_id: int = Depends(get_current_user_id),
-    db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user_id)
 ):
-    """Export reports as CSV"""
-    import csv
-    import io
-    from fastapi.responses import StreamingResponse
-    
-    reports = crud.get_reports(
-        db=db, skip=0, limit=10000,
-        status=status_filter, category=category,
-        include_pending=True
+    """Export reports as CSV, streamed row by row"""
+    body = stream_export(
+        SessionLocal,
+        lambda db: crud.iter_reports(
+            db=db, status=status_filter, category=category, include_pending=True
+        ),
+        "csv",
+        REPORT_EXPORT_HEADER,
+        _report_export_row,
     )
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "ID", "Title", "Description", "Category ID", "Status ID",
-        "Latitude", "Longitude", "Address", "Severity ID",
-        "Confirmation Status", "Created At", "Updated At"
-    ])
-    
-    for r in reports:
-        writer.writerow([
-            r.id, r.title, r.description, r.category_id, r.status_id,
-            float(r.latitude) if r.latitude else "", float(r.longitude) if r.longitude else "",
-            r.address_text or "", r.severity_id,
-            r.confirmation_status, r.created_at, r.updated_at
-        ])
-    
-    output.seek(0)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        body,
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=reports_export.csv"}
     )
 
 
+@app.get("/export/ndjson")
+async def export_reports_ndjson(
+    status_filter: Optional[str] = None,
+    category: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """Export reports as newline-delimited JSON, streamed row by row"""
+    body = stream_export(
+        SessionLocal,
+        lambda db: crud.iter_reports(
+            db=db, status=status_filter, category=category, include_pending=True
+        ),
+        "ndjson",
+        REPORT_EXPORT_HEADER,
+        _report_export_row,
+        _report_export_item,
+    )
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=reports_export.ndjson"}
+    )
+
+
 # ============================================================
 # DSGVO / GDPR — Internal Endpoints (service-to-service only)
 # ============================================================
@@ -1425,6 +1464,16 @@ def verify_internal_key(x_internal_key: str = Header(None)):
         raise HTTPException(status_code=403, detail="Invalid internal API key")
 
 
+@app.get("/internal/metrics")
+def get_consumer_metrics(_: None = Depends(verify_internal_key)):
+    """RabbitMQ consumer metrics of this worker plus the broker-side queue depth"""
+    return {
+        "service": "reporting",
+        "queue": get_queue_stats(QUEUE_NAME),
+        "consumer": metrics.snapshot(),
+    }
+
+
 @app.delete("/internal/user-data/{user_id}")
 def delete_user_data(
     user_id: int,
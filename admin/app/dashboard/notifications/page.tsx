@@ -65,7 +65,7 @@ export default function NotificationsPage() {
         target_role: targetRole === 'ALL' ? null : targetRole,
       });
 
-      const successMsg = language === 'ar' ? `تم الإرسال إلى ${response.sent_count} مستخدم من أصل ${response.total_users}` : language === 'ku' ? `Hat şandin ${response.sent_count} ji ${response.total_users}  bikarhêneran re` : `Sent to ${response.sent_count} of ${response.total_users} users`;
+      const successMsg = language === 'ar' ? 'بدأ الإرسال الجماعي، سيتم التسليم في الخلفية' : language === 'ku' ? 'Şandina komî dest pê kir, di paşxaneyê de tê radestkirin' : `Broadcast started (job ${response.job_id}), delivering in the background`;
 
       setResult({ success: true, message: successMsg });
       setForm({ ...form, title: '', body: '' });